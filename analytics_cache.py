@@ -1,16 +1,294 @@
-from typing import Dict, Any
+import asyncio
+import glob
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+from time import time
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+
+import orjson
+
+
+def _encode_extra(value):
+    # Same conversion FastAPI's jsonable_encoder applies to Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def serialize_results(data: Dict[str, Any]) -> bytes:
+    # orjson handles datetime/date natively, in the same ISO format as FastAPI
+    return orjson.dumps(data, default=_encode_extra)
+
+
+def default_shared_cache_dir() -> str:
+    # tmpfs keeps the snapshot in shared memory on Linux; one directory per user
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"hotel-analytics-cache-{os.getuid()}")
+
+
+def check_private_dir(path: str):
+    """Refuse a directory other users can write to: snapshots are unpickled, so whoever writes them runs code."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(
+            f"{path} must be a directory owned by uid {os.getuid()} with mode 0700 "
+            f"to hold analytics snapshots (set ANALYTICS_CACHE_DIR to use another one)"
+        )
+
+
+class SharedFileBackend:
+    """Snapshot shared by every worker on the node through a memory-mapped file.
+
+    The file holds an 8-byte version stamp followed by the pickled results and
+    is replaced atomically on every write. There is one file per scope (the
+    database and metric definitions the results come from), so a snapshot
+    outlives neither. Readers only re-read it when the file changed, and an
+    flock on a side file makes refreshes single-flight across processes.
+    """
+    HEADER = struct.Struct("<q")
+
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.name = name
+        self.directory = directory or default_shared_cache_dir()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        check_private_dir(self.directory)
+        self.lock_path = os.path.join(self.directory, f"{name}.lock")
+        self._stat_key = None
+        self._version: Optional[int] = None
+
+    def path(self, scope: str = "") -> str:
+        digest = hashlib.sha256(scope.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{self.name}-{digest}.snapshot")
+
+    def peek_version(self, scope: str = "") -> Optional[int]:
+        path = self.path(scope)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat_key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat_key != self._stat_key:
+            with open(path, "rb") as f:
+                self._version = self.HEADER.unpack(f.read(self.HEADER.size))[0]
+            self._stat_key = stat_key
+        return self._version
+
+    def load(self, scope: str = "") -> Tuple[int, Dict[str, Any]]:
+        with open(self.path(scope), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if os.fstat(f.fileno()).st_uid != os.getuid():
+                raise PermissionError(f"{f.name} is not owned by uid {os.getuid()}, not unpickling it")
+            version = self.HEADER.unpack_from(m)[0]
+            return version, pickle.loads(m[self.HEADER.size:])
+
+    def store(self, version: int, data: Dict[str, Any], scope: str = ""):
+        current = self.peek_version(scope)
+        if current is not None and current >= version:
+            return  # another worker already published this or a newer snapshot
+        payload = self.HEADER.pack(version) + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        path = self.path(scope)
+        os.replace(tmp_path, path)
+        # Snapshots of other databases or definitions can't be served again
+        for old in glob.glob(os.path.join(self.directory, f"{glob.escape(self.name)}-*.snapshot")):
+            if old != path:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def lock(self, blocking: bool = True):
+        import fcntl
+
+        with open(self.lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
 
 class AnalyticsCache:
-    def __init__(self):
-        self.cache: Dict[str, Any] = {}
-        self.last_updated: float = 0.0
+    """Per-endpoint snapshot of analytics results, tagged with the data version.
+
+    Refreshes are single-flight: however many requests see the cache stale at
+    once, only one of them runs ``compute``. With ``stale_while_revalidate``
+    the previous snapshot is served immediately while a background thread
+    refreshes it, for at most ``max_staleness`` seconds after the data changed;
+    past that bound callers wait for the refresh. With a ``backend`` the
+    snapshot and the refresh lock are shared with the other worker processes.
+    ``scope`` names what the results are computed from (the database and the
+    metric definitions); a snapshot is only served for its own scope and data
+    version. ``on_lookup`` is told whether each lookup was a "hit", "stale"
+    or "miss".
+    """
+
+    def __init__(
+        self,
+        stale_while_revalidate: bool = False,
+        max_staleness: float = 30.0,
+        backend: Optional[SharedFileBackend] = None,
+        on_lookup: Optional[Callable[[str], None]] = None,
+        scope: Callable[[], str] = lambda: "",
+    ):
+        # (version, results, scope), always replaced as a whole so that readers
+        # never pair one snapshot's version with another one's results
+        self._snapshot: Tuple[Optional[int], Dict[str, Any], Optional[str]] = (None, {}, None)
+        self.scope = scope
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_staleness = max_staleness
+        self.stale_since: Optional[float] = None
+        self.backend = backend
+        self.on_lookup = on_lookup
+        self._refresh_lock = threading.Lock()
+        self._async_refresh_lock = asyncio.Lock()
+        self._rendered: Tuple[Optional[Dict[str, Any]], Dict[str, bytes]] = (None, {})  # (results, body per format)
 
-    def is_stale(self, db_last_updated: float) -> bool:
-        return db_last_updated > self.last_updated
+    @property
+    def version(self) -> Optional[int]:
+        return self._snapshot[0]
 
-    def update_cache(self, data: Dict[str, Any], db_last_updated: float):
-        self.cache = data
-        self.last_updated = db_last_updated
+    @property
+    def cache(self) -> Dict[str, Any]:
+        return self._snapshot[1]
+
+    def is_stale(self, db_version: int) -> bool:
+        scope = self.scope()
+        self._sync_from_backend(scope)
+        version, _, snapshot_scope = self._snapshot
+        return version is None or snapshot_scope != scope or db_version != version
+
+    def update_cache(self, data: Dict[str, Any], db_version: int):
+        scope = self.scope()
+        self._snapshot = (db_version, data, scope)
+        self.stale_since = None
+        if self.backend:
+            self.backend.store(db_version, data, scope)
 
     def get_cache(self) -> Dict[str, Any]:
         return self.cache
+
+    def get_serialized(
+        self, fmt: str = "json", serialize: Callable[[Dict[str, Any]], bytes] = serialize_results
+    ) -> Tuple[int, bytes]:
+        """The current snapshot rendered by ``serialize`` with its version, rendered once per snapshot and format."""
+        version, data, _ = self._snapshot
+        rendered_for, bodies = self._rendered
+        if rendered_for is not data:
+            bodies = {}
+            self._rendered = (data, bodies)
+        body = bodies.get(fmt)
+        if body is None:
+            body = bodies[fmt] = serialize(data)
+        return version, body
+
+    def get_or_refresh(self, db_version: int, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        if not self.is_stale(db_version):
+            self._count("hit")
+            return self.cache
+
+        if self._can_serve_stale():
+            self._count("stale")
+            self._refresh_in_background(db_version, compute)
+            return self.cache
+
+        self._count("miss")
+        return self._refresh(db_version, compute)
+
+    async def aget_or_refresh(
+        self, db_version: int, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Async counterpart of get_or_refresh for handlers running on the event loop.
+
+        Takes the same refresh locks as get_or_refresh. Those and the shared
+        file are only touched from worker threads; ``compute`` runs on the loop.
+        """
+        if not await self._ais_stale(db_version):
+            self._count("hit")
+            return self.cache
+
+        loop = asyncio.get_running_loop()
+
+        def compute_on_loop() -> Dict[str, Any]:
+            return asyncio.run_coroutine_threadsafe(compute(), loop).result()
+
+        if self._can_serve_stale():
+            self._count("stale")
+            self._refresh_in_background(db_version, compute_on_loop)
+            return self.cache
+
+        self._count("miss")
+        # Other requests of this process wait here rather than in a worker thread each
+        async with self._async_refresh_lock:
+            return await asyncio.to_thread(self._refresh, db_version, compute_on_loop)
+
+    def _refresh(self, db_version: int, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._refresh_lock, self._process_lock(blocking=True):
+            # Another request or worker may have refreshed while we waited
+            if self.is_stale(db_version):
+                self.update_cache(compute(), db_version)
+            return self.cache
+
+    async def _ais_stale(self, db_version: int) -> bool:
+        if self.backend:
+            return await asyncio.to_thread(self.is_stale, db_version)
+        return self.is_stale(db_version)
+
+    def _count(self, result: str):
+        if self.on_lookup:
+            self.on_lookup(result)
+
+    def _sync_from_backend(self, scope: str):
+        if not self.backend:
+            return
+        shared_version = self.backend.peek_version(scope)
+        if shared_version is None:
+            return
+        version, _, snapshot_scope = self._snapshot
+        if snapshot_scope != scope or version is None or shared_version > version:
+            version, data = self.backend.load(scope)
+            self._snapshot = (version, data, scope)
+            self.stale_since = None
+
+    def _process_lock(self, blocking: bool):
+        return self.backend.lock(blocking) if self.backend else nullcontext(True)
+
+    def _can_serve_stale(self) -> bool:
+        # Results of another database or other definitions are wrong, not just old
+        version, _, snapshot_scope = self._snapshot
+        if not self.stale_while_revalidate or version is None or snapshot_scope != self.scope():
+            return False
+        if self.stale_since is None:
+            self.stale_since = time()
+        return time() - self.stale_since <= self.max_staleness
+
+    def _refresh_in_background(self, db_version: int, compute: Callable[[], Dict[str, Any]]):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # a refresh is already running
+
+        def refresh():
+            try:
+                with self._process_lock(blocking=False) as acquired:
+                    if acquired and self.is_stale(db_version):
+                        self.update_cache(compute(), db_version)
+            except Exception as e:
+                # Keep serving the previous snapshot; max_staleness bounds how long
+                print(f"❌ Background analytics refresh failed: {e}")
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, name="analytics-refresh", daemon=True).start()
@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from functools import cached_property
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import text
+
+# === Grouping dimensions (SQL expressions over hotel_bookings) ===
+DIMENSIONS: Dict[str, str] = {
+    "month": "DATE_TRUNC('month', arrival_date)",
+    "year": "DATE_PART('year', arrival_date)",
+    "month_year": "TO_CHAR(arrival_date, 'Month YYYY')",
+    "hotel": "hotel",
+    "market_segment": "market_segment",
+    "country": "country",
+    "reserved_room_type": "reserved_room_type",
+    "deposit_type": "deposit_type",
+    "is_canceled": "is_canceled",
+    "total_of_special_requests": "total_of_special_requests",
+    "booking_type": """CASE
+                    WHEN lead_time < 7 THEN 'Last-minute'
+                    WHEN lead_time BETWEEN 7 AND 30 THEN 'Short-term'
+                    ELSE 'Long-term'
+                END""",
+    "booking_category": """CASE
+                    WHEN lead_time < 7 THEN 'Last-minute'
+                    WHEN lead_time BETWEEN 7 AND 30 THEN '1 week to 1 month'
+                    ELSE 'Long-term'
+                END""",
+    "lead_time_category": """CASE
+                    WHEN lead_time < 7 THEN 'Less than a week'
+                    WHEN lead_time BETWEEN 7 AND 30 THEN '1 week to 1 month'
+                    WHEN lead_time BETWEEN 31 AND 90 THEN '1 to 3 months'
+                    WHEN lead_time BETWEEN 91 AND 180 THEN '3 to 6 months'
+                    ELSE 'More than 6 months'
+                END""",
+}
+
+REVENUE = "adr * (stays_in_week_nights + stays_in_weekend_nights)"
+CANCELED = "CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END"
+RECENT = "arrival_date >= CURRENT_DATE - INTERVAL '6 months'"
+
+# Rows written by transactions that had not committed when :snapshot (a
+# pg_snapshot as text, NULL for every row) was taken. Used by the incremental
+# rollup and NumPy refreshes; the xmin bound lets the scan use the xact_id
+# index. The text cast keeps asyncpg from binding it as a pg_snapshot tuple.
+CHANGED_SINCE = """(
+    CAST(CAST(:snapshot AS TEXT) AS pg_snapshot) IS NULL
+    OR (xact_id >= pg_snapshot_xmin(CAST(CAST(:snapshot AS TEXT) AS pg_snapshot))
+        AND NOT pg_visible_in_snapshot(xact_id, CAST(CAST(:snapshot AS TEXT) AS pg_snapshot)))
+)"""
+
+# === Measures (aggregate expressions, evaluated once per grouping set) ===
+# {grouping} is replaced with the GROUPING(...) bitmask so window measures stay
+# inside the grouping set they were computed for.
+MEASURES: Dict[str, str] = {
+    "total_revenue": f"SUM({REVENUE})",
+    "recent_revenue": f"SUM({REVENUE}) FILTER (WHERE {RECENT})",
+    "recent_bookings": f"COUNT(*) FILTER (WHERE {RECENT})",
+    "total_bookings": "COUNT(*)",
+    "canceled_bookings": f"SUM({CANCELED})",
+    "cancellation_rate": f"ROUND(100.0 * SUM({CANCELED}) / COUNT(*), 2)",
+    "unrounded_cancellation_rate": f"SUM({CANCELED}) * 100.0 / COUNT(*)",
+    "booking_percentage": "ROUND(100.0 * COUNT(*) / SUM(COUNT(*)) OVER (PARTITION BY {grouping}), 2)",
+    "average_lead_time": "AVG(lead_time)",
+    "percentage_last_minute_bookings": "ROUND(100.0 * COUNT(*) FILTER (WHERE lead_time < 7) / COUNT(*), 2)",
+}
+
+# === Row filters (WHERE predicates a metric can be pruned or sliced with) ===
+# Slice filters take bound parameters. Lists are compared as text so the same
+# SQL works before and after the enum columns of migration 006.
+FILTERS: Dict[str, str] = {
+    "recent": RECENT,
+    "start": "arrival_date >= :start",
+    "end": "arrival_date <= :end",
+    "month_start": "arrival_date >= :start",
+    "month_end": "arrival_date <= :end",
+    "hotel": "CAST(hotel AS TEXT) = ANY(CAST(:hotel AS TEXT[]))",
+    "country": "country = ANY(CAST(:country AS TEXT[]))",
+    "market_segment": "CAST(market_segment AS TEXT) = ANY(CAST(:market_segment AS TEXT[]))",
+}
+
+
+@dataclass(frozen=True)
+class Metric:
+    """One keyed result of an analytics endpoint, expressed as a grouping set.
+
+    ``columns`` lists output columns in order; an entry is either a dimension /
+    measure name or an ``(output_name, source_name)`` pair. Rows are filtered
+    on ``having`` (a measure that must be > 0), then sorted and limited the
+    way the original SQL did (NULLS LAST for ASC, NULLS FIRST for DESC).
+    ``prune`` names filters that rows must pass to affect the result at all
+    (e.g. "recent" for a metric that only keeps recent months); sources that
+    know the filter add it as a WHERE clause so Postgres can skip partitions.
+    """
+    dimensions: Tuple[str, ...]
+    columns: Tuple[Union[str, Tuple[str, str]], ...]
+    order_by: Tuple[Tuple[str, str], ...] = ()
+    limit: Optional[int] = None
+    having: Optional[str] = None
+    prune: Tuple[str, ...] = ()
+
+    def column_sources(self) -> List[Tuple[str, str]]:
+        return [c if isinstance(c, tuple) else (c, c) for c in self.columns]
+
+    def measures(self) -> List[str]:
+        return [src for _, src in self.column_sources() if src not in self.dimensions] + (
+            [self.having] if self.having else []
+        )
+
+
+@dataclass(frozen=True)
+class Source:
+    """A relation the engine can aggregate over, with its own dimension and measure expressions."""
+    table: str
+    dimensions: Dict[str, str]
+    measures: Dict[str, str]
+    filters: Dict[str, str] = field(default_factory=dict)
+
+    def supports(self, metric: Metric) -> bool:
+        return all(d in self.dimensions for d in metric.dimensions) and all(
+            m in self.measures for m in metric.measures()
+        )
+
+
+BOOKINGS = Source("hotel_bookings", DIMENSIONS, MEASURES, FILTERS)
+
+
+@dataclass(frozen=True)
+class Statement:
+    """One grouping set with its measures, the unit results are cached by.
+
+    Metrics that only differ in ordering, limits or column names (e.g.
+    ``cancellation_by_country`` in the cancellations and geo endpoints) map to
+    the same statement and therefore share its rows.
+    """
+    source: Source
+    dimensions: Tuple[str, ...]
+    measures: Tuple[str, ...]
+    prune: Tuple[str, ...] = ()
+
+    def sql(self) -> str:
+        return build_grouping_sets_query([self])[0]
+
+    @cached_property
+    def fingerprint(self) -> str:
+        # Whitespace-insensitive hash of the statement's SQL
+        normalized = " ".join(self.sql().split()).rstrip(";").strip()
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def plan_statements(
+    metrics: Dict[str, Metric], sources: Sequence[Source] = (BOOKINGS,), filters: Sequence[str] = ()
+) -> Dict[str, Statement]:
+    """Assign every metric to the first source that can answer it with all of ``filters`` applied.
+
+    ``filters`` slice the rows with bound parameters, so statements planned
+    with them share a fingerprint across parameter values and must not be
+    cached by fingerprint alone.
+    """
+    plan: Dict[str, Statement] = {}
+    for key, metric in metrics.items():
+        source = next((s for s in sources if s.supports(metric) and all(f in s.filters for f in filters)), None)
+        if source is None:
+            raise ValueError(f"No analytics source can compute '{key}'")
+        prune = tuple(sorted({f for f in metric.prune if f in source.filters} | set(filters)))
+        plan[key] = Statement(source, metric.dimensions, tuple(sorted(set(metric.measures()))), prune)
+    return plan
+
+
+def build_grouping_sets_query(statements: Sequence[Statement]) -> Tuple[str, List[str], List[Tuple[str, ...]]]:
+    """Render one GROUPING SETS statement covering statements over the same source and filters."""
+    source = statements[0].source
+    prune = statements[0].prune
+    dims: List[str] = []
+    measures: List[str] = []
+    sets: List[Tuple[str, ...]] = []
+    for statement in statements:
+        for d in statement.dimensions:
+            if d not in dims:
+                dims.append(d)
+        for m in statement.measures:
+            if m not in measures:
+                measures.append(m)
+        if statement.dimensions not in sets:
+            sets.append(statement.dimensions)
+
+    # GROUPING() needs at least one argument; an endpoint with only the () set
+    # has a single grouping set anyway.
+    grouping = f"GROUPING({', '.join(source.dimensions[d] for d in dims)})" if dims else "0"
+    select = [f"{grouping} AS grouping_id"]
+    select += [f"{source.dimensions[d]} AS {d}" for d in dims]
+    select += [f"{source.measures[m].format(grouping=grouping)} AS {m}" for m in measures]
+    grouping_sets = ", ".join(
+        "(" + ", ".join(source.dimensions[d] for d in s) + ")" for s in sets
+    )
+    where = f"WHERE {' AND '.join(source.filters[f] for f in prune)}" if prune else ""
+    sql = f"""
+        SELECT {', '.join(select)}
+        FROM {source.table}
+        {where}
+        GROUP BY GROUPING SETS ({grouping_sets});
+    """
+    return sql, dims, sets
+
+
+def grouping_id(dims: List[str], grouping_set: Tuple[str, ...]) -> int:
+    # GROUPING() sets a bit for every argument NOT in the current set; the last
+    # argument is the least significant bit.
+    if not dims:
+        return 0
+    n = len(dims)
+    return sum(1 << (n - 1 - i) for i, d in enumerate(dims) if d not in grouping_set)
+
+
+def _sort_rows(rows: List[Dict[str, Any]], order_by: Tuple[Tuple[str, str], ...]) -> List[Dict[str, Any]]:
+    # Stable sort from the last key to the first, with Postgres' default NULL placement.
+    for column, direction in reversed(order_by):
+        desc = direction.upper() == "DESC"
+        present = [r for r in rows if r[column] is not None]
+        missing = [r for r in rows if r[column] is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        rows = missing + present if desc else present + missing
+    return rows
+
+
+def shape_metric(metric: Metric, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn the raw rows of one grouping set into the keyed JSON rows of ``metric``."""
+    if metric.having:
+        rows = [r for r in rows if r[metric.having]]
+    sources = metric.column_sources()
+    shaped = [{out: r[src] for out, src in sources} for r in rows]
+    shaped = _sort_rows(shaped, metric.order_by)
+    if metric.limit is not None:
+        shaped = shaped[:metric.limit]
+    return shaped
+
+
+def metric_query(metric: Metric, statement: Statement) -> str:
+    """Render one metric as a standalone query: shaped, filtered, sorted and limited in SQL."""
+    select = ", ".join(f"{src} AS {out}" for out, src in metric.column_sources())
+    where = f"WHERE {metric.having} > 0" if metric.having else ""
+    order = ", ".join(f"{column} {direction}" for column, direction in metric.order_by)
+    return f"""
+        SELECT {select}
+        FROM ({statement.sql().strip().rstrip(';')}) AS grouped
+        {where}
+        {f"ORDER BY {order}" if order else ""}
+        {f"LIMIT {metric.limit}" if metric.limit is not None else ""};
+    """
+
+
+async def stream_metric_rows(async_engine, metric: Metric, statement: Statement, batch_size: int = 1000):
+    """Yield the shaped rows of one metric from a server-side cursor, ``batch_size`` rows at a time."""
+    async with async_engine.connect() as connection:
+        result = await connection.stream(
+            text(metric_query(metric, statement)).execution_options(yield_per=batch_size)
+        )
+        columns = list(result.keys())
+        async for row in result:
+            yield dict(zip(columns, row))
+
+
+def _split_rows(
+    columns: List[str], rows: Sequence[Any], dims: List[str], sets: List[Tuple[str, ...]],
+    statements: Sequence[Statement],
+) -> Dict[str, List[Dict[str, Any]]]:
+    by_set: Dict[int, List[Dict[str, Any]]] = {grouping_id(dims, s): [] for s in sets}
+    for row in rows:
+        record = dict(zip(columns, row))
+        by_set[record.pop("grouping_id")].append(record)
+
+    rows_by_fingerprint: Dict[str, List[Dict[str, Any]]] = {}
+    for statement in statements:
+        keep = statement.dimensions + statement.measures
+        rows_by_fingerprint[statement.fingerprint] = [
+            {c: r[c] for c in keep} for r in by_set[grouping_id(dims, statement.dimensions)]
+        ]
+    return rows_by_fingerprint
+
+
+# Called with (sql, statements, seconds) after every query the engine runs
+StatementObserver = Callable[[str, Sequence[Statement], float], None]
+
+
+def group_by_source(statements: Sequence[Statement]) -> List[List[Statement]]:
+    # Statements with different filters can't share a scan
+    by_source: Dict[Tuple[str, Tuple[str, ...]], List[Statement]] = {}
+    for statement in statements:
+        by_source.setdefault((statement.source.table, statement.prune), []).append(statement)
+    return list(by_source.values())
+
+
+def run_statements(
+    connection, statements: Sequence[Statement], on_statement: Optional[StatementObserver] = None,
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Execute statements with one GROUPING SETS scan per source.
+
+    Returns the raw rows of every statement, keyed by its fingerprint.
+    ``params`` binds the parameters of slice filters.
+    """
+    rows_by_fingerprint: Dict[str, List[Dict[str, Any]]] = {}
+    for group in group_by_source(statements):
+        sql, dims, sets = build_grouping_sets_query(group)
+        start = perf_counter()
+        result_proxy = connection.execute(text(sql), params or {})
+        rows = result_proxy.fetchall()
+        if on_statement:
+            on_statement(sql, group, perf_counter() - start)
+        rows_by_fingerprint.update(_split_rows(list(result_proxy.keys()), rows, dims, sets, group))
+    return rows_by_fingerprint
+
+
+async def run_statements_async(
+    async_engine, statements: Sequence[Statement], concurrency: int = 4,
+    on_statement: Optional[StatementObserver] = None, params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Async counterpart of run_statements that fans the work out over pooled connections.
+
+    Each source's statements are split into at most ``concurrency`` chunks,
+    each one GROUPING SETS query, run by at most ``concurrency`` connections
+    that take chunks until none are left. All of them read the same
+    REPEATABLE READ snapshot, exported by the first connection, so the
+    results are as consistent as run_statements' single connection.
+    """
+    pending: List[List[Statement]] = []
+    for group in group_by_source(statements):
+        n = min(concurrency, len(group))
+        pending += [group[i::n] for i in range(n)]
+    rows_by_fingerprint: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def run_pending(connection):
+        while pending:
+            chunk = pending.pop()
+            sql, dims, sets = build_grouping_sets_query(chunk)
+            start = perf_counter()
+            result_proxy = await connection.execute(text(sql), params or {})
+            rows = result_proxy.fetchall()
+            if on_statement:
+                on_statement(sql, chunk, perf_counter() - start)
+            rows_by_fingerprint.update(_split_rows(list(result_proxy.keys()), rows, dims, sets, chunk))
+
+    async def run_in_snapshot(snapshot: str):
+        async with async_engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="REPEATABLE READ")
+            # Must come before the transaction's first query; the id can't be a bind parameter
+            await connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+            await run_pending(connection)
+
+    workers = min(concurrency, len(pending))
+    if not workers:
+        return rows_by_fingerprint
+    async with async_engine.connect() as leader:
+        leader = await leader.execution_options(isolation_level="REPEATABLE READ")
+        if workers == 1:
+            await run_pending(leader)
+        else:
+            snapshot = (await leader.execute(text("SELECT pg_export_snapshot()"))).scalar()
+            # The snapshot stays importable while the leader's transaction is open
+            await asyncio.gather(run_pending(leader), *(run_in_snapshot(snapshot) for _ in range(workers - 1)))
+    return rows_by_fingerprint
@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from analytics_cache import serialize_results
+from analytics_engine import Metric
+
+# === Output formats for analytics results ===
+# "json" is the original {metric: [row, ...]} layout; "columns" sends every
+# metric as {column: [values]} so column names appear once; "ndjson" streams
+# one row per line straight from the database; "arrow" is an Arrow IPC stream
+# of a single metric.
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columns": "application/vnd.hotel-analytics.columns+json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+ACCEPT_ALIASES = {
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+
+
+def negotiate_format(format_param: Optional[str], accept: str) -> Optional[str]:
+    """Pick the output format from ?format= or else the Accept header; None if unsupported."""
+    if format_param:
+        return format_param if format_param in MEDIA_TYPES else None
+    by_media_type = {media_type: name for name, media_type in MEDIA_TYPES.items()}
+    by_media_type.update(ACCEPT_ALIASES)
+    for entry in accept.split(","):
+        media_type = entry.split(";")[0].strip().lower()
+        if media_type in by_media_type:
+            return by_media_type[media_type]
+    return "json"
+
+
+def metric_columns(metric: Metric) -> List[str]:
+    return [out for out, _ in metric.column_sources()]
+
+
+def to_columns(metrics: Dict[str, Metric], results: Dict[str, List[Dict[str, Any]]]) -> bytes:
+    return serialize_results({
+        key: {column: [row[column] for row in results[key]] for column in metric_columns(metric)}
+        for key, metric in metrics.items()
+    })
+
+
+def to_arrow(columns: Sequence[str], rows: List[Dict[str, Any]]) -> bytes:
+    import pyarrow as pa
+
+    table = pa.table({column: pa.array([row[column] for row in rows]) for column in columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def ndjson_line(metric_key: str, row: Dict[str, Any]) -> bytes:
+    return serialize_results({"metric": metric_key, **row}) + b"\n"
@@ -0,0 +1,192 @@
+from sqlalchemy import text
+from analytics_engine import CHANGED_SINCE, DIMENSIONS, FILTERS, RECENT, REVENUE, Source
+
+# === Rollup sources ===
+# booking_rollup is a fact cube with one row per (month, hotel, country,
+# market_segment, room type, deposit type, lead bucket, special requests,
+# is_canceled); booking_rollup_daily keeps per-day revenue for date windows.
+CUBE_DIMENSIONS = {
+    "month": "DATE_TRUNC('month', arrival_month)",
+    "year": "DATE_PART('year', arrival_month)",
+    "month_year": "TO_CHAR(arrival_month, 'Month YYYY')",
+    "hotel": "hotel",
+    "market_segment": "market_segment",
+    "country": "country",
+    "reserved_room_type": "reserved_room_type",
+    "deposit_type": "deposit_type",
+    "is_canceled": "is_canceled",
+    "total_of_special_requests": "total_of_special_requests",
+    "booking_type": """CASE lead_time_category
+                    WHEN 'Less than a week' THEN 'Last-minute'
+                    WHEN '1 week to 1 month' THEN 'Short-term'
+                    ELSE 'Long-term'
+                END""",
+    "booking_category": """CASE lead_time_category
+                    WHEN 'Less than a week' THEN 'Last-minute'
+                    WHEN '1 week to 1 month' THEN '1 week to 1 month'
+                    ELSE 'Long-term'
+                END""",
+    "lead_time_category": "lead_time_category",
+}
+
+BOOKINGS_SUM = "SUM(bookings)::BIGINT"
+CANCELED_SUM = "SUM(CASE WHEN is_canceled = TRUE THEN bookings ELSE 0 END)::BIGINT"
+LAST_MINUTE_SUM = "COALESCE(SUM(bookings) FILTER (WHERE lead_time_category = 'Less than a week'), 0)::BIGINT"
+
+# Revenue is stored as NUMERIC so that folding changes in and out is exact,
+# and read back as double precision like the SUM over hotel_bookings
+CUBE_MEASURES = {
+    "total_revenue": "CASE WHEN SUM(revenue_count) > 0 THEN SUM(revenue)::DOUBLE PRECISION END",
+    "total_bookings": BOOKINGS_SUM,
+    "canceled_bookings": CANCELED_SUM,
+    "cancellation_rate": f"ROUND(100.0 * {CANCELED_SUM} / {BOOKINGS_SUM}, 2)",
+    "unrounded_cancellation_rate": f"{CANCELED_SUM} * 100.0 / {BOOKINGS_SUM}",
+    "booking_percentage": f"ROUND(100.0 * {BOOKINGS_SUM} / SUM({BOOKINGS_SUM}) OVER (PARTITION BY {{grouping}}), 2)",
+    "average_lead_time": "SUM(lead_time_sum) / NULLIF(SUM(lead_time_count), 0)",
+    "percentage_last_minute_bookings": f"ROUND(100.0 * {LAST_MINUTE_SUM} / {BOOKINGS_SUM}, 2)",
+}
+
+DAILY_DIMENSIONS = {
+    "month": "DATE_TRUNC('month', arrival_date)",
+}
+
+DAILY_MEASURES = {
+    "recent_revenue": f"CASE WHEN SUM(revenue_count) FILTER (WHERE {RECENT}) > 0 "
+                      f"THEN (SUM(revenue) FILTER (WHERE {RECENT}))::DOUBLE PRECISION END",
+    "recent_bookings": f"COALESCE(SUM(bookings) FILTER (WHERE {RECENT}), 0)",
+}
+
+# The cube only has whole months, so it takes date slices that start on the
+# first and end on the last day of a month (see analytics_slices.py)
+CUBE_FILTERS = {
+    "month_start": "arrival_month >= :start",
+    "month_end": "arrival_month <= :end",
+    "hotel": FILTERS["hotel"],
+    "country": FILTERS["country"],
+    "market_segment": FILTERS["market_segment"],
+}
+
+DAILY_FILTERS = {name: FILTERS[name] for name in ("recent", "start", "end", "month_start", "month_end")}
+
+CUBE = Source("booking_rollup", CUBE_DIMENSIONS, CUBE_MEASURES, CUBE_FILTERS)
+DAILY = Source("booking_rollup_daily", DAILY_DIMENSIONS, DAILY_MEASURES, DAILY_FILTERS)
+ROLLUP_SOURCES = (CUBE, DAILY)
+
+# === Delta maintenance ===
+CUBE_KEY = [
+    "arrival_month", "hotel", "country", "market_segment", "reserved_room_type",
+    "deposit_type", "lead_time_category", "total_of_special_requests", "is_canceled",
+]
+
+# Row-level projection shared by new rows and retracted old versions
+DELTA_COLUMNS = f"""
+    arrival_date,
+    DATE_TRUNC('month', arrival_date)::DATE AS arrival_month,
+    hotel, country, market_segment, reserved_room_type, deposit_type,
+    {DIMENSIONS['lead_time_category']} AS lead_time_category,
+    total_of_special_requests, is_canceled,
+    ({REVENUE})::NUMERIC AS revenue,
+    lead_time
+"""
+
+
+def _apply_delta(connection):
+    key = ", ".join(CUBE_KEY)
+    connection.execute(text(f"""
+        INSERT INTO booking_rollup AS r (
+            cell_key, {key}, bookings, revenue, revenue_count, lead_time_sum, lead_time_count
+        )
+        SELECT md5(ROW({key})::TEXT), {key},
+               SUM(sign),
+               COALESCE(SUM(sign * revenue), 0),
+               SUM(CASE WHEN revenue IS NOT NULL THEN sign ELSE 0 END),
+               COALESCE(SUM(sign * lead_time), 0),
+               SUM(CASE WHEN lead_time IS NOT NULL THEN sign ELSE 0 END)
+        FROM booking_rollup_delta
+        GROUP BY {key}
+        ON CONFLICT (cell_key) DO UPDATE SET
+            bookings = r.bookings + EXCLUDED.bookings,
+            revenue = r.revenue + EXCLUDED.revenue,
+            revenue_count = r.revenue_count + EXCLUDED.revenue_count,
+            lead_time_sum = r.lead_time_sum + EXCLUDED.lead_time_sum,
+            lead_time_count = r.lead_time_count + EXCLUDED.lead_time_count;
+    """))
+    connection.execute(text("""
+        INSERT INTO booking_rollup_daily AS r (arrival_date, bookings, revenue, revenue_count)
+        SELECT arrival_date,
+               SUM(sign),
+               COALESCE(SUM(sign * revenue), 0),
+               SUM(CASE WHEN revenue IS NOT NULL THEN sign ELSE 0 END)
+        FROM booking_rollup_delta
+        WHERE arrival_date IS NOT NULL
+        GROUP BY arrival_date
+        ON CONFLICT (arrival_date) DO UPDATE SET
+            bookings = r.bookings + EXCLUDED.bookings,
+            revenue = r.revenue + EXCLUDED.revenue,
+            revenue_count = r.revenue_count + EXCLUDED.revenue_count;
+    """))
+    connection.execute(text("DELETE FROM booking_rollup WHERE bookings = 0;"))
+    connection.execute(text("DELETE FROM booking_rollup_daily WHERE bookings = 0;"))
+
+
+def refresh_rollup(connection) -> int:
+    """Fold every booking change committed since the last refresh into the rollup.
+
+    Rows are picked up by the transaction that wrote them (``xact_id``), not
+    by ``last_updated``, so a transaction that commits after a refresh is
+    folded into the next one whatever its timestamps. The previous versions of
+    updated or deleted rows come from booking_rollup_retractions. Must run
+    inside a transaction. Returns the number of delta rows applied.
+    """
+    # Serializes refreshes; the snapshot can't move until this one commits
+    snapshot = connection.execute(text(
+        "SELECT snapshot::TEXT FROM booking_rollup_state FOR UPDATE"
+    )).scalar()
+
+    connection.execute(text(f"""
+        CREATE TEMP TABLE booking_rollup_delta ON COMMIT DROP AS
+        SELECT 1 AS sign, {DELTA_COLUMNS}
+        FROM hotel_bookings
+        WITH NO DATA;
+    """))
+    # One statement, so the new rows, the consumed retractions and the stored
+    # snapshot all come from the same snapshot. Only old versions that were
+    # already folded in need to be subtracted.
+    connection.execute(text(f"""
+        WITH consumed AS (
+            DELETE FROM booking_rollup_retractions RETURNING *
+        ), advanced AS (
+            UPDATE booking_rollup_state SET snapshot = pg_current_snapshot()
+        )
+        INSERT INTO booking_rollup_delta
+        SELECT -1 AS sign, {DELTA_COLUMNS}
+        FROM consumed
+        WHERE pg_visible_in_snapshot(xact_id, CAST(CAST(:snapshot AS TEXT) AS pg_snapshot))
+        UNION ALL
+        SELECT 1 AS sign, {DELTA_COLUMNS}
+        FROM hotel_bookings
+        WHERE {CHANGED_SINCE};
+    """), {"snapshot": snapshot})
+
+    applied = connection.execute(text("SELECT COUNT(*) FROM booking_rollup_delta")).scalar()
+    if applied:
+        _apply_delta(connection)
+    connection.execute(text("DROP TABLE booking_rollup_delta"))
+    return applied
+
+
+def rebuild_rollup(connection) -> int:
+    """Recompute the rollup from scratch, e.g. after editing it by hand."""
+    connection.execute(text(
+        "TRUNCATE booking_rollup, booking_rollup_daily, booking_rollup_retractions"
+    ))
+    connection.execute(text("UPDATE booking_rollup_state SET snapshot = NULL"))
+    return refresh_rollup(connection)
+
+
+if __name__ == "__main__":
+    from db_utils import engine
+
+    with engine.begin() as connection:
+        rows = rebuild_rollup(connection)
+    print(f"✅ Rollup rebuilt from {rows} bookings")
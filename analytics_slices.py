@@ -0,0 +1,58 @@
+import calendar
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+SLICE_DIMENSIONS = ("hotel", "country", "market_segment")
+
+
+def _values(values: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    return tuple(sorted({v.strip() for v in values or () if v and v.strip()}))
+
+
+@dataclass(frozen=True)
+class SliceFilter:
+    """Normalized filters of an analytics slice: an arrival date range and value lists.
+
+    Values are stripped, de-duplicated and sorted, so equivalent requests
+    share a cache key and bind the same SQL parameters.
+    """
+    start: Optional[date] = None
+    end: Optional[date] = None
+    hotel: Tuple[str, ...] = ()
+    country: Tuple[str, ...] = ()
+    market_segment: Tuple[str, ...] = ()
+
+    @classmethod
+    def normalize(cls, start=None, end=None, hotel=None, country=None, market_segment=None) -> "SliceFilter":
+        if start and end and start > end:
+            raise ValueError("start must not be after end")
+        return cls(start, end, _values(hotel), _values(country), _values(market_segment))
+
+    def filter_names(self) -> Tuple[str, ...]:
+        """Names of the engine filters to apply (see analytics_engine.FILTERS)."""
+        names = []
+        # Whole-month ranges can also be answered from the monthly rollup cube
+        if self.start:
+            names.append("month_start" if self.start.day == 1 else "start")
+        if self.end:
+            last_day = calendar.monthrange(self.end.year, self.end.month)[1]
+            names.append("month_end" if self.end.day == last_day else "end")
+        names += [name for name in SLICE_DIMENSIONS if getattr(self, name)]
+        return tuple(names)
+
+    def params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"start": self.start, "end": self.end}
+        params.update({name: list(getattr(self, name)) for name in SLICE_DIMENSIONS})
+        return params
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+            **{name: list(getattr(self, name)) for name in SLICE_DIMENSIONS},
+        }
+
+    def cache_key(self) -> str:
+        return json.dumps(self.as_dict(), sort_keys=True, separators=(",", ":"))
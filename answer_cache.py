@@ -0,0 +1,155 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+# Curly quotes count as straight ones; only quotes around the question and
+# sentence punctuation at its end are dropped. Everything inside is kept, so
+# "revenue > 100" and "revenue < 100" (or "3.5" and "3 5") stay apart.
+# db_setup/migrations/004_query_history_hash.sql computes the same key in SQL.
+_QUOTES = str.maketrans({"\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"'})
+_EDGES = re.compile(r"""^["'\s]+|[\s"'?!.,;:]+$""")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a question, without surrounding quotes and trailing punctuation."""
+    query = unicodedata.normalize("NFKC", query).translate(_QUOTES).lower()
+    return _EDGES.sub("", " ".join(query.split()))
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+
+class AnswerCache:
+    """Exact-match /ask answers stored in query_history, with an in-process LRU in front.
+
+    Questions are keyed by the hash of their normalized text, which is unique
+    in query_history. The LRU holds up to ``max_entries`` answers for at most
+    ``ttl`` seconds, so changes written by other workers show up eventually.
+    """
+
+    def __init__(self, engine, max_entries: int = 1024, ttl: float = 300.0):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _put_local(self, key: str, row: Dict[str, Any]):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time(), row)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """The stored answer for ``query`` as {id, generated_response, faithfulness_score, evaluation_status}, or None."""
+        return self.get_many([query])[0]
+
+    def get_many(self, queries: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Stored answers for several questions, with one query_history round-trip for all LRU misses."""
+        keys = [query_hash(q) for q in queries]
+        rows = {key: self._get_local(key) for key in keys}
+        missing = [key for key, row in rows.items() if row is None]
+        if missing:
+            with self.engine.connect() as conn:
+                result = conn.execute(text("""
+                    SELECT query_hash, id, generated_response, faithfulness_score, evaluation_status
+                    FROM query_history
+                    WHERE query_hash = ANY(:hashes)
+                """), {"hashes": missing}).mappings().fetchall()
+            for found in result:
+                row = dict(found)
+                key = row.pop("query_hash")
+                rows[key] = row
+                self._put_local(key, row)
+        return [rows[key] for key in keys]
+
+    def put(self, query: str, answer: str, score: Optional[float] = None, evaluation_status: Optional[str] = None) -> int:
+        """Store the answer to ``query`` and return its query_history id."""
+        return self.put_many([(query, answer, score, evaluation_status)])[0]
+
+    def put_many(self, answers: List[Tuple[str, str, Optional[float], Optional[str]]]) -> List[int]:
+        """Upsert (query, answer, score, evaluation_status) tuples in one statement; returns their ids in order."""
+        keys = [query_hash(query) for query, _, _, _ in answers]
+        if len(set(keys)) != len(keys):
+            raise ValueError("put_many needs distinct questions")
+        with self.engine.begin() as conn:
+            result = conn.execute(text("""
+                INSERT INTO query_history (query_hash, user_query, generated_response, faithfulness_score, evaluation_status)
+                SELECT * FROM unnest(
+                    CAST(:hashes AS TEXT[]), CAST(:queries AS TEXT[]), CAST(:answers AS TEXT[]),
+                    CAST(:scores AS FLOAT[]), CAST(:statuses AS TEXT[])
+                )
+                ON CONFLICT (query_hash) DO UPDATE SET
+                    user_query = EXCLUDED.user_query,
+                    generated_response = EXCLUDED.generated_response,
+                    faithfulness_score = EXCLUDED.faithfulness_score,
+                    evaluation_status = EXCLUDED.evaluation_status,
+                    created_at = CURRENT_TIMESTAMP
+                RETURNING query_hash, id
+            """), {
+                "hashes": keys,
+                "queries": [a[0] for a in answers],
+                "answers": [a[1] for a in answers],
+                "scores": [a[2] for a in answers],
+                "statuses": [a[3] for a in answers],
+            })
+            ids = dict(result.fetchall())
+        for key, (_, answer, score, status) in zip(keys, answers):
+            self._put_local(key, {
+                "id": ids[key], "generated_response": answer,
+                "faithfulness_score": score, "evaluation_status": status,
+            })
+        return [ids[key] for key in keys]
+
+    def fail_stale_evaluations(self, older_than: float) -> int:
+        """Mark evaluations still pending ``older_than`` seconds after the answer as failed; returns how many.
+
+        The evaluation queue lives in memory, so a restart loses what it held
+        (and the retrieved contexts needed to redo them).
+        """
+        with self.engine.begin() as conn:
+            return conn.execute(text("""
+                UPDATE query_history SET evaluation_status = 'failed'
+                WHERE evaluation_status = 'pending'
+                  AND created_at < CURRENT_TIMESTAMP - make_interval(secs => :older_than)
+            """), {"older_than": older_than}).rowcount
+
+    def record_scores(self, scores: List[Tuple[str, int, str, Optional[float], str]]):
+        """Write back (query, id, answer, faithfulness_score, evaluation_status) tuples in one round-trip.
+
+        A score only applies to the answer it was computed for: if the
+        question has been answered again since, the newer row is left alone.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE query_history
+                SET faithfulness_score = :score, evaluation_status = :status
+                WHERE id = :id AND generated_response = :answer
+            """), [
+                {"id": query_id, "answer": answer, "score": score, "status": status}
+                for _, query_id, answer, score, status in scores
+            ])
+        with self._lock:
+            for query, query_id, answer, score, status in scores:
+                entry = self._entries.get(query_hash(query))
+                if entry is not None and entry[1]["id"] == query_id and entry[1]["generated_response"] == answer:
+                    entry[1].update(faithfulness_score=score, evaluation_status=status)
@@ -1,432 +1,559 @@
-from fastapi import FastAPI, Query
-import pandas as pd
-from db_utils import engine, get_db_last_updated_timestamp
-from analytics_cache import AnalyticsCache
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+import hashlib
+from functools import lru_cache
+from db_utils import async_engine, engine, get_db_data_version, get_db_data_version_async, get_db_identity
+from answer_cache import AnswerCache, query_hash
+from analytics_cache import AnalyticsCache, SharedFileBackend, serialize_results
+from analytics_engine import (
+    BOOKINGS, Metric, Statement, plan_statements, run_statements, run_statements_async, shape_metric, stream_metric_rows,
+)
+from analytics_formats import MEDIA_TYPES, metric_columns, ndjson_line, negotiate_format, to_arrow, to_columns
+from analytics_rollup import ROLLUP_SOURCES, refresh_rollup
+from analytics_slices import SliceFilter
+from corpus_sync import CorpusSync
+from evaluation_queue import EVALUATORS, EvaluationItem, EvaluationQueue
+from instrumentation import (
+    ASK_ROUTES, ASK_STAGE_SECONDS, CACHE_REQUESTS, ROLLUP_REFRESH_SECONDS, STALENESS_CHECK_SECONDS, STATEMENT_SECONDS,
+    SlowQueryLog, metrics_body,
+)
+from ollama_client import embed, generate, grounded_prompt, new_client, stream_generate
+from pdf_corpus import PdfCorpusCache
+from question_router import QuestionRouter
+from result_cache import ResultCache
+from semantic_cache import SemanticAnswerCache
+from weaviate_store import GROUNDED_TASK, WeaviateStore
 from sqlalchemy import text
-from typing import List
-import weaviate
-from weaviate.classes.config import Configure
-from PyPDF2 import PdfReader
-import os
-import torch
-from ragas.metrics import faithfulness
-from ragas import evaluate
-from datasets import Dataset
-import pandas as pd
-from ragas.llms import LangchainLLMWrapper
-from time import time
-from ragas.embeddings import LangchainEmbeddingsWrapper
-from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
+from typing import Any, Dict, List, Optional
+from datetime import date
+from pydantic import BaseModel, Field
 import os
+from time import perf_counter, time
 os.environ["OPENAI_API_KEY"] ="set_openai_api_key_for_evaluation" 
-evaluator_llm = LangchainLLMWrapper(ChatOpenAI(model="gpt-4o"))
-evaluator_embeddings = LangchainEmbeddingsWrapper(OpenAIEmbeddings())
 
+# Faithfulness is scored in the background; FAITHFULNESS_EVALUATOR=stub scores offline
+evaluation_queue = EvaluationQueue(
+    EVALUATORS[os.getenv("FAITHFULNESS_EVALUATOR", "ragas")](),
+    write_back=lambda scores: answer_cache.record_scores(scores),
+    batch_size=int(os.getenv("FAITHFULNESS_BATCH_SIZE", "8")),
+    max_wait=float(os.getenv("FAITHFULNESS_BATCH_WAIT", "0.5")),
+    workers=int(os.getenv("FAITHFULNESS_WORKERS", "1")),
+)
+# Evaluations pending for longer than this at startup were lost with a previous process
+FAITHFULNESS_PENDING_TIMEOUT = float(os.getenv("FAITHFULNESS_PENDING_TIMEOUT", "600"))
+
+
+# RAG_ENABLED=false runs an analytics-only worker: /ask is disabled and the
+# PDF, Weaviate and evaluation stacks are never imported or started
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() == "true"
+WEAVIATE_WARM_UP = os.getenv("WEAVIATE_WARM_UP", "true").lower() == "true"
+
+def warm_up_weaviate():
+    try:
+        weaviate_store.warm_up()
+    except Exception as e:
+        print(f"⚠️ Weaviate warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not RAG_ENABLED:
+        yield
+        return
+    # Parse (or load the persisted) PDF corpus and set up Weaviate before the
+    # first question arrives, so /ask only pays for retrieval and generation
+    try:
+        data = await asyncio.to_thread(extract_answers_from_pdfs)
+        await asyncio.to_thread(bootstrap_weaviate, data)
+        if WEAVIATE_WARM_UP:
+            threading.Thread(target=warm_up_weaviate, name="weaviate-warm-up", daemon=True).start()
+    except Exception as e:
+        print(f"❌ Could not prepare /ask at startup, retrying on the first question: {e}")
+    try:
+        failed = await asyncio.to_thread(answer_cache.fail_stale_evaluations, FAITHFULNESS_PENDING_TIMEOUT)
+        if failed:
+            print(f"⚠️ Marked {failed} faithfulness evaluations left pending by a previous run as failed")
+    except Exception as e:
+        print(f"⚠️ Could not clean up pending faithfulness evaluations: {e}")
+    evaluation_queue.start()
+    yield
+    evaluation_queue.stop()
+    weaviate_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Statement results shared across endpoints, keyed by SQL fingerprint + data
+# version and dropped when the database is recreated
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("ANALYTICS_RESULT_CACHE_BYTES", str(64 * 1024 * 1024))), scope=get_db_identity
+)
+
+ANALYTICS_QUERY_CONCURRENCY = int(os.getenv("ANALYTICS_QUERY_CONCURRENCY", "4"))
+
+# Statements slower than the threshold are logged with their EXPLAIN (ANALYZE, BUFFERS) plan
+slow_query_log = SlowQueryLog(
+    engine,
+    os.getenv("SLOW_QUERY_LOG", "slow_queries.log"),
+    threshold=float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500")) / 1000,
+    interval=float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300")),
+)
+
+# "rollup" aggregates the incrementally maintained cube, "sql" scans hotel_bookings
+# directly and "numpy" runs the statements in-process on a columnar snapshot
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "rollup")
+if ANALYTICS_ENGINE == "numpy":
+    from columnar_engine import ColumnarEngine
+    columnar_engine = ColumnarEngine(engine)
+ANALYTICS_SOURCES = ROLLUP_SOURCES if ANALYTICS_ENGINE == "rollup" else (BOOKINGS,)
+
+def statement_observer(plan: Dict[str, Statement], params: Optional[Dict[str, Any]] = None):
+    """Records each statement's time under every metric key it computed, and logs slow ones."""
+    keys_by_fingerprint: Dict[str, List[str]] = {}
+    for key, statement in plan.items():
+        keys_by_fingerprint.setdefault(statement.fingerprint, []).append(key)
+
+    def observe(sql: Optional[str], statements: List[Statement], seconds: float):
+        keys = [key for statement in statements for key in keys_by_fingerprint.get(statement.fingerprint, [])]
+        for key in keys:
+            STATEMENT_SECONDS.labels(key, ANALYTICS_ENGINE).observe(seconds)
+        if sql is not None:
+            slow_query_log.record(",".join(keys), sql, seconds, params)
+    return observe
+
+def run_columnar_statements(statements: List[Statement], on_statement=None) -> Dict[str, Any]:
+    # Append rows committed since the last refresh, then aggregate the snapshot
+    with ROLLUP_REFRESH_SECONDS.time():
+        columnar_engine.refresh()
+    start = perf_counter()
+    computed = columnar_engine.run_statements(statements)
+    if on_statement:
+        on_statement(None, statements, perf_counter() - start)
+    return computed
+
+def lookup_cached_statements(plan: Dict[str, Statement], db_version: int):
+    rows = {}
+    missing = {}
+    for statement in plan.values():
+        cached = result_cache.get(statement.fingerprint, db_version)
+        if cached is not None:
+            rows[statement.fingerprint] = cached
+        else:
+            missing[statement.fingerprint] = statement
+    return rows, list(missing.values())
+
+def store_computed_statements(computed: Dict[str, Any], rows: Dict[str, Any], db_version: int):
+    for fingerprint, statement_rows in computed.items():
+        result_cache.put(fingerprint, db_version, statement_rows)
+    rows.update(computed)
+
+def compute_analytics(metrics: Dict[str, Metric], db_version: int) -> Dict[str, Any]:
+    plan = plan_statements(metrics, ANALYTICS_SOURCES)
+    rows, missing = lookup_cached_statements(plan, db_version)
+
+    if missing and ANALYTICS_ENGINE == "numpy":
+        store_computed_statements(run_columnar_statements(missing, statement_observer(plan)), rows, db_version)
+    elif missing:
+        # Fold the changed rows into the rollup, then compute the remaining
+        # statements with one GROUPING SETS pass over the (much smaller) cube
+        with engine.begin() as connection:
+            if ANALYTICS_ENGINE == "rollup":
+                with ROLLUP_REFRESH_SECONDS.time():
+                    refresh_rollup(connection)
+            computed = run_statements(connection, missing, statement_observer(plan))
+        store_computed_statements(computed, rows, db_version)
+
+    return {key: shape_metric(metric, rows[plan[key].fingerprint]) for key, metric in metrics.items()}
+
+async def compute_analytics_async(metrics: Dict[str, Metric], db_version: int) -> Dict[str, Any]:
+    plan = plan_statements(metrics, ANALYTICS_SOURCES)
+    rows, missing = lookup_cached_statements(plan, db_version)
+
+    if missing and ANALYTICS_ENGINE == "numpy":
+        # Keep the NumPy kernels off the event loop
+        computed = await asyncio.to_thread(run_columnar_statements, missing, statement_observer(plan))
+        store_computed_statements(computed, rows, db_version)
+    elif missing:
+        if ANALYTICS_ENGINE == "rollup":
+            with ROLLUP_REFRESH_SECONDS.time():
+                async with async_engine.begin() as connection:
+                    await connection.run_sync(refresh_rollup)
+        # Fan the remaining statements out over pooled connections
+        computed = await run_statements_async(
+            async_engine, missing, ANALYTICS_QUERY_CONCURRENCY, statement_observer(plan)
+        )
+        store_computed_statements(computed, rows, db_version)
 
-app = FastAPI()
+    return {key: shape_metric(metric, rows[plan[key].fingerprint]) for key, metric in metrics.items()}
 
-def execute_cached_analytics(queries: dict, cache: AnalyticsCache):
-    db_last_updated = get_db_last_updated_timestamp()
+def execute_cached_analytics(metrics: Dict[str, Metric], cache: AnalyticsCache):
+    with STALENESS_CHECK_SECONDS.time():
+        db_version = get_db_data_version()
+    try:
+        return cache.get_or_refresh(db_version, lambda: compute_analytics(metrics, db_version))
+    except Exception as e:
+        # Errors are returned but not cached, so the next request retries
+        print(f"❌ SQL error for '{', '.join(metrics)}': {e}")
+        return {key: {"error": str(e)} for key in metrics}
 
-    if not cache.is_stale(db_last_updated):
-        return cache.get_cache()
+async def execute_cached_analytics_async(metrics: Dict[str, Metric], cache: AnalyticsCache):
+    with STALENESS_CHECK_SECONDS.time():
+        db_version = await get_db_data_version_async()
+    try:
+        return await cache.aget_or_refresh(db_version, lambda: compute_analytics_async(metrics, db_version))
+    except Exception as e:
+        print(f"❌ SQL error for '{', '.join(metrics)}': {e}")
+        return {key: {"error": str(e)} for key in metrics}
 
-    results = {}
-    with engine.connect() as connection:
-        for key, query in queries.items():
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def stream_analytics_ndjson(metrics: Dict[str, Metric]):
+    # Rows go from a server-side cursor to the client without materializing the result
+    plan = plan_statements(metrics, ANALYTICS_SOURCES)
+    for key, metric in metrics.items():
+        try:
+            async for row in stream_metric_rows(async_engine, metric, plan[key]):
+                yield ndjson_line(key, row)
+        except Exception as e:
+            print(f"❌ SQL error while streaming '{key}': {e}")
+            yield serialize_results({"metric": key, "error": str(e)}) + b"\n"
+
+async def cached_analytics_response(request: Request, metrics: Dict[str, Metric], cache: AnalyticsCache) -> Response:
+    """Serve an endpoint in the negotiated format (?format= or Accept).
+
+    Cached formats are rendered once per snapshot and carry an ETag made of
+    the data version, a hash of the database, the metric definitions and the format, so a
+    poll with a matching If-None-Match gets an empty 304. NDJSON is streamed
+    from the database instead. ?metric= narrows the response to one metric.
+    """
+    fmt = negotiate_format(request.query_params.get("format"), request.headers.get("accept", ""))
+    if fmt is None:
+        return JSONResponse({"error": f"Unsupported format, use one of: {', '.join(MEDIA_TYPES)}"}, status_code=406)
+    metric_key = request.query_params.get("metric")
+    if metric_key is not None and metric_key not in metrics:
+        return JSONResponse({"error": f"Unknown metric '{metric_key}'"}, status_code=404)
+    selected = {metric_key: metrics[metric_key]} if metric_key else metrics
+    if fmt == "arrow" and len(selected) != 1:
+        return JSONResponse({"error": "Arrow output holds a single table, pass ?metric=<name>"}, status_code=400)
+
+    if fmt == "ndjson":
+        if ANALYTICS_ENGINE == "rollup":
             try:
-                result_proxy = connection.execute(text(query))
-                columns = result_proxy.keys()
-                rows = result_proxy.fetchall()
-                results[key] = [dict(zip(columns, row)) for row in rows]
+                with ROLLUP_REFRESH_SECONDS.time():
+                    async with async_engine.begin() as connection:
+                        await connection.run_sync(refresh_rollup)
             except Exception as e:
-                print(f"❌ SQL error for '{key}': {e}")
-                results[key] = {"error": str(e)}
-
-    cache.update_cache(results, db_last_updated)
-    return results
-
-# Create individual caches for each analytics endpoint
-revenue_cache = AnalyticsCache()
-cancellation_cache = AnalyticsCache()
-geo_cache = AnalyticsCache()
-lead_time_cache = AnalyticsCache()
-other_cache = AnalyticsCache()
-
-@app.post("/analytics/revenue")
-def get_revenue_analysis():
-    queries = {
-        "monthly_revenue": """
-            SELECT DATE_TRUNC('month', arrival_date) AS month, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY month
-            ORDER BY month;
-        """,
-        "yearly_revenue": """
-            SELECT DATE_PART('year', arrival_date) AS year, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY year
-            ORDER BY year;
-        """,
-        "highest_revenue_month": """
-            SELECT TO_CHAR(arrival_date, 'Month YYYY') AS month_year,
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY month_year
-            ORDER BY total_revenue DESC
-            LIMIT 1;
-        """,
-        "last_6_months_revenue": """
-            SELECT DATE_TRUNC('month', arrival_date) AS month,
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            WHERE arrival_date >= CURRENT_DATE - INTERVAL '6 months'
-            GROUP BY month
-            ORDER BY month;
-        """,
-        "revenue_by_hotel_type": """
-            SELECT hotel, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY hotel
-            ORDER BY total_revenue DESC;
-        """,
-        "revenue_by_market_segment": """
-            SELECT market_segment, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY market_segment
-            ORDER BY total_revenue DESC;
-        """,
-        "revenue_by_country": """
-            SELECT country, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY total_revenue DESC;
-        """,
-        "revenue_by_cancellation_status": """
-            SELECT is_canceled, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY is_canceled;
-        """,
-        "revenue_by_room_type": """
-            SELECT reserved_room_type, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY reserved_room_type
-            ORDER BY total_revenue DESC;
-        """,
-        "revenue_by_special_requests": """
-            SELECT total_of_special_requests, 
-                   SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY total_of_special_requests
-            ORDER BY total_of_special_requests DESC;
-        """
-    }
-    return execute_cached_analytics(queries, revenue_cache)
-
-
-@app.post("/analytics/cancellations")
-def get_cancellations_analysis():
-     # Queries for Cancellation Rate Analysis
-    queries = {
-        # 📌 1️⃣ Overall Cancellation Rate
-        "overall_cancellation_rate": """
-            SELECT 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings;
-        """,
-
-        # 📌 2️⃣ Cancellation Rate by Hotel Type
-        "cancellation_by_hotel_type": """
-            SELECT 
-                hotel, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY hotel
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 3️⃣ Cancellation Rate Over Time (Monthly)
-        "cancellation_rate_by_month": """
-            SELECT 
-                DATE_TRUNC('month', arrival_date) AS month, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY month
-            ORDER BY month;
-        """,
-
-        # 📌 4️⃣ Cancellation Rate by Market Segment
-        "cancellation_by_market_segment": """
-            SELECT 
-                market_segment, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY market_segment
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 5️⃣ Cancellation Rate by Country
-        "cancellation_by_country": """
-            SELECT 
-                country, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY cancellation_rate DESC
-            LIMIT 10;
-        """,
-
-        # 📌 6️⃣ Cancellation Rate by Room Type
-        "cancellation_by_room_type": """
-            SELECT 
-                reserved_room_type, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY reserved_room_type
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 7️⃣ Impact of Lead Time on Cancellations
-        "cancellation_by_lead_time": """
-            SELECT 
-                CASE 
-                    WHEN lead_time < 7 THEN 'Last-minute'
-                    WHEN lead_time BETWEEN 7 AND 30 THEN 'Short-term'
-                    ELSE 'Long-term'
-                END AS booking_type,
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY booking_type
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 8️⃣ Impact of Special Requests on Cancellations
-        "cancellation_by_special_requests": """
-            SELECT 
-                total_of_special_requests, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY total_of_special_requests
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 9️⃣ Cancellation Rate by Deposit Type
-        "cancellation_by_deposit_type": """
-            SELECT 
-                deposit_type, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY deposit_type
-            ORDER BY cancellation_rate DESC;
-        """
-    }
-    return execute_cached_analytics(queries, cancellation_cache)
-
-@app.post("/analytics/geo")
-def get_geo_analytics():
-    # Queries for Geographical Analytics
-    queries = {
-        # 📌 1️⃣ Number of Bookings by Country
-        "bookings_by_country": """
-            SELECT 
-                country, 
-                COUNT(*) AS total_bookings
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY total_bookings DESC;
-        """,
-
-        # 📌 2️⃣ Percentage of Bookings by Country
-        "booking_percentage_by_country": """
-            SELECT 
-                country, 
-                COUNT(*) AS total_bookings,
-                ROUND(100.0 * COUNT(*) / SUM(COUNT(*)) OVER (), 2) AS booking_percentage
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY total_bookings DESC;
-        """,
-
-        # 📌 3️⃣ Revenue by Country
-        "revenue_by_country": """
-            SELECT 
-                country, 
-                SUM(adr * (stays_in_week_nights + stays_in_weekend_nights)) AS total_revenue
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY total_revenue DESC;
-        """,
-
-        # 📌 4️⃣ Cancellation Rate by Country
-        "cancellation_by_country": """
-            SELECT 
-                country, 
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY cancellation_rate DESC;
-        """,
-
-        # 📌 5️⃣ Top 10 Countries with Highest Bookings
-        "top_10_bookings_by_country": """
-            SELECT 
-                country, 
-                COUNT(*) AS total_bookings
-            FROM hotel_bookings
-            GROUP BY country
-            ORDER BY total_bookings DESC
-            LIMIT 10;
-        """,
-
-        # 📌 6️⃣ Geographical Distribution Over Time
-        "geo_distribution_over_time": """
-            SELECT 
-                DATE_TRUNC('month', arrival_date) AS month, 
-                country, 
-                COUNT(*) AS total_bookings
-            FROM hotel_bookings
-            GROUP BY month, country
-            ORDER BY month, total_bookings DESC;
-        """
-    }
-    return execute_cached_analytics(queries, geo_cache)
-
-@app.post("/analytics/lead_time")
-def get_lead_time_analytics():
-    # Queries for Lead Time Analytics
-    queries = {
-        # 📌 1️⃣ Average Lead Time
-        "average_lead_time": """
-            SELECT 
-                AVG(lead_time) AS average_lead_time
-            FROM hotel_bookings;
-        """,
-
-        # 📌 2️⃣ Lead Time Distribution
-        "lead_time_distribution": """
-            SELECT 
-                CASE 
-                    WHEN lead_time < 7 THEN 'Less than a week'
-                    WHEN lead_time BETWEEN 7 AND 30 THEN '1 week to 1 month'
-                    WHEN lead_time BETWEEN 31 AND 90 THEN '1 to 3 months'
-                    WHEN lead_time BETWEEN 91 AND 180 THEN '3 to 6 months'
-                    ELSE 'More than 6 months'
-                END AS lead_time_category,
-                COUNT(*) AS total_bookings
-            FROM hotel_bookings
-            GROUP BY lead_time_category
-            ORDER BY total_bookings DESC;
-        """,
-
-        # 📌 3️⃣ Percentage of Short-Term (Last-Minute) Bookings
-        "percentage_last_minute_bookings": """
-            SELECT 
-                ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM hotel_bookings), 2) AS percentage_last_minute_bookings
-            FROM hotel_bookings
-            WHERE lead_time < 7;
-        """,
-
-        # 📌 4️⃣ Lead Time by Hotel Type
-        "lead_time_by_hotel_type": """
-            SELECT 
-                hotel, 
-                AVG(lead_time) AS average_lead_time
-            FROM hotel_bookings
-            GROUP BY hotel
-            ORDER BY average_lead_time DESC;
-        """,
-
-        # 📌 5️⃣ Lead Time by Market Segment
-        "lead_time_by_market_segment": """
-            SELECT 
-                market_segment, 
-                AVG(lead_time) AS average_lead_time
-            FROM hotel_bookings
-            GROUP BY market_segment
-            ORDER BY average_lead_time DESC;
-        """,
-
-        # 📌 6️⃣ Impact of Lead Time on Cancellation Rate
-        "lead_time_cancellation_impact": """
-            SELECT 
-                CASE 
-                    WHEN lead_time < 7 THEN 'Last-minute'
-                    WHEN lead_time BETWEEN 7 AND 30 THEN '1 week to 1 month'
-                    ELSE 'Long-term'
-                END AS booking_category,
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) AS canceled_bookings,
-                ROUND(100.0 * SUM(CASE WHEN is_canceled = TRUE THEN 1 ELSE 0 END) / COUNT(*), 2) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY booking_category
-            ORDER BY cancellation_rate DESC;
-        """
-    }
-    return execute_cached_analytics(queries, lead_time_cache)
-
-@app.post("/analytics/others")
-def get_other_analytics():
-    queries = {
-        # 📌 1️⃣ Cancellation Rate by Special Requests (Fixed)
-        "special_requests_vs_cancellations": """
-            SELECT total_of_special_requests, 
-                   SUM(CASE WHEN is_canceled THEN 1 ELSE 0 END) * 100.0 / COUNT(*) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY total_of_special_requests;
-        """,
-
-        # 📌 2️⃣ Cancellation Rate by Deposit Type (Fixed)
-        "deposit_type_vs_cancellation": """
-            SELECT deposit_type, 
-                   SUM(CASE WHEN is_canceled THEN 1 ELSE 0 END) * 100.0 / COUNT(*) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY deposit_type;
-        """,
-
-        # 📌 3️⃣ Cancellation Rate by Lead Time (Fixed)
-        "lead_time_cancellation_impact": """
-            SELECT 
-                CASE 
-                    WHEN lead_time < 7 THEN 'Last-minute'
-                    WHEN lead_time BETWEEN 7 AND 30 THEN 'Short-term'
-                    ELSE 'Long-term'
-                END AS booking_type,
-                COUNT(*) AS total_bookings,
-                SUM(CASE WHEN is_canceled THEN 1 ELSE 0 END) * 100.0 / COUNT(*) AS cancellation_rate
-            FROM hotel_bookings
-            GROUP BY booking_type
-            ORDER BY cancellation_rate DESC;
-        """
-    }
-    return execute_cached_analytics(queries, other_cache)
+                print(f"❌ SQL error for '{', '.join(selected)}': {e}")
+                return JSONResponse({key: {"error": str(e)} for key in selected})
+        return StreamingResponse(stream_analytics_ndjson(selected), media_type=MEDIA_TYPES["ndjson"])
+
+    results = await execute_cached_analytics_async(metrics, cache)
+    if results is not cache.get_cache():
+        return JSONResponse(results)  # errors are not cached, so they get no ETag
+
+    def render(data: Dict[str, Any]) -> bytes:
+        if fmt == "arrow":
+            return to_arrow(metric_columns(selected[metric_key]), data[metric_key])
+        if fmt == "columns":
+            return to_columns(selected, data)
+        return serialize_results({key: data[key] for key in selected})
+
+    variant = f"{fmt}:{metric_key or ''}"
+    version, body = cache.get_serialized(variant, render)
+    digest = hashlib.sha1(f"{cache.scope()}{variant}".encode()).hexdigest()[:12]
+    etag = f'"{version}-{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+# Create individual caches for each analytics endpoint. With stale-while-revalidate
+# on, requests get the previous snapshot while one background refresh runs, for
+# at most ANALYTICS_MAX_STALENESS seconds after the data changed.
+ANALYTICS_STALE_WHILE_REVALIDATE = os.getenv("ANALYTICS_STALE_WHILE_REVALIDATE", "true").lower() == "true"
+ANALYTICS_MAX_STALENESS = float(os.getenv("ANALYTICS_MAX_STALENESS", "30"))
+# "shared" keeps one snapshot per endpoint for all uvicorn workers on the node
+ANALYTICS_CACHE_BACKEND = os.getenv("ANALYTICS_CACHE_BACKEND", "shared")
+ANALYTICS_CACHE_DIR = os.getenv("ANALYTICS_CACHE_DIR")
+
+@lru_cache(maxsize=None)
+def metric_definitions_digest(endpoint: str) -> str:
+    # First called by a request, once ENDPOINT_METRICS below is complete
+    return hashlib.sha256(repr(ENDPOINT_METRICS[endpoint]).encode()).hexdigest()[:16]
+
+def new_analytics_cache(name: str) -> AnalyticsCache:
+    # Snapshots are scoped to the database and the endpoint's metric definitions,
+    # so neither a recreated database nor a changed metric is served old results
+    backend = SharedFileBackend(name, ANALYTICS_CACHE_DIR) if ANALYTICS_CACHE_BACKEND == "shared" else None
+    return AnalyticsCache(
+        stale_while_revalidate=ANALYTICS_STALE_WHILE_REVALIDATE,
+        max_staleness=ANALYTICS_MAX_STALENESS,
+        backend=backend,
+        on_lookup=lambda result: CACHE_REQUESTS.labels(name, result).inc(),
+        scope=lambda: f"{get_db_identity()}/{metric_definitions_digest(name)}",
+    )
+
+revenue_cache = new_analytics_cache("revenue")
+cancellation_cache = new_analytics_cache("cancellations")
+geo_cache = new_analytics_cache("geo")
+lead_time_cache = new_analytics_cache("lead_time")
+other_cache = new_analytics_cache("others")
+
+REVENUE_METRICS = {
+    "monthly_revenue": Metric(("month",), ("month", "total_revenue"), order_by=(("month", "ASC"),)),
+    "yearly_revenue": Metric(("year",), ("year", "total_revenue"), order_by=(("year", "ASC"),)),
+    "highest_revenue_month": Metric(
+        ("month_year",), ("month_year", "total_revenue"),
+        order_by=(("total_revenue", "DESC"),), limit=1
+    ),
+    "last_6_months_revenue": Metric(
+        ("month",), ("month", ("total_revenue", "recent_revenue")),
+        order_by=(("month", "ASC"),), having="recent_bookings", prune=("recent",)
+    ),
+    "revenue_by_hotel_type": Metric(("hotel",), ("hotel", "total_revenue"), order_by=(("total_revenue", "DESC"),)),
+    "revenue_by_market_segment": Metric(
+        ("market_segment",), ("market_segment", "total_revenue"), order_by=(("total_revenue", "DESC"),)
+    ),
+    "revenue_by_country": Metric(("country",), ("country", "total_revenue"), order_by=(("total_revenue", "DESC"),)),
+    "revenue_by_cancellation_status": Metric(("is_canceled",), ("is_canceled", "total_revenue")),
+    "revenue_by_room_type": Metric(
+        ("reserved_room_type",), ("reserved_room_type", "total_revenue"), order_by=(("total_revenue", "DESC"),)
+    ),
+    "revenue_by_special_requests": Metric(
+        ("total_of_special_requests",), ("total_of_special_requests", "total_revenue"),
+        order_by=(("total_of_special_requests", "DESC"),)
+    ),
+}
+
+@app.api_route("/analytics/revenue", methods=["GET", "POST"])
+async def get_revenue_analysis(request: Request):
+    return await cached_analytics_response(request, REVENUE_METRICS, revenue_cache)
+
+
+# Queries for Cancellation Rate Analysis
+CANCELLATION_COLUMNS = ("total_bookings", "canceled_bookings", "cancellation_rate")
+BY_CANCELLATION_RATE = (("cancellation_rate", "DESC"),)
+
+CANCELLATION_METRICS = {
+    # 📌 1️⃣ Overall Cancellation Rate
+    "overall_cancellation_rate": Metric((), CANCELLATION_COLUMNS),
+
+    # 📌 2️⃣ Cancellation Rate by Hotel Type
+    "cancellation_by_hotel_type": Metric(("hotel",), ("hotel",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE),
+
+    # 📌 3️⃣ Cancellation Rate Over Time (Monthly)
+    "cancellation_rate_by_month": Metric(("month",), ("month",) + CANCELLATION_COLUMNS, order_by=(("month", "ASC"),)),
+
+    # 📌 4️⃣ Cancellation Rate by Market Segment
+    "cancellation_by_market_segment": Metric(
+        ("market_segment",), ("market_segment",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+
+    # 📌 5️⃣ Cancellation Rate by Country
+    "cancellation_by_country": Metric(
+        ("country",), ("country",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE, limit=10
+    ),
+
+    # 📌 6️⃣ Cancellation Rate by Room Type
+    "cancellation_by_room_type": Metric(
+        ("reserved_room_type",), ("reserved_room_type",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+
+    # 📌 7️⃣ Impact of Lead Time on Cancellations
+    "cancellation_by_lead_time": Metric(
+        ("booking_type",), ("booking_type",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+
+    # 📌 8️⃣ Impact of Special Requests on Cancellations
+    "cancellation_by_special_requests": Metric(
+        ("total_of_special_requests",), ("total_of_special_requests",) + CANCELLATION_COLUMNS,
+        order_by=BY_CANCELLATION_RATE
+    ),
+
+    # 📌 9️⃣ Cancellation Rate by Deposit Type
+    "cancellation_by_deposit_type": Metric(
+        ("deposit_type",), ("deposit_type",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+}
+
+@app.api_route("/analytics/cancellations", methods=["GET", "POST"])
+async def get_cancellations_analysis(request: Request):
+    return await cached_analytics_response(request, CANCELLATION_METRICS, cancellation_cache)
+
+# Queries for Geographical Analytics
+GEO_METRICS = {
+    # 📌 1️⃣ Number of Bookings by Country
+    "bookings_by_country": Metric(("country",), ("country", "total_bookings"), order_by=(("total_bookings", "DESC"),)),
+
+    # 📌 2️⃣ Percentage of Bookings by Country
+    "booking_percentage_by_country": Metric(
+        ("country",), ("country", "total_bookings", "booking_percentage"), order_by=(("total_bookings", "DESC"),)
+    ),
+
+    # 📌 3️⃣ Revenue by Country
+    "revenue_by_country": Metric(("country",), ("country", "total_revenue"), order_by=(("total_revenue", "DESC"),)),
+
+    # 📌 4️⃣ Cancellation Rate by Country
+    "cancellation_by_country": Metric(
+        ("country",), ("country",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+
+    # 📌 5️⃣ Top 10 Countries with Highest Bookings
+    "top_10_bookings_by_country": Metric(
+        ("country",), ("country", "total_bookings"), order_by=(("total_bookings", "DESC"),), limit=10
+    ),
+
+    # 📌 6️⃣ Geographical Distribution Over Time
+    "geo_distribution_over_time": Metric(
+        ("month", "country"), ("month", "country", "total_bookings"),
+        order_by=(("month", "ASC"), ("total_bookings", "DESC"))
+    ),
+}
+
+@app.api_route("/analytics/geo", methods=["GET", "POST"])
+async def get_geo_analytics(request: Request):
+    return await cached_analytics_response(request, GEO_METRICS, geo_cache)
+
+# Queries for Lead Time Analytics
+LEAD_TIME_METRICS = {
+    # 📌 1️⃣ Average Lead Time
+    "average_lead_time": Metric((), ("average_lead_time",)),
+
+    # 📌 2️⃣ Lead Time Distribution
+    "lead_time_distribution": Metric(
+        ("lead_time_category",), ("lead_time_category", "total_bookings"), order_by=(("total_bookings", "DESC"),)
+    ),
+
+    # 📌 3️⃣ Percentage of Short-Term (Last-Minute) Bookings
+    "percentage_last_minute_bookings": Metric((), ("percentage_last_minute_bookings",)),
+
+    # 📌 4️⃣ Lead Time by Hotel Type
+    "lead_time_by_hotel_type": Metric(
+        ("hotel",), ("hotel", "average_lead_time"), order_by=(("average_lead_time", "DESC"),)
+    ),
+
+    # 📌 5️⃣ Lead Time by Market Segment
+    "lead_time_by_market_segment": Metric(
+        ("market_segment",), ("market_segment", "average_lead_time"), order_by=(("average_lead_time", "DESC"),)
+    ),
+
+    # 📌 6️⃣ Impact of Lead Time on Cancellation Rate
+    "lead_time_cancellation_impact": Metric(
+        ("booking_category",), ("booking_category",) + CANCELLATION_COLUMNS, order_by=BY_CANCELLATION_RATE
+    ),
+}
+
+@app.api_route("/analytics/lead_time", methods=["GET", "POST"])
+async def get_lead_time_analytics(request: Request):
+    return await cached_analytics_response(request, LEAD_TIME_METRICS, lead_time_cache)
+
+OTHER_METRICS = {
+    # 📌 1️⃣ Cancellation Rate by Special Requests (Fixed)
+    "special_requests_vs_cancellations": Metric(
+        ("total_of_special_requests",),
+        ("total_of_special_requests", ("cancellation_rate", "unrounded_cancellation_rate"))
+    ),
+
+    # 📌 2️⃣ Cancellation Rate by Deposit Type (Fixed)
+    "deposit_type_vs_cancellation": Metric(
+        ("deposit_type",), ("deposit_type", ("cancellation_rate", "unrounded_cancellation_rate"))
+    ),
+
+    # 📌 3️⃣ Cancellation Rate by Lead Time (Fixed)
+    "lead_time_cancellation_impact": Metric(
+        ("booking_type",),
+        ("booking_type", "total_bookings", ("cancellation_rate", "unrounded_cancellation_rate")),
+        order_by=BY_CANCELLATION_RATE
+    ),
+}
+
+@app.api_route("/analytics/others", methods=["GET", "POST"])
+async def get_other_analytics(request: Request):
+    return await cached_analytics_response(request, OTHER_METRICS, other_cache)
+
+ENDPOINT_METRICS = {
+    "revenue": REVENUE_METRICS,
+    "cancellations": CANCELLATION_METRICS,
+    "geo": GEO_METRICS,
+    "lead_time": LEAD_TIME_METRICS,
+    "others": OTHER_METRICS,
+}
+
+# Slices the rollup can't answer (e.g. dates within a month with a hotel) scan hotel_bookings
+SLICE_SOURCES = ANALYTICS_SOURCES if BOOKINGS in ANALYTICS_SOURCES else ANALYTICS_SOURCES + (BOOKINGS,)
+
+# Sliced results by (endpoint, metric definitions, metric, normalized filter),
+# kept for one data version of one database
+slice_cache = ResultCache(
+    max_bytes=int(os.getenv("ANALYTICS_SLICE_CACHE_BYTES", str(32 * 1024 * 1024))), scope=get_db_identity
+)
+
+async def compute_slice(metrics: Dict[str, Metric], slice_filter: SliceFilter) -> Dict[str, Any]:
+    # The statement SQL only depends on which filters are set, so asyncpg's
+    # prepared statement cache reuses one server-side plan per filter shape
+    plan = plan_statements(metrics, SLICE_SOURCES, slice_filter.filter_names())
+    params = slice_filter.params()
+    if ANALYTICS_ENGINE == "rollup":
+        with ROLLUP_REFRESH_SECONDS.time():
+            async with async_engine.begin() as connection:
+                await connection.run_sync(refresh_rollup)
+    rows = await run_statements_async(
+        async_engine, list(plan.values()), ANALYTICS_QUERY_CONCURRENCY, statement_observer(plan, params), params
+    )
+    return {key: shape_metric(metric, rows[plan[key].fingerprint]) for key, metric in metrics.items()}
+
+@app.get("/analytics/{endpoint}/slice")
+async def get_analytics_slice(
+    endpoint: str,
+    metric: List[str] = Query(None, description="Metrics of the endpoint to compute (default: all)"),
+    start: Optional[date] = Query(None, description="First arrival date, inclusive"),
+    end: Optional[date] = Query(None, description="Last arrival date, inclusive"),
+    hotel: List[str] = Query(None),
+    country: List[str] = Query(None),
+    market_segment: List[str] = Query(None),
+):
+    """An endpoint's metrics over the bookings matching the filters; repeat a parameter to match several values."""
+    if endpoint not in ENDPOINT_METRICS:
+        return JSONResponse({"error": f"Unknown analytics endpoint '{endpoint}'"}, status_code=404)
+    metrics = ENDPOINT_METRICS[endpoint]
+    unknown = [key for key in metric or () if key not in metrics]
+    if unknown:
+        return JSONResponse({"error": f"Unknown metric '{unknown[0]}'"}, status_code=404)
+    try:
+        slice_filter = SliceFilter.normalize(start, end, hotel, country, market_segment)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    selected = {key: metrics[key] for key in (metric or metrics)}
+    with STALENESS_CHECK_SECONDS.time():
+        db_version = await get_db_data_version_async()
+    filter_key = slice_filter.cache_key()
+    definitions = metric_definitions_digest(endpoint)
+    results: Dict[str, Any] = {}
+    missing: Dict[str, Metric] = {}
+    for key, definition in selected.items():
+        cached = slice_cache.get(f"{endpoint}/{definitions}/{key}?{filter_key}", db_version)
+        CACHE_REQUESTS.labels("slice", "hit" if cached is not None else "miss").inc()
+        if cached is not None:
+            results[key] = cached
+        else:
+            missing[key] = definition
+    if missing:
+        try:
+            computed = await compute_slice(missing, slice_filter)
+            for key, rows in computed.items():
+                slice_cache.put(f"{endpoint}/{definitions}/{key}?{filter_key}", db_version, rows)
+            results.update(computed)
+        except Exception as e:
+            print(f"❌ SQL error for the '{endpoint}' slice {filter_key}: {e}")
+            results.update({key: {"error": str(e)} for key in missing})
+
+    body = {"filters": slice_filter.as_dict(), "data_version": db_version, "results": {key: results[key] for key in selected}}
+    return Response(content=serialize_results(body), media_type="application/json")
 
 PDF_FILES = {
     "Revenue": "data/revenue_answers.pdf",
@@ -437,125 +564,463 @@ PDF_FILES = {
 }
 
 chat_history={}
+# Parsed once and reparsed only when a PDF's content changes (see pdf_corpus.py)
+pdf_corpus = PdfCorpusCache(PDF_FILES, os.getenv("PDF_CORPUS_CACHE", "data/.pdf_corpus_cache.json"))
+
 # === Utility to extract answers ===
 def extract_answers_from_pdfs():
-    data = []
-    for section, filename in PDF_FILES.items():
-        reader = PdfReader(f"{filename}")
-        text = "\n".join([p.extract_text() for p in reader.pages if p.extract_text()])
-        lines = [line.strip() for line in text.split("\n") if line.strip()]
-        answers = [line for line in lines if any(char.isdigit() for char in line[:3])]
-        for i, answer in enumerate(answers, 1):
-            data.append({
-                "section": section,
-                "index": i,
-                "text": answer
-            })
-    return data
+    with ASK_STAGE_SECONDS.labels("pdf_extraction").time():
+        return pdf_corpus.get()
 
 
 # === Connect to Weaviate ===
-def connect_weaviate():
-    return weaviate.connect_to_local()
+weaviate_store = WeaviateStore(health_interval=float(os.getenv("WEAVIATE_HEALTH_INTERVAL", "30")))
 
-# === Single Endpoint: Load PDFs & Run RAG ===
-@app.post("/ask")
-def ask(
-    query: str = Query(..., description="Ask a question about the hotel analytics reports"),
-    ground_truth: str = Query(None, description="Optional expected answer for similarity check")
-):
-    start = time()
-    with engine.connect() as conn:
-        check_query = text("""
-            SELECT generated_response, faithfulness_score
-            FROM query_history
-            WHERE user_query = :query
-        """)
-        result = conn.execute(check_query, {"query": query}).fetchone()
+# Answers to paraphrased questions, matched by embedding similarity and only
+# valid for the analytics data version they were answered at
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+semantic_cache = SemanticAnswerCache(
+    weaviate_store,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+) if SEMANTIC_CACHE_ENABLED else None
+
+# Answers are upserted and deleted by content hash, so a changed PDF only
+# re-indexes (and re-embeds) the answers that actually changed
+corpus_sync = CorpusSync(weaviate_store, os.getenv("EMBEDDING_CACHE", "data/.embedding_cache.json"))
+
+def bootstrap_weaviate(data):
+    # One bootstrap at a time; requests that waited for it find it done
+    with weaviate_store.bootstrap_lock:
+        if weaviate_store.bootstrapped and corpus_sync.is_synced(data):
+            return
+        if semantic_cache:
+            semantic_cache.bootstrap()
+        weaviate_store.bootstrap()
+        corpus_sync.sync(data)
+
+def ensure_weaviate():
+    # Normally done at startup; retried here if Weaviate was down then, and
+    # re-synced when a report PDF changed since. Checking the PDFs costs a
+    # stat() each, so it isn't timed as a pdf_extraction.
+    data = pdf_corpus.get()
+    if not weaviate_store.bootstrapped or not corpus_sync.is_synced(data):
+        bootstrap_weaviate(data)
+
+# Exact-match answers by normalized question: in-process LRU, then query_history
+answer_cache = AnswerCache(
+    engine,
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "300")),
+)
+
+# Questions that are lookups into an analytics metric ("What was the revenue
+# in July 2017?") are answered from the endpoint's AnalyticsCache with a
+# template; everything else goes to the answer caches and RAG
+QUESTION_ROUTER_ENABLED = os.getenv("QUESTION_ROUTER_ENABLED", "true").lower() == "true"
+ENDPOINT_CACHES = {
+    "revenue": revenue_cache,
+    "cancellations": cancellation_cache,
+    "geo": geo_cache,
+    "lead_time": lead_time_cache,
+    "others": other_cache,
+}
+question_router = QuestionRouter(
+    lambda endpoint: execute_cached_analytics(ENDPOINT_METRICS[endpoint], ENDPOINT_CACHES[endpoint])
+)
+
+def routed_answer(query: str, start: float):
+    """An /ask response answered from the analytics results, or None if the question needs RAG."""
+    if not QUESTION_ROUTER_ENABLED:
+        return None
+    try:
+        with ASK_STAGE_SECONDS.labels("routing").time():
+            routed = question_router.route(query)
+    except Exception as e:
+        print(f"⚠️ Question routing failed, falling back to RAG: {e}")
+        return None
+    if routed is None:
+        return None
+    ASK_ROUTES.labels("analytics").inc()
+    duration = time() - start
+    return {
+        "query_id": None,
+        "question": query,
+        "generated_answer": routed.answer,
+        "faithfullness": None,
+        "evaluation_status": None,
+        "route": "analytics",
+        "analytics": {"endpoint": routed.endpoint, "metric": routed.metric, "intent": routed.route},
+        "response_time": f"{duration:.3f} seconds",
+    }
 
+def cached_answer(query: str, start: float):
+    """An /ask response from the exact or semantic answer cache (or None), plus the data version."""
+    with ASK_STAGE_SECONDS.labels("history_lookup").time():
+        result = answer_cache.get(query)
     if result:
         # Query found in cache, return cached response
         print("✅ Returning cached result")
+        ASK_ROUTES.labels("answer_cache").inc()
         duration = time() - start
         return {
+            "query_id": result["id"],
             "question": query,
-            "generated_answer": result.generated_response,
-            "faithfullness": result.faithfulness_score,
+            "generated_answer": result["generated_response"],
+            "faithfullness": result["faithfulness_score"],
+            "evaluation_status": result["evaluation_status"],
+            "route": "answer_cache",
             "response_time": f"{duration:.3f} seconds",
             "cached": True
-        }
-    
-    
-    data = extract_answers_from_pdfs()
-    client = connect_weaviate()
-    if not client.collections.exists("HotelAnalytics"):
-        client.collections.create(
-            name="HotelAnalytics",
-            vectorizer_config=Configure.Vectorizer.text2vec_ollama(
-                model="nomic-embed-text",
-                api_endpoint="http://host.docker.internal:11434"
-            ),
-            generative_config=Configure.Generative.ollama(
-                model="llama3.2",
-                api_endpoint="http://host.docker.internal:11434"
-            )
-        )
+        }, None
 
-    col = client.collections.get("HotelAnalytics")
-    aggregation = col.aggregate.over_all(total_count=True)
-    existing_count = aggregation.total_count
-    if existing_count == 0:
-        with col.batch.dynamic() as batch:
-            for item in data:
-                batch.add_object({
-                    "section": item["section"],
-                    "index": item["index"],
-                    "text": item["text"]
-                })
-
-
-    response = col.generate.near_text(
-        query=query,
-        limit=4,
-        grouped_task="Answer the question in a paragraph using the following context."
-    )
+    ensure_weaviate()
+    data_version = get_db_data_version()
+    match = None
+    if semantic_cache:
+        try:
+            with ASK_STAGE_SECONDS.labels("semantic_lookup").time():
+                match = semantic_cache.lookup(query, data_version)
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed: {e}")
+    if match:
+        print(f"✅ Returning semantically cached result ({match.similarity:.3f})")
+        # The original question's row has the latest faithfulness score
+        stored = answer_cache.get(match.question)
+        ASK_ROUTES.labels("semantic_cache").inc()
+        duration = time() - start
+        return {
+            "query_id": stored["id"] if stored else None,
+            "question": query,
+            "generated_answer": match.answer,
+            "faithfullness": stored["faithfulness_score"] if stored else None,
+            "evaluation_status": stored["evaluation_status"] if stored else None,
+            "matched_question": match.question,
+            "similarity": round(match.similarity, 4),
+            "route": "semantic_cache",
+            "response_time": f"{duration:.3f} seconds",
+            "cached": True
+        }, data_version
+    return None, data_version
 
-    client.close()
-    answer = str(response.generated)  # Ensures string
-   
-    evaluation_data = {
-        "question": [query],
-        "answer": [answer],
-        "contexts":[[item["text"] for item in data]],
-        "ground_truth": [str(ground_truth)] 
-    }
+def store_answer(query: str, answer: str, contexts, ground_truth, data_version: int):
+    """Save a generated answer to both caches and queue its evaluation; returns (query_id, evaluation_status)."""
+    # Faithfulness (when ground_truth is given) is judged in the background
+    # against the retrieved chunks; poll /ask/{query_id}/faithfulness for it
+    evaluation_status = "pending" if ground_truth else None
+    with ASK_STAGE_SECONDS.labels("insert").time():
+        query_id = answer_cache.put(query, answer, evaluation_status=evaluation_status)
+    if ground_truth:
+        evaluation_queue.submit(EvaluationItem(query_id, query, answer, tuple(contexts), str(ground_truth)))
+    if semantic_cache:
+        try:
+            semantic_cache.add(query, answer, data_version)
+        except Exception as e:
+            print(f"⚠️ Could not add the answer to the semantic cache: {e}")
+    return query_id, evaluation_status
 
-  
-    dataset = Dataset.from_dict(evaluation_data)
+# === Single Endpoint: Load PDFs & Run RAG ===
+@app.post("/ask")
+def ask(
+    query: str = Query(..., description="Ask a question about the hotel analytics reports"),
+    ground_truth: str = Query(None, description="Optional expected answer for similarity check")
+):
+    if not RAG_ENABLED:
+        return JSONResponse({"error": "/ask is disabled on this worker (RAG_ENABLED=false)"}, status_code=503)
+    start = time()
+    routed = routed_answer(query, start)
+    if routed:
+        return routed
+    cached, data_version = cached_answer(query, start)
+    if cached:
+        return cached
 
-    # Evaluate faithfulness if ground_truth is provided
-    results = {}
-    if ground_truth:
-        results = evaluate(dataset, metrics=[faithfulness],llm=evaluator_llm,embeddings=evaluator_embeddings)
-    
+    # Weaviate retrieves and generates in one call, so the two are timed together
+    with ASK_STAGE_SECONDS.labels("retrieval_generation").time():
+        response = weaviate_store.run(lambda col: col.generate.near_text(
+            query=query,
+            limit=4,
+            grouped_task=GROUNDED_TASK
+        ))
+
+    answer = str(response.generated)  # Ensures string
+    contexts = [obj.properties["text"] for obj in response.objects]
+    query_id, evaluation_status = store_answer(query, answer, contexts, ground_truth, data_version)
+    ASK_ROUTES.labels("rag").inc()
     duration = time() - start
-    with engine.begin() as conn:
-
-        insert_query = text("""
-            INSERT INTO query_history (user_query, generated_response, faithfulness_score)
-            VALUES (:query, :answer, :score)
-        """)
-        conn.execute(insert_query, {
-            "query": query,
-            "answer": answer,
-            "score": results['faithfulness'][0]
-        })
 
     return {
+        "query_id": query_id,
         "question": query,
         "generated_answer": answer,
-        "faithfullness": results['faithfulness'],
+        "faithfullness": None,
+        "evaluation_status": evaluation_status,
+        "route": "rag",
         "response_time":f"{duration} seconds"
     }
 
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + serialize_results(data) + b"\n\n"
+
+async def stream_answer(query: str, ground_truth):
+    start = time()
+    try:
+        routed = await asyncio.to_thread(routed_answer, query, start)
+        if routed:
+            yield sse_event("answer", routed)
+            yield sse_event("done", {"query_id": None, "response_time": time() - start, "route": "analytics"})
+            return
+        cached, data_version = await asyncio.to_thread(cached_answer, query, start)
+        if cached:
+            yield sse_event("answer", cached)
+            yield sse_event("done", {
+                "query_id": cached["query_id"], "response_time": time() - start, "route": cached["route"], "cached": True,
+            })
+            return
+
+        # Retrieval first, so the client can show the sources while the model works
+        with ASK_STAGE_SECONDS.labels("retrieval").time():
+            response = await asyncio.to_thread(
+                weaviate_store.run, lambda col: col.query.near_text(query=query, limit=4)
+            )
+        objects = [dict(obj.properties) for obj in response.objects]
+        contexts = [obj["text"] for obj in objects]
+        retrieval_time = time() - start
+        yield sse_event("retrieval", {"contexts": objects, "retrieval_time": retrieval_time})
+
+        tokens = []
+        first_token_time = None
+        generation_start = perf_counter()
+        async for token in stream_generate(grounded_prompt(query, contexts)):
+            if first_token_time is None:
+                first_token_time = time() - start
+            tokens.append(token)
+            yield sse_event("token", {"token": token})
+        ASK_STAGE_SECONDS.labels("generation").observe(perf_counter() - generation_start)
+
+        answer = "".join(tokens)
+        query_id, evaluation_status = await asyncio.to_thread(
+            store_answer, query, answer, contexts, ground_truth, data_version
+        )
+        ASK_ROUTES.labels("rag").inc()
+        yield sse_event("done", {
+            "query_id": query_id,
+            "evaluation_status": evaluation_status,
+            "retrieval_time": retrieval_time,
+            "time_to_first_token": first_token_time,
+            "response_time": time() - start,
+            "route": "rag",
+            "cached": False,
+        })
+    except Exception as e:
+        print(f"❌ Streaming /ask failed: {e}")
+        yield sse_event("error", {"error": str(e)})
+
+@app.post("/ask/stream")
+async def ask_stream(
+    query: str = Query(..., description="Ask a question about the hotel analytics reports"),
+    ground_truth: str = Query(None, description="Optional expected answer for similarity check")
+):
+    """Server-Sent Events: `retrieval`, then one `token` per generated chunk, then `done` with timings.
+
+    Questions answered from the analytics results or the caches send a single
+    `answer` event instead of retrieval and tokens; `done` reports the route.
+    """
+    if not RAG_ENABLED:
+        return JSONResponse({"error": "/ask is disabled on this worker (RAG_ENABLED=false)"}, status_code=503)
+    return StreamingResponse(
+        stream_answer(query, ground_truth),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BatchQuestion(BaseModel):
+    query: str
+    ground_truth: Optional[str] = None
+
+class BatchAskRequest(BaseModel):
+    questions: List[BatchQuestion]
+    concurrency: int = Field(default=int(os.getenv("ASK_BATCH_CONCURRENCY", "4")), ge=1, le=32)
+
+async def answer_batch_misses(questions: List[BatchQuestion], indexes: List[int], concurrency: int, start: float):
+    """Yield (index, answer, contexts, timing) as generations finish; errors come back as exceptions."""
+    async with new_client() as client:
+        # One embedding call for every question, then the vector searches side by side
+        with ASK_STAGE_SECONDS.labels("retrieval").time():
+            vectors = await embed([questions[i].query for i in indexes], client)
+            retrievals = await asyncio.gather(*(
+                asyncio.to_thread(weaviate_store.run, lambda col, v=vector: col.query.near_vector(near_vector=v, limit=4))
+                for vector in vectors
+            ))
+        retrieval_time = time() - start
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer_one(index: int, retrieved):
+            contexts = [obj.properties["text"] for obj in retrieved.objects]
+            async with semaphore:
+                generation_start = time()
+                try:
+                    with ASK_STAGE_SECONDS.labels("generation").time():
+                        answer = await generate(grounded_prompt(questions[index].query, contexts), client)
+                except Exception as e:
+                    return index, e, contexts, {}
+            return index, answer, contexts, {
+                "retrieval_time": retrieval_time,
+                "generation_time": time() - generation_start,
+            }
+
+        for finished in asyncio.as_completed([answer_one(i, r) for i, r in zip(indexes, retrievals)]):
+            yield await finished
+
+def save_batch_answers(questions: List[BatchQuestion], generated, data_version: int) -> List[int]:
+    """Save (index, answer, contexts) generations with one upsert, then queue evaluation and add them to the semantic cache."""
+    ground_truths = [questions[i].ground_truth for i, _, _ in generated]
+    with ASK_STAGE_SECONDS.labels("insert").time():
+        ids = answer_cache.put_many([
+            (questions[i].query, answer, None, "pending" if truth else None)
+            for (i, answer, _), truth in zip(generated, ground_truths)
+        ])
+    for (i, answer, contexts), truth, query_id in zip(generated, ground_truths, ids):
+        if truth:
+            evaluation_queue.submit(EvaluationItem(query_id, questions[i].query, answer, tuple(contexts), truth))
+    if semantic_cache:
+        try:
+            semantic_cache.add_many([(questions[i].query, answer) for i, answer, _ in generated], data_version)
+        except Exception as e:
+            print(f"⚠️ Could not add the answers to the semantic cache: {e}")
+    return ids
+
+async def stream_batch_answers(questions: List[BatchQuestion], concurrency: int):
+    start = time()
+    routed = await asyncio.to_thread(lambda: [routed_answer(q.query, start) for q in questions])
+    with ASK_STAGE_SECONDS.labels("history_lookup").time():
+        rows = await asyncio.to_thread(answer_cache.get_many, [q.query for q in questions])
+    rows = [None if answer else row for answer, row in zip(routed, rows)]
+    # Paraphrases with the same normalized text are generated once
+    first_by_hash: Dict[str, int] = {}
+    misses: Dict[int, List[int]] = {}
+    for index, (question, row) in enumerate(zip(questions, rows)):
+        if routed[index]:
+            yield serialize_results({"index": index, **routed[index], "response_time": time() - start}) + b"\n"
+        elif row:
+            ASK_ROUTES.labels("answer_cache").inc()
+            yield serialize_results({
+                "index": index,
+                "query_id": row["id"],
+                "question": question.query,
+                "generated_answer": row["generated_response"],
+                "faithfullness": row["faithfulness_score"],
+                "evaluation_status": row["evaluation_status"],
+                "route": "answer_cache",
+                "response_time": time() - start,
+                "cached": True,
+            }) + b"\n"
+        else:
+            first = first_by_hash.setdefault(query_hash(question.query), index)
+            misses.setdefault(first, []).append(index)
+
+    query_ids = [row["id"] if row else None for row in rows]
+    generated = 0
+    unsaved = []  # saved every `concurrency` answers, so a disconnect loses none of them
+
+    async def save():
+        chunk = unsaved[:]
+        unsaved.clear()
+        try:
+            ids = await asyncio.to_thread(save_batch_answers, questions, chunk, data_version)
+        except Exception as e:
+            print(f"❌ Could not save {len(chunk)} batch answers: {e}")
+            return
+        for (i, _, _), query_id in zip(chunk, ids):
+            for duplicate in misses[i]:
+                query_ids[duplicate] = query_id
+
+    try:
+        if misses:
+            try:
+                await asyncio.to_thread(ensure_weaviate)
+                data_version = await asyncio.to_thread(get_db_data_version)
+                async for index, answer, contexts, timing in answer_batch_misses(questions, list(misses), concurrency, start):
+                    if not isinstance(answer, Exception):
+                        ASK_ROUTES.labels("rag").inc(len(misses[index]))
+                        generated += 1
+                        unsaved.append((index, answer, contexts))
+                        if len(unsaved) >= concurrency:
+                            await save()
+                    for duplicate in misses[index]:
+                        if isinstance(answer, Exception):
+                            line = {"index": duplicate, "question": questions[duplicate].query, "error": str(answer)}
+                        else:
+                            line = {
+                                "index": duplicate,
+                                "question": questions[duplicate].query,
+                                "generated_answer": answer,
+                                **timing,
+                                "route": "rag",
+                                "response_time": time() - start,
+                                "cached": False,
+                            }
+                        yield serialize_results(line) + b"\n"
+            except Exception as e:
+                print(f"❌ Batch /ask failed: {e}")
+                yield serialize_results({"error": str(e)}) + b"\n"
+        if unsaved:
+            await save()
+    finally:
+        if unsaved:
+            # The client disconnected mid-stream and this task can't await
+            # anymore: save the rest from a thread
+            threading.Thread(
+                target=save_batch_answers, args=(questions, unsaved[:], data_version),
+                name="batch-answers-save", daemon=True,
+            ).start()
+
+    yield serialize_results({
+        "done": True,
+        "questions": len(questions),
+        "routed": sum(1 for answer in routed if answer),
+        "cached": sum(1 for row in rows if row),
+        "generated": generated,
+        "query_ids": query_ids,  # per question, None where generation failed or the answer was routed
+        "response_time": time() - start,
+    }) + b"\n"
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchAskRequest):
+    """Answer many questions at once, streamed as NDJSON in completion order.
+
+    Answers from the analytics results and cache hits come first (one
+    query_history lookup for all of them), then each generated answer as it
+    finishes; a final line has the summary and every question's query id.
+    New answers are stored with one upsert per ``concurrency`` answers.
+    """
+    if not RAG_ENABLED:
+        return JSONResponse({"error": "/ask is disabled on this worker (RAG_ENABLED=false)"}, status_code=503)
+    return StreamingResponse(
+        stream_batch_answers(request.questions, request.concurrency), media_type="application/x-ndjson"
+    )
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: analytics statement timings, cache lookups and /ask stage timings."""
+    body, content_type = metrics_body()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/ask/{query_id}/faithfulness")
+def get_faithfulness(query_id: int):
+    with engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT user_query, faithfulness_score, evaluation_status
+            FROM query_history
+            WHERE id = :id
+        """), {"id": query_id}).fetchone()
+    if row is None:
+        return JSONResponse({"error": f"Unknown query id {query_id}"}, status_code=404)
+    return {
+        "query_id": query_id,
+        "question": row.user_query,
+        "faithfullness": row.faithfulness_score,
+        "evaluation_status": row.evaluation_status,
+    }
+
  
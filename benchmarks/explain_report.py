@@ -0,0 +1,178 @@
+"""EXPLAIN report for the queries the app runs against hotel_bookings.
+
+Covers every analytics metric as a standalone query, each endpoint's
+GROUPING SETS statement (what ANALYTICS_ENGINE=sql runs) and the
+incremental scans of the rollup and NumPy engines. Save the plans before a
+schema change and compare afterwards:
+
+    python benchmarks/explain_report.py --save plans_before.json
+    python db_setup/migrate.py
+    python benchmarks/explain_report.py --baseline plans_before.json --output explain_report.md
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RAG_ENABLED", "false")
+
+from sqlalchemy import text  # noqa: E402
+
+import app  # noqa: E402
+from analytics_engine import BOOKINGS, CHANGED_SINCE, build_grouping_sets_query, group_by_source, metric_query, plan_statements  # noqa: E402
+from db_setup.columns import BOOKING_COLUMNS  # noqa: E402
+from db_utils import engine  # noqa: E402
+
+ENDPOINTS = {
+    "revenue": app.REVENUE_METRICS,
+    "cancellations": app.CANCELLATION_METRICS,
+    "geo": app.GEO_METRICS,
+    "lead_time": app.LEAD_TIME_METRICS,
+    "others": app.OTHER_METRICS,
+}
+
+# The incremental reads, explained at the snapshot of the last rollup refresh
+INCREMENTAL_QUERIES = {
+    "rollup / numpy: rows committed since the last refresh":
+        f"SELECT {', '.join(BOOKING_COLUMNS)}, last_updated FROM hotel_bookings WHERE {CHANGED_SINCE}",
+}
+
+
+def collect_queries(incremental: bool = True):
+    """(name, sql) of every query to explain, in report order."""
+    queries = []
+    for endpoint, metrics in ENDPOINTS.items():
+        plan = plan_statements(metrics, (BOOKINGS,))
+        for i, group in enumerate(group_by_source(list(plan.values()))):
+            suffix = f" #{i + 1}" if i else ""
+            queries.append((f"{endpoint}: GROUPING SETS{suffix}", build_grouping_sets_query(group)[0]))
+        for key, metric in metrics.items():
+            queries.append((f"{endpoint}: {key}", metric_query(metric, plan[key])))
+    if incremental:
+        queries += list(INCREMENTAL_QUERIES.items())
+    return queries
+
+
+def explain_all(analyze: bool = True):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    report = {"tables": {}, "plans": {}}
+    with engine.connect() as connection:
+        # Schemas before 008_rollup_commit_order.sql have no snapshot to read changes since
+        incremental = connection.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'booking_rollup_state' AND column_name = 'snapshot'
+            )
+        """)).scalar()
+        snapshot = connection.execute(text("SELECT snapshot::TEXT FROM booking_rollup_state")).scalar() if incremental else None
+        for name, sql in collect_queries(incremental):
+            plan = connection.execute(text(f"EXPLAIN ({options}) {sql.strip().rstrip(';')}"), {"snapshot": snapshot}).scalar()
+            report["plans"][name] = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        # Partitions and their indexes (or just the table, before partitioning)
+        report["tables"]["hotel_bookings"] = dict(connection.execute(text("""
+            WITH relations AS (
+                SELECT relid FROM pg_partition_tree('hotel_bookings')
+                UNION SELECT 'hotel_bookings'::regclass
+            )
+            SELECT (SELECT COUNT(*) FROM hotel_bookings) AS rows,
+                   pg_size_pretty(SUM(pg_total_relation_size(relid))) AS total_size,
+                   pg_size_pretty(SUM(pg_relation_size(relid))) AS heap_size,
+                   (SELECT AVG(pg_column_size(b.*))::NUMERIC(8, 1) FROM hotel_bookings b) AS avg_row_bytes
+            FROM relations
+        """)).mappings().one())
+    return report
+
+
+def scans(node, found=None):
+    """Relations read by a plan node and its children, with the scan type."""
+    found = [] if found is None else found
+    if "Relation Name" in node:
+        index = f" using {node['Index Name']}" if "Index Name" in node else ""
+        found.append(f"{node['Node Type']} on {node['Relation Name']}{index}")
+    for child in node.get("Plans", []):
+        scans(child, found)
+    return found
+
+
+def plan_lines(node, depth=0):
+    relation = f" on {node['Relation Name']}" if "Relation Name" in node else ""
+    line = f"{'  ' * depth}-> {node['Node Type']}{relation} (cost={node['Total Cost']:.0f} rows={node['Plan Rows']})"
+    if "Actual Total Time" in node:
+        line += f" (actual {node['Actual Total Time']:.1f} ms, {node['Actual Rows']} rows)"
+    if node.get("Subplans Removed"):
+        line += f" [{node['Subplans Removed']} partitions pruned at runtime]"
+    lines = [line]
+    for child in node.get("Plans", []):
+        lines += plan_lines(child, depth + 1)
+    return lines
+
+
+def summary(explained):
+    plan = explained["Plan"]
+    read = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return {
+        "cost": f"{plan['Total Cost']:.0f}",
+        "time": f"{explained['Execution Time']:.1f} ms" if "Execution Time" in explained else "-",
+        "buffers": str(read) if "Shared Hit Blocks" in plan else "-",
+        "scans": len(scans(plan)),
+    }
+
+
+def render(after, before=None):
+    lines = ["# hotel_bookings EXPLAIN report", ""]
+    for label, report in (("Before", before), ("After", after)):
+        if report:
+            table = report["tables"]["hotel_bookings"]
+            lines.append(
+                f"- {label}: {table['rows']} rows, {table['total_size']} total "
+                f"({table['heap_size']} heap), {table['avg_row_bytes']} bytes per row"
+            )
+    lines += ["", "| Query | Cost | Time | Buffers | Relations scanned |", "|---|---|---|---|---|"]
+    for name, explained in after["plans"].items():
+        now = summary(explained)
+        old = summary(before["plans"][name]) if before and name in before["plans"] else None
+        cells = [
+            f"{old[k]} → {now[k]}" if old else str(now[k])
+            for k in ("cost", "time", "buffers", "scans")
+        ]
+        lines.append(f"| {name} | " + " | ".join(cells) + " |")
+    for name, explained in after["plans"].items():
+        lines += ["", f"## {name}", ""]
+        if before and name in before["plans"]:
+            lines += ["Before:", "```", *plan_lines(before["plans"][name]["Plan"]), "```", "After:"]
+        lines += ["```", *plan_lines(explained["Plan"]), "```"]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", help="write the raw plans to this JSON file")
+    parser.add_argument("--baseline", help="raw plans saved earlier with --save, to compare against")
+    parser.add_argument("--output", help="write the Markdown report to this file instead of stdout")
+    parser.add_argument("--no-analyze", action="store_true", help="only plan the queries, don't run them")
+    args = parser.parse_args()
+
+    report = explain_all(analyze=not args.no_analyze)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, default=str)
+        print(f"✅ Saved {len(report['plans'])} plans to {args.save}")
+        if not args.output:
+            return
+    before = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            before = json.load(f)
+    markdown = render(report, before)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(markdown)
+        print(f"✅ Wrote the EXPLAIN report to {args.output}")
+    else:
+        print(markdown)
+
+
+if __name__ == "__main__":
+    main()
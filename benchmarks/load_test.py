@@ -0,0 +1,399 @@
+"""Load test for the analytics and /ask endpoints.
+
+With --seed --yes, replaces hotel_bookings and query_history with a
+deterministic synthetic dataset (1x is the size of the cleaned Kaggle CSV).
+Starts the API in-process with stand-ins for Weaviate, Ollama and RAGAS
+(see standins.py), then measures:
+
+  cold   every distinct request once, right after starting (empty caches)
+  warm   the same requests again, one at a time
+  load   a seeded random mix of them at --concurrency
+
+and writes p50/p95/p99 latency and throughput per endpoint as JSON:
+
+    python benchmarks/load_test.py --seed --yes --scale 10 --concurrency 16 --requests 2000 --output bench.json
+    python benchmarks/load_test.py --baseline bench.json    # same data, compare with an earlier run
+
+--url runs the workload against an already running server instead (with its
+own Weaviate / Ollama configuration). Without --seed the data already in the
+database is benchmarked.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timezone
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASE_ROWS = 87396  # rows in db_setup/hotel_data_no_true_duplicates.csv
+SEED_BATCH_ROWS = 250000
+ANALYTICS_ENDPOINTS = ["revenue", "cancellations", "geo", "lead_time", "others"]
+COUNTRIES = [
+    "PRT", "GBR", "FRA", "ESP", "DEU", "ITA", "IRL", "BEL", "BRA", "NLD", "USA", "CHE", "CN", "AUT", "SWE",
+    "CHN", "POL", "ISR", "RUS", "NOR", "ROU", "FIN", "DNK", "AUS", "AGO", "LUX", "MAR", "TUR", "HUN", "ARG",
+]
+ROOM_TYPES = ["A", "A", "A", "A", "D", "D", "E", "F", "G", "B", "C", "H", "L", "P"]
+
+# One SQL expression per column; random() is seeded per batch, so the data is
+# the same on every run. {n} is the batch's first row number.
+SEED_COLUMNS = {
+    "hotel": "CASE WHEN random() < 0.66 THEN 'City Hotel' ELSE 'Resort Hotel' END",
+    "lead_time": "FLOOR(POWER(random(), 2) * 400)",
+    "arrival_date_week_number": "EXTRACT(WEEK FROM arrival_date)",
+    "stays_in_weekend_nights": "stays_in_weekend_nights",
+    "stays_in_week_nights": "stays_in_week_nights",
+    "adults": "1 + FLOOR(random() * 3)",
+    "children": "CASE WHEN random() < 0.001 THEN NULL WHEN random() < 0.08 THEN 1 ELSE 0 END",
+    "babies": "CASE WHEN random() < 0.01 THEN 1 ELSE 0 END",
+    "meal": "(ARRAY['BB', 'BB', 'BB', 'BB', 'HB', 'SC', 'FB', 'Undefined'])[1 + FLOOR(random() * 8)]",
+    "country": f"CASE WHEN random() < 0.004 THEN NULL ELSE (ARRAY{COUNTRIES!r})[1 + FLOOR(POWER(random(), 3) * {len(COUNTRIES)})] END",
+    "market_segment": "(ARRAY['Online TA', 'Online TA', 'Online TA', 'Offline TA/TO', 'Groups', 'Direct', "
+                      "'Corporate', 'Complementary', 'Aviation'])[1 + FLOOR(random() * 9)]",
+    "distribution_channel": "(ARRAY['TA/TO', 'TA/TO', 'TA/TO', 'Direct', 'Corporate', 'GDS'])[1 + FLOOR(random() * 6)]",
+    "previous_cancellations": "CASE WHEN random() < 0.05 THEN 1 ELSE 0 END",
+    "previous_bookings_not_canceled": "CASE WHEN random() < 0.03 THEN FLOOR(random() * 10) ELSE 0 END",
+    "reserved_room_type": f"(ARRAY{ROOM_TYPES!r})[1 + FLOOR(random() * {len(ROOM_TYPES)})]",
+    "assigned_room_type": f"(ARRAY{ROOM_TYPES!r})[1 + FLOOR(random() * {len(ROOM_TYPES)})]",
+    "booking_changes": "FLOOR(POWER(random(), 4) * 4)",
+    "deposit_type": "CASE WHEN random() < 0.87 THEN 'No Deposit' WHEN random() < 0.95 THEN 'Non Refund' ELSE 'Refundable' END",
+    "agent": "CASE WHEN random() < 0.14 THEN NULL ELSE 1 + FLOOR(random() * 500) END",
+    "company": "CASE WHEN random() < 0.94 THEN NULL ELSE 1 + FLOOR(random() * 500) END",
+    "days_in_waiting_list": "CASE WHEN random() < 0.03 THEN FLOOR(random() * 100) ELSE 0 END",
+    "customer_type": "(ARRAY['Transient', 'Transient', 'Transient', 'Transient-Party', 'Contract', 'Group'])"
+                     "[1 + FLOOR(random() * 6)]",
+    "adr": "CASE WHEN random() < 0.001 THEN NULL ELSE ROUND((40 + random() * 180)::NUMERIC, 2) END",
+    "required_car_parking_spaces": "CASE WHEN random() < 0.06 THEN 1 ELSE 0 END",
+    "total_of_special_requests": "FLOOR(POWER(random(), 2) * 5)",
+    "reservation_status": "CASE WHEN is_canceled THEN 'Canceled' ELSE 'Check-Out' END",
+    "reservation_status_date": "arrival_date + stays_in_weekend_nights + stays_in_week_nights",
+    "arrival_date": "arrival_date",
+    "is_canceled": "is_canceled",
+    "is_repeated_guest": "random() < 0.03",
+}
+
+# Columns other expressions depend on, drawn first. Arrivals span the Kaggle
+# data's dates rather than anything relative to today, so the data doesn't
+# change from day to day; like the real data, it has no bookings in the
+# date-window metrics' last six months.
+SEED_BASE = """
+    SELECT DATE '2015-07-01' + FLOOR(random() * 793)::INT AS arrival_date,
+           random() < 0.37 AS is_canceled,
+           FLOOR(random() * 3)::INT AS stays_in_weekend_nights,
+           FLOOR(random() * 6)::INT AS stays_in_week_nights
+    FROM generate_series(1, :rows)
+"""
+
+
+# === Seeding ===
+def seed_database(scale: float, seed: int) -> Dict[str, Any]:
+    import psycopg2
+    from db_setup.columns import BOOKING_COLUMNS
+    from db_utils import DATABASE_URL
+
+    sys.path.insert(0, os.path.join(ROOT, "db_setup"))
+    from migrate import apply_migrations
+
+    rows = int(BASE_ROWS * scale)
+    start = perf_counter()
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        apply_migrations(conn)
+        cursor = conn.cursor()
+        # Cast every expression to the column's current type (enums, SMALLINT, ...)
+        cursor.execute("""
+            SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'hotel_bookings'::regclass AND attnum > 0 AND NOT attisdropped
+        """)
+        types = dict(cursor.fetchall())
+        columns = ", ".join(BOOKING_COLUMNS)
+        select = ", ".join(f"CAST({SEED_COLUMNS[c]} AS {types[c]}) AS {c}" for c in BOOKING_COLUMNS)
+        insert = f"""
+            INSERT INTO hotel_bookings ({columns}, booking_hash)
+            SELECT {columns}, md5(ROW({columns})::text)
+            FROM (SELECT {select} FROM ({SEED_BASE}) base) seeded
+            ON CONFLICT DO NOTHING
+        """
+        cursor.execute("TRUNCATE hotel_bookings, query_history")
+        # Partitions for the arrival range of SEED_BASE only
+        cursor.execute("SELECT ensure_booking_partitions(DATE '2015-07-01', DATE '2015-07-01' + 792)")
+        conn.commit()
+
+        inserted = 0
+        for batch, first in enumerate(range(0, rows, SEED_BATCH_ROWS)):
+            size = min(SEED_BATCH_ROWS, rows - first)
+            cursor.execute("SELECT setseed(%s)", (((seed * 1000003 + batch) % 2000000) / 1000000 - 1,))
+            cursor.execute(insert.replace(":rows", str(size)))
+            inserted += cursor.rowcount
+            conn.commit()
+            print(f"🌱 Seeded {first + size:,} / {rows:,} bookings")
+        conn.autocommit = True
+        cursor.execute("VACUUM (ANALYZE) hotel_bookings")
+    finally:
+        conn.close()
+    seconds = perf_counter() - start
+    print(f"✅ Seeded {inserted:,} bookings (scale {scale}x) in {seconds:.1f}s")
+    return {"scale": scale, "rows": inserted, "seed": seed, "seconds": seconds}
+
+
+# === In-process server with stand-ins ===
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name=f"server-{port}", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        sleep(0.05)
+    return server, thread
+
+
+def start_app(real_services: bool, llm_latency: float):
+    """Import the app with benchmark settings and serve it; returns (url, servers)."""
+    servers = []
+    os.chdir(ROOT)  # the PDF corpus paths are relative
+    # Analytics snapshots start empty and stay private to this run
+    os.environ.setdefault("ANALYTICS_CACHE_DIR", tempfile.mkdtemp(prefix="bench-analytics-cache-"))
+    if not real_services:
+        from benchmarks.standins import StandInWeaviate, ollama_app
+
+        ollama_port = free_port()
+        servers.append(serve(ollama_app(llm_latency), ollama_port))
+        os.environ.update({
+            "OLLAMA_URL": f"http://127.0.0.1:{ollama_port}",
+            "FAITHFULNESS_EVALUATOR": "stub",
+            "SEMANTIC_CACHE_ENABLED": "false",
+            "WEAVIATE_WARM_UP": "false",
+        })
+
+    import app
+    from weaviate_store import WeaviateStore
+
+    if not real_services:
+        app.weaviate_store = app.corpus_sync.store = WeaviateStore(connect=lambda: StandInWeaviate(llm_latency))
+    port = free_port()
+    servers.append(serve(app.app, port))
+    return f"http://127.0.0.1:{port}", servers
+
+
+# === Workload ===
+def load_questions() -> List[Tuple[str, str]]:
+    with open(os.path.join(ROOT, "samples", "samples_queries.json")) as f:
+        samples = json.load(f)
+    return [(item["question"], item["answer"]) for sample in samples for item in sample.values()]
+
+
+def distinct_requests(stream: bool) -> List[Dict[str, Any]]:
+    requests = [
+        {"name": f"GET /analytics/{endpoint}", "method": "GET", "path": f"/analytics/{endpoint}"}
+        for endpoint in ANALYTICS_ENDPOINTS
+    ]
+    path = "/ask/stream" if stream else "/ask"
+    for question, answer in load_questions():
+        requests.append({
+            "name": f"POST {path}", "method": "POST", "path": path,
+            "params": {"query": question, "ground_truth": answer},
+        })
+    return requests
+
+
+def mixed_workload(requests: List[Dict[str, Any]], total: int, ask_ratio: float, seed: int):
+    rng = random.Random(seed)
+    analytics = [r for r in requests if r["path"].startswith("/analytics")]
+    asks = [r for r in requests if not r["path"].startswith("/analytics")]
+    return [rng.choice(asks if asks and rng.random() < ask_ratio else analytics) for _ in range(total)]
+
+
+async def timed(client, request) -> Dict[str, Any]:
+    start = perf_counter()
+    try:
+        response = await client.request(request["method"], request["path"], params=request.get("params"))
+        await response.aread()
+        status = response.status_code
+    except Exception as e:
+        status = f"error: {type(e).__name__}"
+    return {"name": request["name"], "status": status, "seconds": perf_counter() - start}
+
+
+async def run_sequential(url: str, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        return [await timed(client, request) for request in requests]
+
+
+async def run_concurrent(url: str, requests: List[Dict[str, Any]], concurrency: int) -> Tuple[List[Dict[str, Any]], float]:
+    import httpx
+
+    pending = iter(requests)
+    results: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client):
+        for request in pending:
+            results.append(await timed(client, request))
+
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        start = perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return results, perf_counter() - start
+
+
+# === Statistics ===
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def latency_stats(results: List[Dict[str, Any]], seconds: Optional[float] = None) -> Dict[str, Any]:
+    ok = [r["seconds"] * 1000 for r in results if r["status"] == 200]
+    stats = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "p50_ms": percentile(ok, 0.50),
+        "p95_ms": percentile(ok, 0.95),
+        "p99_ms": percentile(ok, 0.99),
+        "mean_ms": sum(ok) / len(ok) if ok else None,
+        "max_ms": max(ok) if ok else None,
+    }
+    if seconds:
+        stats["throughput_rps"] = len(results) / seconds
+    return stats
+
+
+def phase_report(results: List[Dict[str, Any]], seconds: Optional[float] = None) -> Dict[str, Any]:
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        by_name.setdefault(result["name"], []).append(result)
+    return {
+        "overall": latency_stats(results, seconds),
+        "endpoints": {name: latency_stats(items) for name, items in sorted(by_name.items())},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    for phase in ("cold", "warm", "load"):
+        print(f"\n{phase}")
+        rows = report["phases"][phase]["endpoints"].items()
+        for name, stats in list(rows) + [("overall", report["phases"][phase]["overall"])]:
+            line = f"  {name:28} n={stats['requests']:<5} err={stats['errors']:<3} " \
+                   f"p50={fmt(stats['p50_ms'])} p95={fmt(stats['p95_ms'])} p99={fmt(stats['p99_ms'])} ms"
+            if "throughput_rps" in stats:
+                line += f"  {stats['throughput_rps']:.1f} req/s"
+            if baseline:
+                phase_base = baseline["phases"].get(phase, {})
+                old = phase_base.get("endpoints", {}).get(name) or (phase_base.get("overall") if name == "overall" else None)
+                if old and old.get("p50_ms") and stats["p50_ms"]:
+                    line += f"  (p50 {100 * (stats['p50_ms'] / old['p50_ms'] - 1):+.0f}% vs {baseline['meta'].get('commit')})"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help=f"dataset size as a multiple of {BASE_ROWS:,} bookings")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests in the concurrent load phase")
+    parser.add_argument("--ask-ratio", type=float, default=0.2, help="share of /ask requests in the load phase")
+    parser.add_argument("--stream", action="store_true", help="ask through /ask/stream instead of /ask")
+    parser.add_argument("--random-seed", type=int, default=42, help="seed for the dataset and the request mix")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds the stand-in LLM takes per answer")
+    parser.add_argument("--seed", action="store_true",
+                        help="TRUNCATE hotel_bookings and query_history and load the synthetic dataset (needs --yes)")
+    parser.add_argument("--yes", action="store_true", help="confirm that --seed may delete the current data")
+    parser.add_argument("--real-services", action="store_true", help="use the configured Weaviate, Ollama and RAGAS")
+    parser.add_argument("--no-router", action="store_true", help="send every question to RAG, as before question routing")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.seed and not args.yes:
+        from db_utils import engine
+
+        parser.error(f"--seed deletes every booking and query in {engine.url!r}; pass --yes to confirm")
+    seeding = seed_database(args.scale, args.random_seed) if args.seed else None
+    servers = []
+    url = args.url
+    if url is None:
+        if args.no_router:
+            os.environ["QUESTION_ROUTER_ENABLED"] = "false"
+        url, servers = start_app(args.real_services, args.llm_latency)
+
+    requests = distinct_requests(args.stream)
+    cold = asyncio.run(run_sequential(url, requests))
+    warm = asyncio.run(run_sequential(url, requests))
+    load, seconds = asyncio.run(run_concurrent(
+        url, mixed_workload(requests, args.requests, args.ask_ratio, args.random_seed), args.concurrency
+    ))
+    for server, thread in reversed(servers):
+        server.should_exit = True
+        thread.join(10)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "url": args.url or "in-process",
+            "services": "real" if args.real_services or args.url else "stand-ins",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "ask_ratio": args.ask_ratio,
+            "stream": args.stream,
+            "llm_latency": args.llm_latency,
+            "question_router": not args.no_router,
+            "analytics_engine": os.getenv("ANALYTICS_ENGINE", "rollup"),
+        },
+        "dataset": seeding,
+        "phases": {
+            "cold": phase_report(cold),
+            "warm": phase_report(warm),
+            "load": phase_report(load, seconds),
+        },
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
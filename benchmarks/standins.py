@@ -0,0 +1,177 @@
+"""Deterministic local stand-ins for Weaviate and Ollama, for benchmarks.
+
+``StandInWeaviate`` implements the part of the weaviate-client v4 API the app
+uses (collections, batch ingest, deletes by id, iteration, near_text /
+near_vector search and grouped generation) over an in-memory list.
+Retrieval ranks objects by the cosine similarity of hashed bag-of-words
+vectors, so the same question always gets the same chunks. Generation,
+which Weaviate delegates to Ollama, answers with the best chunk after a
+fixed ``llm_latency``.
+
+RAGAS is replaced by the existing offline evaluator (FAITHFULNESS_EVALUATOR=stub).
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Sequence
+from uuid import uuid4
+
+WORD = re.compile(r"\w+")
+DIMENSIONS = 64
+
+
+def embed_text(text: str) -> List[float]:
+    """Hashed bag-of-words vector, normalized to unit length."""
+    vector = [0.0] * DIMENSIONS
+    for word in WORD.findall(text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class _Collection:
+    def __init__(self, client: "StandInWeaviate", name: str):
+        self._client = client
+        self._objects: List[Dict[str, Any]] = client._store.setdefault(name, [])
+
+    @property
+    def aggregate(self):
+        return SimpleNamespace(over_all=lambda total_count=True: SimpleNamespace(total_count=len(self._objects)))
+
+    @property
+    def batch(self):
+        objects = self._objects
+
+        class Batch:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def add_object(self, properties):
+                objects.append({"uuid": str(uuid4()), "properties": dict(properties), "vector": embed_text(properties.get("text", ""))})
+
+        return SimpleNamespace(dynamic=Batch)
+
+    @property
+    def data(self):
+        def insert(properties, uuid=None, vector=None):
+            key = str(uuid or uuid4())
+            self._objects[:] = [o for o in self._objects if o["uuid"] != key]
+            text = properties.get("text") or " ".join(map(str, properties.values()))
+            self._objects.append({"uuid": key, "properties": dict(properties), "vector": vector or embed_text(text)})
+            return key
+
+        def insert_many(objects):
+            for o in objects:
+                if isinstance(o, dict):
+                    insert(o)
+                else:  # weaviate.classes.data.DataObject
+                    insert(o.properties, o.uuid, o.vector)
+            return SimpleNamespace(errors={})
+
+        def delete_many(where=None):
+            # Only by_id().contains_any(...) filters are applied
+            ids = {str(v) for v in getattr(where, "value", None) or []} if getattr(where, "target", None) == "_id" else set()
+            self._objects[:] = [o for o in self._objects if o["uuid"] not in ids]
+
+        return SimpleNamespace(insert=insert, insert_many=insert_many, delete_many=delete_many)
+
+    def iterator(self, **kwargs):
+        return iter([SimpleNamespace(uuid=o["uuid"], properties=o["properties"]) for o in list(self._objects)])
+
+    def _search(self, vector: Sequence[float], limit: int):
+        ranked = sorted(self._objects, key=lambda o: -_similarity(vector, o["vector"]))[:limit]
+        return [SimpleNamespace(properties=o["properties"], metadata=SimpleNamespace(distance=None)) for o in ranked]
+
+    @property
+    def query(self):
+        return SimpleNamespace(
+            near_text=lambda query, limit=10, **kwargs: SimpleNamespace(objects=self._search(embed_text(query), limit)),
+            near_vector=lambda near_vector, limit=10, **kwargs: SimpleNamespace(objects=self._search(near_vector, limit)),
+        )
+
+    @property
+    def generate(self):
+        def near_text(query, limit=10, grouped_task=None, **kwargs):
+            objects = self._search(embed_text(query), limit)
+            time.sleep(self._client.llm_latency)
+            best = objects[0].properties.get("text", "") if objects else ""
+            return SimpleNamespace(generated=f"Based on the reports: {best}", objects=objects)
+
+        return SimpleNamespace(near_text=near_text)
+
+
+class StandInWeaviate:
+    """In-memory replacement for a connected ``weaviate.WeaviateClient``."""
+
+    # Shared across reconnects, like a real server's data
+    _stores: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, llm_latency: float = 0.0, namespace: str = "default"):
+        self.llm_latency = llm_latency
+        with self._lock:
+            self._store = self._stores.setdefault(namespace, {})
+
+    @property
+    def collections(self):
+        return SimpleNamespace(
+            exists=lambda name: name in self._store,
+            create=lambda name, **kwargs: self._store.setdefault(name, []),
+            get=lambda name: _Collection(self, name),
+        )
+
+    def is_ready(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+def ollama_app(llm_latency: float = 0.0):
+    """A FastAPI app serving Ollama's /api/generate (streaming or not) and /api/embed."""
+    import asyncio
+    import json
+
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+
+    def answer(prompt: str) -> str:
+        question = prompt.rsplit("Question:", 1)[-1].strip()
+        return f"Based on the reports: {question}"
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {"model": body.get("model"), "embeddings": [embed_text(text) for text in inputs]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        text = answer(body.get("prompt", ""))
+        if not body.get("stream", True):
+            await asyncio.sleep(llm_latency)
+            return {"model": body.get("model"), "response": text, "done": True}
+
+        async def tokens():
+            words = text.split(" ")
+            for word in words:
+                await asyncio.sleep(llm_latency / len(words))
+                yield json.dumps({"response": word + " ", "done": False}) + "\n"
+            yield json.dumps({"response": "", "done": True}) + "\n"
+
+        return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+    return app
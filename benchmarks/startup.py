@@ -0,0 +1,88 @@
+"""Import-time and import-memory benchmark for app.py.
+
+Imports the app in fresh interpreters and reports wall time, peak RSS growth
+and which heavy RAG/evaluation modules got loaded. Exits non-zero when a limit
+is exceeded, so it can guard against eager imports creeping back in:
+
+    python benchmarks/startup.py --repeat 5 --max-seconds 2 --max-rss-mb 200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules an analytics worker should never need at import time
+HEAVY_MODULES = ["torch", "ragas", "datasets", "langchain_openai", "PyPDF2", "weaviate", "pyarrow", "pandas"]
+
+CHILD = """
+import json, resource, sys, time
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "seconds": seconds,
+    "rss_mb": (after - before) / 1024,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure_once(env):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD % HEAVY_MODULES],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rag", choices=["enabled", "disabled", "both"], default="both",
+                        help="measure with RAG_ENABLED=true, false or both")
+    parser.add_argument("--max-seconds", type=float, help="fail if the median import time is above this")
+    parser.add_argument("--max-rss-mb", type=float, help="fail if the median RSS growth is above this")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    modes = ["enabled", "disabled"] if args.rag == "both" else [args.rag]
+    report = {}
+    failed = False
+    for mode in modes:
+        env = dict(os.environ, RAG_ENABLED="true" if mode == "enabled" else "false")
+        runs = [measure_once(env) for _ in range(args.repeat)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        rss_mb = statistics.median(r["rss_mb"] for r in runs)
+        loaded = sorted({m for r in runs for m in r["loaded"]})
+        report[f"rag_{mode}"] = {
+            "runs": args.repeat,
+            "import_seconds_median": round(seconds, 4),
+            "import_seconds_max": round(max(r["seconds"] for r in runs), 4),
+            "import_rss_mb_median": round(rss_mb, 1),
+            "heavy_modules_loaded": loaded,
+        }
+        print(f"RAG {mode}: import {seconds * 1000:.0f} ms, +{rss_mb:.1f} MB RSS, heavy modules: {loaded or 'none'}")
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            print(f"❌ import took {seconds:.2f}s (limit {args.max_seconds}s)")
+            failed = True
+        if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+            print(f"❌ import grew RSS by {rss_mb:.1f} MB (limit {args.max_rss_mb} MB)")
+            failed = True
+        if loaded:
+            print(f"❌ heavy modules imported at startup: {', '.join(loaded)}")
+            failed = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import calendar
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal, localcontext
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import text
+
+from analytics_engine import CHANGED_SINCE, Statement
+from db_setup.columns import BOOKING_COLUMNS
+
+TEXT_COLUMNS = {
+    "hotel", "meal", "country", "market_segment", "distribution_channel", "reserved_room_type",
+    "assigned_room_type", "deposit_type", "customer_type", "reservation_status",
+}
+FLOAT_COLUMNS = {"adr"}
+DATE_COLUMNS = {"reservation_status_date", "arrival_date"}
+BOOL_COLUMNS = {"is_canceled", "is_repeated_guest"}
+
+
+# === Postgres numeric emulation, so results equal the SQL path digit for digit ===
+def _pg_weight_and_first_digit(value: Decimal) -> Tuple[int, int]:
+    # Postgres stores numerics in base-10000 digits
+    if value == 0:
+        return 0, 0
+    weight = value.adjusted() // 4
+    return weight, int(abs(value).scaleb(-4 * weight))
+
+
+def pg_div(numerator: Decimal, denominator: Decimal, num_scale: int, den_scale: int) -> Decimal:
+    """numeric / numeric with the result scale Postgres' select_div_scale picks."""
+    weight1, first1 = _pg_weight_and_first_digit(numerator)
+    weight2, first2 = _pg_weight_and_first_digit(denominator)
+    qweight = weight1 - weight2
+    if first1 <= first2:
+        qweight -= 1
+    rscale = max(16 - qweight * 4, num_scale, den_scale, 0)
+    rscale = min(rscale, 1000)
+    with localcontext() as ctx:
+        ctx.prec = 100
+        return (numerator / denominator).quantize(Decimal(1).scaleb(-rscale), rounding=ROUND_HALF_UP)
+
+
+def pg_round(value: Decimal, scale: int) -> Decimal:
+    return value.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+
+
+def pg_percentage(part: int, whole: int) -> Optional[Decimal]:
+    # ROUND(100.0 * part / whole, 2)
+    if not whole:
+        return None
+    return pg_round(pg_div(Decimal(100 * part), Decimal(whole), 1, 0), 2)
+
+
+def months_before(day: date, months: int) -> date:
+    # date - INTERVAL 'n months', clamping the day like Postgres does
+    index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(index, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+# === Column storage ===
+@dataclass
+class Column:
+    """One column of the snapshot: values plus a validity mask (False = NULL).
+
+    Text columns are dictionary-encoded: ``values`` holds int32 codes into
+    ``dictionary``.
+    """
+    values: np.ndarray
+    valid: np.ndarray
+    dictionary: Optional[List[str]] = None
+
+    @classmethod
+    def from_values(cls, name: str, raw: Sequence[Any], previous: Optional["Column"] = None) -> "Column":
+        valid = np.fromiter((v is not None for v in raw), dtype=bool, count=len(raw))
+        if name in TEXT_COLUMNS:
+            dictionary = list(previous.dictionary) if previous is not None else []
+            index = {v: i for i, v in enumerate(dictionary)}
+            codes = np.empty(len(raw), dtype=np.int32)
+            for i, v in enumerate(raw):
+                if v is None:
+                    codes[i] = -1
+                    continue
+                code = index.get(v)
+                if code is None:
+                    code = index[v] = len(dictionary)
+                    dictionary.append(v)
+                codes[i] = code
+            return cls(codes, valid, dictionary)
+        if name in FLOAT_COLUMNS:
+            values = np.array([v if v is not None else np.nan for v in raw], dtype=np.float64)
+        elif name in DATE_COLUMNS:
+            values = np.array([v if v is not None else "NaT" for v in raw], dtype="datetime64[D]")
+        elif name in BOOL_COLUMNS:
+            values = np.array([bool(v) if v is not None else False for v in raw], dtype=bool)
+        else:
+            values = np.array([v if v is not None else 0 for v in raw], dtype=np.int64)
+        return cls(values, valid)
+
+    def append(self, other: "Column") -> "Column":
+        return Column(
+            np.concatenate([self.values, other.values]),
+            np.concatenate([self.valid, other.valid]),
+            other.dictionary if other.dictionary is not None else self.dictionary,
+        )
+
+
+@dataclass
+class Snapshot:
+    columns: Dict[str, Column]
+    rows: int
+    watermark: Optional[str]  # pg_snapshot the rows were read in
+    current_date: date
+    timezone: str
+
+
+def _encode(keys: np.ndarray, valid: np.ndarray, label: Callable[[Any], Any]) -> Tuple[np.ndarray, List[Any]]:
+    """Factorize a key array into group codes; NULL keys get the last code."""
+    uniques, inverse = np.unique(keys[valid], return_inverse=True)
+    codes = np.full(len(keys), len(uniques), dtype=np.int64)
+    codes[valid] = inverse
+    return codes, [label(u) for u in uniques.tolist()] + [None]
+
+
+def _fixed_offset(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone(value.utcoffset()))
+
+
+def _lead_bucket(lead: Column, bounds: Sequence[int], labels: Sequence[str]) -> Tuple[np.ndarray, List[Any]]:
+    # CASE WHEN lead_time < b0 ... ELSE last label (NULL lead_time falls into ELSE)
+    codes = np.searchsorted(np.asarray(bounds), lead.values, side="right")
+    codes[~lead.valid] = len(bounds)
+    return codes.astype(np.int64), list(labels)
+
+
+class ColumnarEngine:
+    """In-process analytics over a NumPy snapshot of hotel_bookings.
+
+    The snapshot is loaded once, then refreshed by appending the rows written
+    by transactions that committed since it was read (see CHANGED_SINCE).
+    Updates and deletes cannot be appended (the table has no key), so when the
+    row count shows anything but pure inserts the snapshot is reloaded.
+    Statements are evaluated with bincount/unique kernels and return the same
+    rows as the SQL engine.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+
+    # --- loading ---
+    def _fetch(self, connection, where: str = "", params: Optional[dict] = None):
+        result = connection.execute(
+            text(f"SELECT {', '.join(BOOKING_COLUMNS)}, last_updated FROM hotel_bookings {where}"),
+            params or {},
+        )
+        return result.fetchall()
+
+    def refresh(self) -> Snapshot:
+        with self._lock:
+            with self.engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+                # Every read below sees this same transaction snapshot
+                total, high, current_date, timezone = connection.execute(text(
+                    "SELECT COUNT(*), pg_current_snapshot()::TEXT, CURRENT_DATE, current_setting('TimeZone') "
+                    "FROM hotel_bookings"
+                )).one()
+                snapshot = self.snapshot
+                if snapshot is not None and snapshot.watermark is not None:
+                    delta = self._fetch(connection, f"WHERE {CHANGED_SINCE}", {"snapshot": snapshot.watermark})
+                    if snapshot.rows + len(delta) == total:
+                        self.snapshot = self._append(snapshot, delta, high, current_date, timezone)
+                        return self.snapshot
+                rows = self._fetch(connection)
+                self.snapshot = self._append(None, rows, high, current_date, timezone)
+                return self.snapshot
+
+    def _append(self, snapshot: Optional[Snapshot], rows, high, current_date, timezone) -> Snapshot:
+        names = BOOKING_COLUMNS + ["last_updated"]
+        raw = list(zip(*rows)) if rows else [()] * len(names)
+        columns = {}
+        for name, values in zip(names[:-1], raw[:-1]):
+            previous = snapshot.columns[name] if snapshot is not None else None
+            column = Column.from_values(name, values, previous)
+            columns[name] = previous.append(column) if previous is not None else column
+        count = (snapshot.rows if snapshot is not None else 0) + len(rows)
+        return Snapshot(columns, count, high, current_date, timezone)
+
+    # --- dimensions ---
+    def _dimension(self, snap: Snapshot, name: str) -> Tuple[np.ndarray, List[Any]]:
+        cols = snap.columns
+        if name in ("month", "year", "month_year"):
+            arrival = cols["arrival_date"]
+            months = arrival.values.astype("datetime64[M]").astype(np.int64)
+            tz = ZoneInfo(snap.timezone)
+            if name == "month":
+                # DATE_TRUNC('month', date) is a timestamptz at midnight in the session time zone,
+                # which the drivers return with that day's fixed UTC offset
+                return _encode(months, arrival.valid, lambda m: _fixed_offset(datetime(
+                    1970 + m // 12, m % 12 + 1, 1, tzinfo=tz)))
+            if name == "year":
+                # DATE_PART returns double precision
+                return _encode(months // 12, arrival.valid, lambda y: float(1970 + y))
+            # TO_CHAR 'Month' pads the month name to 9 characters
+            return _encode(months, arrival.valid, lambda m: f"{calendar.month_name[m % 12 + 1]:<9} {1970 + m // 12}")
+        if name == "booking_type":
+            return _lead_bucket(cols["lead_time"], [7, 31], ["Last-minute", "Short-term", "Long-term"])
+        if name == "booking_category":
+            return _lead_bucket(cols["lead_time"], [7, 31], ["Last-minute", "1 week to 1 month", "Long-term"])
+        if name == "lead_time_category":
+            return _lead_bucket(cols["lead_time"], [7, 31, 91, 181], [
+                "Less than a week", "1 week to 1 month", "1 to 3 months", "3 to 6 months", "More than 6 months",
+            ])
+        column = cols[name]
+        if column.dictionary is not None:
+            codes = column.values.astype(np.int64)
+            codes[~column.valid] = len(column.dictionary)
+            return codes, list(column.dictionary) + [None]
+        if name in BOOL_COLUMNS:
+            return _encode(column.values.astype(np.int64), column.valid, bool)
+        return _encode(column.values, column.valid, int)
+
+    # --- statements ---
+    def run_statements(self, statements: Sequence[Statement]) -> Dict[str, List[Dict[str, Any]]]:
+        snap = self.snapshot or self.refresh()
+        dimension_cache: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        results = {}
+        for statement in statements:
+            for d in statement.dimensions:
+                if d not in dimension_cache:
+                    dimension_cache[d] = self._dimension(snap, d)
+            results[statement.fingerprint] = self._run_statement(snap, statement, dimension_cache)
+        return results
+
+    def _run_statement(self, snap: Snapshot, statement: Statement, dimension_cache) -> List[Dict[str, Any]]:
+        # statement.prune never changes the rows, so the whole snapshot is aggregated
+        n = snap.rows
+        group_key = np.zeros(n, dtype=np.int64)
+        for d in statement.dimensions:
+            codes, labels = dimension_cache[d]
+            group_key = group_key * len(labels) + codes
+        if statement.dimensions:
+            uniques, first_index, groups = np.unique(group_key, return_index=True, return_inverse=True)
+            size = len(uniques)
+        else:
+            # The () grouping set always yields one row, even over an empty table
+            first_index, groups, size = np.zeros(1, dtype=np.int64), np.zeros(n, dtype=np.int64), 1
+
+        measures = _Measures(snap, groups.ravel(), size)
+        rows = []
+        for g in range(size):
+            row = {}
+            for d in statement.dimensions:
+                codes, labels = dimension_cache[d]
+                row[d] = labels[codes[first_index[g]]] if n else None
+            for m in statement.measures:
+                row[m] = measures.value(m, g)
+            rows.append(row)
+        return rows
+
+
+class _Measures:
+    """Per-group aggregates of one grouping set, computed lazily with bincount."""
+
+    def __init__(self, snap: Snapshot, groups: np.ndarray, size: int):
+        self.snap = snap
+        self.groups = groups
+        self.size = size
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def _count(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        groups = self.groups if mask is None else self.groups[mask]
+        return np.bincount(groups, minlength=self.size)
+
+    def _array(self, name: str) -> np.ndarray:
+        if name in self._cache:
+            return self._cache[name]
+        cols = self.snap.columns
+        if name == "bookings":
+            value = self._count()
+        elif name == "canceled":
+            canceled = cols["is_canceled"]
+            value = self._count(canceled.values & canceled.valid)
+        elif name in ("revenue", "revenue_count", "recent_revenue", "recent_revenue_count", "recent_bookings"):
+            adr, week, weekend = cols["adr"], cols["stays_in_week_nights"], cols["stays_in_weekend_nights"]
+            mask = adr.valid & week.valid & weekend.valid
+            if name.startswith("recent"):
+                arrival = cols["arrival_date"]
+                cutoff = np.datetime64(months_before(self.snap.current_date, 6), "D")
+                in_window = arrival.valid & (arrival.values >= cutoff)
+                mask = in_window if name == "recent_bookings" else mask & in_window
+            if name.endswith("count") or name == "recent_bookings":
+                value = self._count(mask)
+            else:
+                revenue = adr.values[mask] * (week.values[mask] + weekend.values[mask]).astype(np.float64)
+                # bincount adds in row order, like Postgres' float8 SUM over a sequential scan
+                value = np.bincount(self.groups[mask], weights=revenue, minlength=self.size)
+        elif name in ("lead_time_sum", "lead_time_count"):
+            lead = cols["lead_time"]
+            if name == "lead_time_count":
+                value = self._count(lead.valid)
+            else:
+                value = np.zeros(self.size, dtype=np.int64)
+                np.add.at(value, self.groups[lead.valid], lead.values[lead.valid])
+        elif name == "last_minute":
+            lead = cols["lead_time"]
+            value = self._count(lead.valid & (lead.values < 7))
+        else:
+            raise KeyError(name)
+        self._cache[name] = value
+        return value
+
+    def value(self, measure: str, g: int) -> Any:
+        bookings = int(self._array("bookings")[g])
+        if measure == "total_bookings":
+            return bookings
+        if measure == "canceled_bookings":
+            return int(self._array("canceled")[g]) if bookings else None
+        if measure == "total_revenue":
+            return float(self._array("revenue")[g]) if self._array("revenue_count")[g] else None
+        if measure == "recent_revenue":
+            return float(self._array("recent_revenue")[g]) if self._array("recent_revenue_count")[g] else None
+        if measure == "recent_bookings":
+            return int(self._array("recent_bookings")[g])
+        if measure == "cancellation_rate":
+            return pg_percentage(int(self._array("canceled")[g]), bookings)
+        if measure == "unrounded_cancellation_rate":
+            # SUM(...) * 100.0 / COUNT(*)
+            if not bookings:
+                return None
+            return pg_div(Decimal(100 * int(self._array("canceled")[g])), Decimal(bookings), 1, 0)
+        if measure == "booking_percentage":
+            return pg_percentage(bookings, int(self._array("bookings").sum()))
+        if measure == "average_lead_time":
+            count = int(self._array("lead_time_count")[g])
+            if not count:
+                return None
+            return pg_div(Decimal(int(self._array("lead_time_sum")[g])), Decimal(count), 0, 0)
+        if measure == "percentage_last_minute_bookings":
+            return pg_percentage(int(self._array("last_minute")[g]), bookings)
+        raise KeyError(measure)
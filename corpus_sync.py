@@ -0,0 +1,174 @@
+"""Incremental sync of the parsed PDF answers into the HotelAnalytics collection.
+
+Every answer gets a deterministic UUID from (section, index, text hash), so
+the collection can be diffed against the corpus: answers whose UUID is
+missing are inserted, objects whose UUID is no longer in the corpus are
+deleted, and unchanged answers are left alone. Vectors come from a local
+embedding cache keyed by the text, and only new text is sent to Ollama.
+
+    python corpus_sync.py             # sync the collection with the PDFs
+    python corpus_sync.py --dry-run   # report what would change
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ollama_client import EMBEDDING_MODEL, embed, new_client
+from weaviate_store import COLLECTION_NAME, WeaviateStore
+
+SYNC_NAMESPACE = uuid.UUID("5d6c1b5e-8f0a-4c57-9d1e-3f2a7b9c4e10")
+SYNC_BATCH_SIZE = 100
+CACHE_FORMAT = 1
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def object_uuid(item: Dict[str, Any]) -> str:
+    return str(uuid.uuid5(SYNC_NAMESPACE, f"{item['section']}\x00{item['index']}\x00{text_hash(item['text'])}"))
+
+
+class EmbeddingCache:
+    """Vectors of answer texts by (model, text hash), persisted as JSON next to the PDFs."""
+
+    def __init__(self, path: str, model: str = EMBEDDING_MODEL):
+        self.path = path
+        self.model = model
+        self._vectors: Dict[str, List[float]] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("format") == CACHE_FORMAT and stored.get("model") == model:
+                self._vectors = stored["vectors"]
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def get(self, text: str) -> Optional[List[float]]:
+        return self._vectors.get(text_hash(text))
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        for text, vector in zip(texts, vectors):
+            self._vectors[text_hash(text)] = vector
+
+    def retain(self, texts: List[str]):
+        """Drop vectors of texts that are no longer in the corpus."""
+        keep = {text_hash(text) for text in texts}
+        self._vectors = {key: vector for key, vector in self._vectors.items() if key in keep}
+
+    def persist(self):
+        directory = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"format": CACHE_FORMAT, "model": self.model, "vectors": self._vectors}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not persist the embedding cache: {e}")
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    added: int
+    deleted: int
+    unchanged: int
+    embedded: int  # vectors computed by Ollama rather than taken from the cache
+
+
+class CorpusSync:
+    """Keeps HotelAnalytics in line with the parsed corpus, touching only what changed."""
+
+    def __init__(self, store: WeaviateStore, embedding_cache_path: str):
+        self.store = store
+        self.embeddings = EmbeddingCache(embedding_cache_path)
+        self._synced: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def is_synced(self, data: List[Dict[str, Any]]) -> bool:
+        # PdfCorpusCache hands out the same list until a PDF changes
+        return data is self._synced
+
+    def existing_ids(self) -> List[str]:
+        return self.store.run(lambda col: [str(obj.uuid) for obj in col.iterator(return_properties=["section"])])
+
+    def _vectors(self, texts: List[str]):
+        """Vectors for ``texts``, embedding cache misses with one Ollama call (None if Ollama is unreachable)."""
+        missing = list(dict.fromkeys(text for text in texts if self.embeddings.get(text) is None))
+        if missing:
+            async def embed_missing():
+                async with new_client() as client:
+                    return await embed(missing, client)
+
+            try:
+                self.embeddings.put_many(missing, asyncio.run(embed_missing()))
+            except Exception as e:
+                # Weaviate's text2vec-ollama module vectorizes objects sent without a vector
+                print(f"⚠️ Could not embed {len(missing)} answers ({e}), leaving them to Weaviate")
+                return [self.embeddings.get(text) for text in texts], 0
+        return [self.embeddings.get(text) for text in texts], len(missing)
+
+    def sync(self, data: List[Dict[str, Any]], dry_run: bool = False) -> SyncResult:
+        from weaviate.classes.data import DataObject
+        from weaviate.classes.query import Filter
+
+        with self._lock:
+            desired = {object_uuid(item): item for item in data}
+            existing = set(self.existing_ids())
+            added = [key for key in desired if key not in existing]
+            deleted = [key for key in existing if key not in desired]
+            embedded = 0
+            if not dry_run:
+                vectors, embedded = self._vectors([desired[key]["text"] for key in added])
+                for i in range(0, len(added), SYNC_BATCH_SIZE):
+                    batch = [
+                        DataObject(
+                            properties={field: desired[key][field] for field in ("section", "index", "text")},
+                            uuid=key,
+                            vector=vector,
+                        )
+                        for key, vector in zip(added[i:i + SYNC_BATCH_SIZE], vectors[i:i + SYNC_BATCH_SIZE])
+                    ]
+                    result = self.store.run(lambda col: col.data.insert_many(batch))
+                    if result.errors:
+                        raise RuntimeError(f"{len(result.errors)} answers could not be inserted: {next(iter(result.errors.values()))}")
+                for i in range(0, len(deleted), SYNC_BATCH_SIZE):
+                    ids = deleted[i:i + SYNC_BATCH_SIZE]
+                    self.store.run(lambda col: col.data.delete_many(where=Filter.by_id().contains_any(ids)))
+                if embedded:
+                    self.embeddings.retain([item["text"] for item in data])
+                    self.embeddings.persist()
+                self._synced = data
+            result = SyncResult(len(added), len(deleted), len(desired) - len(added), embedded)
+        if added or deleted:
+            verb = "Would sync" if dry_run else "Synced"
+            print(f"✅ {verb} {COLLECTION_NAME}: +{result.added} -{result.deleted} "
+                  f"({result.unchanged} unchanged, {result.embedded} embedded)")
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the HotelAnalytics collection with the report PDFs")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    import app
+
+    try:
+        data = app.extract_answers_from_pdfs()
+        app.weaviate_store.bootstrap()
+        result = app.corpus_sync.sync(data, dry_run=args.dry_run)
+        if not (result.added or result.deleted):
+            print(f"✅ {COLLECTION_NAME} is up to date ({result.unchanged} answers)")
+    finally:
+        app.weaviate_store.close()
+
+
+if __name__ == "__main__":
+    main()
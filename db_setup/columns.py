@@ -0,0 +1,25 @@
+# Columns of hotel_bookings loaded from the CSV (last_updated is set by the database)
+BOOKING_COLUMNS = [
+    'hotel', 'lead_time', 'arrival_date_week_number',
+    'stays_in_weekend_nights', 'stays_in_week_nights',
+    'adults', 'children', 'babies', 'meal', 'country',
+    'market_segment', 'distribution_channel',
+    'previous_cancellations', 'previous_bookings_not_canceled',
+    'reserved_room_type', 'assigned_room_type', 'booking_changes',
+    'deposit_type', 'agent', 'company', 'days_in_waiting_list',
+    'customer_type', 'adr', 'required_car_parking_spaces',
+    'total_of_special_requests', 'reservation_status',
+    'reservation_status_date', 'arrival_date',
+    'is_canceled', 'is_repeated_guest'
+]
+
+# Column types the CSV values are converted to before COPY
+BOOKING_BOOLEAN_COLUMNS = ['is_canceled', 'is_repeated_guest']
+BOOKING_DATE_COLUMNS = ['reservation_status_date', 'arrival_date']
+BOOKING_INTEGER_COLUMNS = [
+    'lead_time', 'arrival_date_week_number', 'stays_in_weekend_nights',
+    'stays_in_week_nights', 'adults', 'children', 'babies',
+    'previous_cancellations', 'previous_bookings_not_canceled',
+    'booking_changes', 'agent', 'company', 'days_in_waiting_list',
+    'required_car_parking_spaces', 'total_of_special_requests'
+]
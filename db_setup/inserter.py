@@ -1,56 +1,162 @@
+"""Streaming bulk loader for hotel_bookings.
+
+Reads the CSV in fixed-size chunks, converts each chunk's types, COPYs it
+into a temporary staging table and merges it into hotel_bookings with one
+INSERT ... SELECT per chunk. The loader's memory stays constant in the file size:
+
+    python db_setup/inserter.py --batch-size 50000
+
+Each chunk is its own transaction, so the data version and the rollup's
+snapshot-based refresh see one change per batch rather than one per row.
+Rows are identified by a hash of their contents and of how many identical
+rows came before them in the file (booking_hash), so identical bookings are
+all loaded while rows that are already loaded are skipped: re-running the
+loader on the same file inserts nothing. Pending schema migrations
+(db_setup/migrate.py) are applied first.
+"""
+import argparse
+import io
 import os
+from time import perf_counter
+
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
-
-# --- Step 1: Load CSV ---
-csv_file_path = os.path.join("db_setup", "hotel_data_no_true_duplicates.csv")
-df = pd.read_csv(csv_file_path)
-
-# Convert int columns to proper types if needed
-df['is_canceled'] = df['is_canceled'].astype(bool)
-df['is_repeated_guest'] = df['is_repeated_guest'].astype(bool)
-df['reservation_status_date'] = pd.to_datetime(df['reservation_status_date'])
-df['arrival_date'] = pd.to_datetime(df['arrival_date'])
-
-# --- Step 2: Database Connection ---
-conn = psycopg2.connect(
-    host="localhost",
-    database="hotel_data",
-    user="postgres",
-    password="postgres"
-)
-cursor = conn.cursor()
-
-# --- Step 3: Prepare Insert ---
-columns = [
-    'hotel', 'lead_time', 'arrival_date_week_number',
-    'stays_in_weekend_nights', 'stays_in_week_nights',
-    'adults', 'children', 'babies', 'meal', 'country',
-    'market_segment', 'distribution_channel',
-    'previous_cancellations', 'previous_bookings_not_canceled',
-    'reserved_room_type', 'assigned_room_type', 'booking_changes',
-    'deposit_type', 'agent', 'company', 'days_in_waiting_list',
-    'customer_type', 'adr', 'required_car_parking_spaces',
-    'total_of_special_requests', 'reservation_status',
-    'reservation_status_date', 'arrival_date',
-    'is_canceled', 'is_repeated_guest'
-]
-
-# Turn DataFrame into list of tuples
-data = [tuple(x) for x in df[columns].to_numpy()]
-
-# --- Step 4: Insert Query ---
-query = f"""
-    INSERT INTO hotel_bookings ({', '.join(columns)})
-    VALUES %s
+from columns import BOOKING_BOOLEAN_COLUMNS, BOOKING_COLUMNS, BOOKING_DATE_COLUMNS, BOOKING_INTEGER_COLUMNS
+from migrate import apply_migrations
+
+CSV_FILE_PATH = os.path.join("db_setup", "hotel_data_no_true_duplicates.csv")
+STAGING_TABLE = "hotel_bookings_staging"
+COPIES_TABLE = "hotel_bookings_copies"
+
+columns = ", ".join(BOOKING_COLUMNS)
+
+CONTENT_HASH = f"md5(ROW({columns})::text)"
+
+# Emptied by every commit, i.e. after each batch; source_row numbers the CSV
+# rows across batches. The copies table counts each distinct row seen so far
+# in the file and lives as long as the connection.
+CREATE_STAGING = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DELETE ROWS AS
+    SELECT {columns} FROM hotel_bookings WITH NO DATA;
+    ALTER TABLE {STAGING_TABLE} ADD COLUMN source_row BIGINT GENERATED ALWAYS AS IDENTITY;
+    CREATE TEMP TABLE {COPIES_TABLE} (content_hash TEXT PRIMARY KEY, copies BIGINT NOT NULL);
+"""
+
+COPY_STAGING = f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')"
+
+# New arrival years get their own partition before the merge (only years with rows)
+ENSURE_PARTITIONS = f"""
+    SELECT ensure_booking_partitions(MIN(arrival_date), MAX(arrival_date))
+    FROM {STAGING_TABLE}
+    GROUP BY EXTRACT(YEAR FROM arrival_date)
+"""
+
+# The n-th identical row of the file hashes as md5(content || '#n'); the first
+# keeps the plain content hash, as loaded before identical rows were counted.
+# NULLs never conflict in the unique index, so rows without an arrival_date
+# (in the default partition) are skipped by an explicit lookup instead.
+# last_updated comes from its default, NOW(), which is the same for the whole batch
+MERGE = f"""
+    WITH staged AS (
+        SELECT *, {CONTENT_HASH} AS content_hash
+        FROM {STAGING_TABLE}
+    ), numbered AS (
+        SELECT staged.*,
+               COALESCE(c.copies, 0)
+                   + ROW_NUMBER() OVER (PARTITION BY staged.content_hash ORDER BY source_row) AS copy
+        FROM staged
+        LEFT JOIN {COPIES_TABLE} c USING (content_hash)
+    ), counted AS (
+        INSERT INTO {COPIES_TABLE} (content_hash, copies)
+        SELECT content_hash, MAX(copy) FROM numbered GROUP BY content_hash
+        ON CONFLICT (content_hash) DO UPDATE SET copies = EXCLUDED.copies
+    ), hashed AS (
+        SELECT numbered.*,
+               CASE WHEN copy = 1 THEN content_hash ELSE md5(content_hash || '#' || copy) END AS booking_hash
+        FROM numbered
+    )
+    INSERT INTO hotel_bookings ({columns}, booking_hash)
+    SELECT {columns}, booking_hash
+    FROM hashed
+    WHERE arrival_date IS NOT NULL
+       OR NOT EXISTS (
+           SELECT 1 FROM hotel_bookings loaded
+           WHERE loaded.arrival_date IS NULL AND loaded.booking_hash = hashed.booking_hash
+       )
+    ON CONFLICT (booking_hash, arrival_date) DO NOTHING;
 """
 
-execute_values(cursor, query, data)
-conn.commit()
 
-# --- Step 5: Clean Up ---
-cursor.close()
-conn.close()
+def read_chunks(path, batch_size):
+    for chunk in pd.read_csv(path, usecols=BOOKING_COLUMNS, chunksize=batch_size):
+        # Integer columns with missing values are read as floats (9.0); COPY needs 9
+        for column in BOOKING_INTEGER_COLUMNS:
+            chunk[column] = chunk[column].astype("Int64")
+        for column in BOOKING_BOOLEAN_COLUMNS:
+            chunk[column] = chunk[column].astype(bool)
+        for column in BOOKING_DATE_COLUMNS:
+            chunk[column] = pd.to_datetime(chunk[column])
+        yield chunk[BOOKING_COLUMNS]
+
+
+def to_copy_buffer(chunk):
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, header=False, index=False, date_format="%Y-%m-%d")
+    buffer.seek(0)
+    return buffer
+
+
+def load(conn, path, batch_size):
+    apply_migrations(conn)
+    cursor = conn.cursor()
+    cursor.execute(CREATE_STAGING)
+    conn.commit()
+
+    start = perf_counter()
+    read = inserted = copied = 0
+    for batch, chunk in enumerate(read_chunks(path, batch_size), start=1):
+        buffer = to_copy_buffer(chunk)
+        cursor.copy_expert(COPY_STAGING, buffer)
+        cursor.execute(ENSURE_PARTITIONS)
+        cursor.execute(MERGE)
+        batch_inserted = cursor.rowcount
+        conn.commit()
+
+        read += len(chunk)
+        inserted += batch_inserted
+        copied += buffer.tell()
+        elapsed = perf_counter() - start
+        print(
+            f"📦 Batch {batch}: {batch_inserted} of {len(chunk)} rows inserted | "
+            f"{read:,} rows so far, {read / elapsed:,.0f} rows/s, {copied / 2**20 / elapsed:.1f} MiB/s"
+        )
+
+    cursor.close()
+    return read, inserted, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a bookings CSV into hotel_bookings")
+    parser.add_argument("csv", nargs="?", default=CSV_FILE_PATH)
+    parser.add_argument("--batch-size", type=int, default=50000, help="CSV rows per COPY and merge")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host="localhost",
+        database="hotel_data",
+        user="postgres",
+        password="postgres"
+    )
+    try:
+        read, inserted, elapsed = load(conn, args.csv, args.batch_size)
+    finally:
+        conn.close()
+
+    print(
+        f"✅ Data inserted successfully! {inserted} of {read} rows inserted "
+        f"({read - inserted} already loaded) in {elapsed:.1f}s, {read / max(elapsed, 1e-9):,.0f} rows/s"
+    )
+
 
-print("✅ Data inserted successfully!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Versioned schema migrations for the hotel_data database.
+
+Migrations are the numbered .sql files in db_setup/migrations. Each one runs
+in its own transaction and is recorded in schema_migrations, so running this
+again only applies the new ones:
+
+    python db_setup/migrate.py            # apply pending migrations
+    python db_setup/migrate.py --status   # list applied / pending
+"""
+import argparse
+import os
+
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Migrations that were renumbered after being applied somewhere: old version -> new
+RENAMED = {
+    "002_partition_bookings": "006_partition_bookings",
+}
+
+
+def available_migrations():
+    """(version, path) of every migration file, in order."""
+    names = sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+    return [(name[:-len(".sql")], os.path.join(MIGRATIONS_DIR, name)) for name in names]
+
+
+def applied_migrations(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+            )
+        """)
+        for old, new in RENAMED.items():
+            cursor.execute(
+                "UPDATE schema_migrations SET version = %s WHERE version = %s",
+                (new, old),
+            )
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return applied
+
+
+def apply_migrations(conn):
+    """Apply every pending migration; returns the versions applied."""
+    applied = applied_migrations(conn)
+    done = []
+    for version, path in available_migrations():
+        if version in applied:
+            continue
+        with open(path) as f:
+            sql = f.read()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"❌ Migration {version} failed, rolled back")
+            raise
+        print(f"✅ Applied migration {version}")
+        done.append(version)
+    if done:
+        # Fresh statistics and visibility map for the rewritten tables
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("VACUUM (ANALYZE) hotel_bookings")
+        finally:
+            conn.autocommit = False
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the schema migrations in db_setup/migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host="localhost",
+        database="hotel_data",
+        user="postgres",
+        password="postgres"
+    )
+    try:
+        if args.status:
+            applied = applied_migrations(conn)
+            for version, _ in available_migrations():
+                print(f"{'applied' if version in applied else 'pending':8} {version}")
+        elif not apply_migrations(conn):
+            print("✅ Schema is up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
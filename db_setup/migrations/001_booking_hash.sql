@@ -0,0 +1,27 @@
+-- booking_hash identifies a loaded row (see db_setup/inserter.py), and inserts
+-- take last_updated from the column default instead of a per-row trigger.
+-- Databases created from the current queries.sql already have both.
+ALTER TABLE hotel_bookings ADD COLUMN IF NOT EXISTS booking_hash TEXT;
+
+UPDATE hotel_bookings
+SET booking_hash = md5(ROW(
+    hotel, lead_time, arrival_date_week_number,
+    stays_in_weekend_nights, stays_in_week_nights,
+    adults, children, babies, meal, country,
+    market_segment, distribution_channel,
+    previous_cancellations, previous_bookings_not_canceled,
+    reserved_room_type, assigned_room_type, booking_changes,
+    deposit_type, agent, company, days_in_waiting_list,
+    customer_type, adr, required_car_parking_spaces,
+    total_of_special_requests, reservation_status,
+    reservation_status_date, arrival_date,
+    is_canceled, is_repeated_guest
+)::text)
+WHERE booking_hash IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS hotel_bookings_booking_hash_idx ON hotel_bookings (booking_hash);
+
+CREATE OR REPLACE TRIGGER update_last_updated_trigger
+BEFORE UPDATE ON hotel_bookings
+FOR EACH ROW
+EXECUTE FUNCTION update_last_updated_column();
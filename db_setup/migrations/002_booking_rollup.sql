@@ -0,0 +1,92 @@
+-- Aggregate rollup (fact cube) served to the /analytics endpoints, maintained
+-- incrementally by analytics_rollup.refresh_rollup(). Updated and deleted rows
+-- are captured by statement triggers and subtracted on the next refresh.
+-- Safe to run on databases that already have these objects.
+CREATE TABLE IF NOT EXISTS booking_rollup (
+    cell_key TEXT PRIMARY KEY,
+    arrival_month DATE,
+    hotel TEXT,
+    country TEXT,
+    market_segment TEXT,
+    reserved_room_type TEXT,
+    deposit_type TEXT,
+    lead_time_category TEXT,
+    total_of_special_requests BIGINT,
+    is_canceled BOOLEAN,
+    bookings BIGINT NOT NULL DEFAULT 0,
+    revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+    revenue_count BIGINT NOT NULL DEFAULT 0,
+    lead_time_sum NUMERIC NOT NULL DEFAULT 0,
+    lead_time_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- Day-level revenue for date-window metrics (e.g. last 6 months)
+CREATE TABLE IF NOT EXISTS booking_rollup_daily (
+    arrival_date DATE PRIMARY KEY,
+    bookings BIGINT NOT NULL DEFAULT 0,
+    revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+    revenue_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- last_updated watermark up to which rows are folded into the rollup
+CREATE TABLE IF NOT EXISTS booking_rollup_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    watermark TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT '-infinity'
+);
+INSERT INTO booking_rollup_state DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- Old versions of updated/deleted rows, subtracted on the next refresh
+CREATE TABLE IF NOT EXISTS booking_rollup_retractions (
+    hotel TEXT,
+    lead_time BIGINT,
+    stays_in_weekend_nights BIGINT,
+    stays_in_week_nights BIGINT,
+    country TEXT,
+    market_segment TEXT,
+    reserved_room_type TEXT,
+    deposit_type TEXT,
+    adr DOUBLE PRECISION,
+    total_of_special_requests BIGINT,
+    arrival_date DATE,
+    is_canceled BOOLEAN,
+    last_updated TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE OR REPLACE FUNCTION capture_rollup_retractions()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO booking_rollup_retractions
+  SELECT hotel, lead_time, stays_in_weekend_nights, stays_in_week_nights, country,
+         market_segment, reserved_room_type, deposit_type, adr,
+         total_of_special_requests, arrival_date, is_canceled, last_updated
+  FROM old_rows;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER rollup_retract_on_update
+AFTER UPDATE ON hotel_bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION capture_rollup_retractions();
+
+CREATE OR REPLACE TRIGGER rollup_retract_on_delete
+AFTER DELETE ON hotel_bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION capture_rollup_retractions();
+
+-- TRUNCATE bypasses the triggers above, so start the rollup over instead
+CREATE OR REPLACE FUNCTION reset_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+  TRUNCATE booking_rollup, booking_rollup_daily, booking_rollup_retractions;
+  UPDATE booking_rollup_state SET watermark = '-infinity';
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER rollup_reset_on_truncate
+AFTER TRUNCATE ON hotel_bookings
+FOR EACH STATEMENT
+EXECUTE FUNCTION reset_rollup();
@@ -0,0 +1,27 @@
+-- Data version bumped once per writing statement; the API listens on the
+-- analytics_data_version channel instead of scanning hotel_bookings.
+-- Safe to run on databases that already have these objects.
+CREATE TABLE IF NOT EXISTS analytics_data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+INSERT INTO analytics_data_version DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_analytics_data_version()
+RETURNS TRIGGER AS $$
+DECLARE
+  new_version BIGINT;
+BEGIN
+  UPDATE analytics_data_version
+  SET version = version + 1, updated_at = NOW()
+  RETURNING version INTO new_version;
+  PERFORM pg_notify('analytics_data_version', new_version::TEXT);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER bump_analytics_data_version_trigger
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hotel_bookings
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_analytics_data_version();
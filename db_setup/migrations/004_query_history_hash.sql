@@ -0,0 +1,29 @@
+-- /ask answers are keyed by the sha256 of the normalized question
+-- (answer_cache.normalize_query): lowercased NFKC text with whitespace runs
+-- collapsed, curly quotes made straight, and the quotes around the question
+-- and the sentence punctuation at its end dropped. Every row is rekeyed, then
+-- duplicates are merged keeping the newest answer.
+ALTER TABLE query_history ADD COLUMN IF NOT EXISTS query_hash TEXT;
+DROP INDEX IF EXISTS query_history_query_hash_idx;
+
+UPDATE query_history
+SET query_hash = encode(sha256(convert_to(
+    regexp_replace(
+        btrim(regexp_replace(
+            lower(translate(normalize(COALESCE(user_query, ''), NFKC), E'‘’“”', E'''\'""')),
+            '\s+', ' ', 'g'
+        )),
+        '^["''\s]+|[\s"''?!.,;:]+$', '', 'g'
+    ),
+    'UTF8'
+)), 'hex');
+
+DELETE FROM query_history older
+USING query_history newer
+WHERE older.query_hash = newer.query_hash
+  AND (COALESCE(older.created_at, '-infinity'), older.id) < (COALESCE(newer.created_at, '-infinity'), newer.id);
+
+ALTER TABLE query_history ALTER COLUMN query_hash SET NOT NULL;
+
+-- One answer per normalized question; also serves the /ask cache lookup
+CREATE UNIQUE INDEX query_history_query_hash_idx ON query_history (query_hash);
@@ -0,0 +1,3 @@
+-- Progress of the background faithfulness evaluation of an answer:
+-- NULL (not requested), 'pending', 'done' or 'failed'
+ALTER TABLE query_history ADD COLUMN IF NOT EXISTS evaluation_status TEXT;
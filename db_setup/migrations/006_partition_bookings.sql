@@ -0,0 +1,156 @@
+-- hotel_bookings rebuilt for the analytics workload:
+--   * range-partitioned by arrival_date (one partition per year, plus a
+--     default partition for NULL dates), so date windows skip old years
+--   * enums for the low-cardinality labels and SMALLINT/INTEGER for counts,
+--     with fixed-width columns ordered by alignment to avoid padding
+--   * BRIN indexes on arrival_date and last_updated (rows arrive roughly in
+--     both orders) and covering indexes for the country / market_segment /
+--     hotel group-bys
+-- Rows are copied with their last_updated, so the rollup stays valid.
+
+CREATE TYPE booking_hotel AS ENUM ('City Hotel', 'Resort Hotel');
+CREATE TYPE booking_meal AS ENUM ('BB', 'FB', 'HB', 'SC', 'Undefined');
+CREATE TYPE booking_market_segment AS ENUM (
+    'Aviation', 'Complementary', 'Corporate', 'Direct', 'Groups', 'Offline TA/TO', 'Online TA', 'Undefined'
+);
+CREATE TYPE booking_distribution_channel AS ENUM ('Corporate', 'Direct', 'GDS', 'TA/TO', 'Undefined');
+CREATE TYPE booking_deposit_type AS ENUM ('No Deposit', 'Non Refund', 'Refundable');
+CREATE TYPE booking_customer_type AS ENUM ('Contract', 'Group', 'Transient', 'Transient-Party');
+CREATE TYPE booking_reservation_status AS ENUM ('Canceled', 'Check-Out', 'No-Show');
+
+ALTER TABLE hotel_bookings RENAME TO hotel_bookings_unpartitioned;
+DROP INDEX hotel_bookings_booking_hash_idx;
+
+CREATE TABLE hotel_bookings (
+    adr DOUBLE PRECISION,
+    last_updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    arrival_date DATE,
+    reservation_status_date DATE,
+    hotel booking_hotel,
+    meal booking_meal,
+    market_segment booking_market_segment,
+    distribution_channel booking_distribution_channel,
+    deposit_type booking_deposit_type,
+    customer_type booking_customer_type,
+    reservation_status booking_reservation_status,
+    agent INTEGER,
+    company INTEGER,
+    lead_time SMALLINT,
+    arrival_date_week_number SMALLINT,
+    stays_in_weekend_nights SMALLINT,
+    stays_in_week_nights SMALLINT,
+    adults SMALLINT,
+    children SMALLINT,
+    babies SMALLINT,
+    previous_cancellations SMALLINT,
+    previous_bookings_not_canceled SMALLINT,
+    booking_changes SMALLINT,
+    days_in_waiting_list SMALLINT,
+    required_car_parking_spaces SMALLINT,
+    total_of_special_requests SMALLINT,
+    is_canceled BOOLEAN,
+    is_repeated_guest BOOLEAN,
+    country TEXT,
+    reserved_room_type TEXT,
+    assigned_room_type TEXT,
+    booking_hash TEXT
+) PARTITION BY RANGE (arrival_date);
+
+CREATE TABLE hotel_bookings_default PARTITION OF hotel_bookings DEFAULT;
+
+-- Yearly partitions covering first_day..last_day; the loader calls this for
+-- every batch so new years never end up in the default partition
+-- (replaced by 007_booking_partitions_default.sql)
+CREATE OR REPLACE FUNCTION ensure_booking_partitions(first_day DATE, last_day DATE)
+RETURNS VOID AS $$
+DECLARE
+  year INT;
+BEGIN
+  IF first_day IS NULL OR last_day IS NULL THEN
+    RETURN;
+  END IF;
+  FOR year IN EXTRACT(YEAR FROM first_day)::INT .. EXTRACT(YEAR FROM last_day)::INT LOOP
+    IF to_regclass(format('hotel_bookings_%s', year)) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF hotel_bookings FOR VALUES FROM (%L) TO (%L)',
+        format('hotel_bookings_%s', year), make_date(year, 1, 1), make_date(year + 1, 1, 1)
+      );
+    END IF;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only years that have bookings; empty partitions only add planning overhead
+SELECT ensure_booking_partitions(MIN(arrival_date), MAX(arrival_date))
+FROM hotel_bookings_unpartitioned
+GROUP BY EXTRACT(YEAR FROM arrival_date);
+
+INSERT INTO hotel_bookings (
+    adr, last_updated, arrival_date, reservation_status_date,
+    hotel, meal, market_segment, distribution_channel, deposit_type, customer_type, reservation_status,
+    agent, company, lead_time, arrival_date_week_number, stays_in_weekend_nights, stays_in_week_nights,
+    adults, children, babies, previous_cancellations, previous_bookings_not_canceled, booking_changes,
+    days_in_waiting_list, required_car_parking_spaces, total_of_special_requests,
+    is_canceled, is_repeated_guest, country, reserved_room_type, assigned_room_type, booking_hash
+)
+SELECT
+    adr, last_updated, arrival_date, reservation_status_date,
+    hotel::booking_hotel, meal::booking_meal, market_segment::booking_market_segment,
+    distribution_channel::booking_distribution_channel, deposit_type::booking_deposit_type,
+    customer_type::booking_customer_type, reservation_status::booking_reservation_status,
+    agent, company, lead_time, arrival_date_week_number, stays_in_weekend_nights, stays_in_week_nights,
+    adults, children, babies, previous_cancellations, previous_bookings_not_canceled, booking_changes,
+    days_in_waiting_list, required_car_parking_spaces, total_of_special_requests,
+    is_canceled, is_repeated_guest, country, reserved_room_type, assigned_room_type, booking_hash
+FROM hotel_bookings_unpartitioned;
+
+DROP TABLE hotel_bookings_unpartitioned;
+
+-- Unique keys on a partitioned table must include the partition key
+CREATE UNIQUE INDEX hotel_bookings_booking_hash_idx ON hotel_bookings (booking_hash, arrival_date);
+CREATE INDEX hotel_bookings_arrival_date_brin ON hotel_bookings USING BRIN (arrival_date);
+CREATE INDEX hotel_bookings_last_updated_brin ON hotel_bookings USING BRIN (last_updated);
+CREATE INDEX hotel_bookings_country_idx ON hotel_bookings (country)
+    INCLUDE (is_canceled, adr, stays_in_week_nights, stays_in_weekend_nights);
+CREATE INDEX hotel_bookings_market_segment_idx ON hotel_bookings (market_segment)
+    INCLUDE (is_canceled, adr, stays_in_week_nights, stays_in_weekend_nights);
+CREATE INDEX hotel_bookings_hotel_idx ON hotel_bookings (hotel)
+    INCLUDE (is_canceled, adr, stays_in_week_nights, stays_in_weekend_nights);
+
+-- The triggers went away with the old table
+CREATE TRIGGER update_last_updated_trigger
+BEFORE UPDATE ON hotel_bookings
+FOR EACH ROW
+EXECUTE FUNCTION update_last_updated_column();
+
+CREATE TRIGGER rollup_retract_on_update
+AFTER UPDATE ON hotel_bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION capture_rollup_retractions();
+
+CREATE TRIGGER rollup_retract_on_delete
+AFTER DELETE ON hotel_bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION capture_rollup_retractions();
+
+CREATE TRIGGER rollup_reset_on_truncate
+AFTER TRUNCATE ON hotel_bookings
+FOR EACH STATEMENT
+EXECUTE FUNCTION reset_rollup();
+
+CREATE TRIGGER bump_analytics_data_version_trigger
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hotel_bookings
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_analytics_data_version();
+
+-- Retracted rows are merged with new ones in refresh_rollup, so the types must match
+ALTER TABLE booking_rollup_retractions
+    ALTER COLUMN hotel TYPE booking_hotel USING hotel::booking_hotel,
+    ALTER COLUMN market_segment TYPE booking_market_segment USING market_segment::booking_market_segment,
+    ALTER COLUMN deposit_type TYPE booking_deposit_type USING deposit_type::booking_deposit_type,
+    ALTER COLUMN lead_time TYPE SMALLINT,
+    ALTER COLUMN stays_in_weekend_nights TYPE SMALLINT,
+    ALTER COLUMN stays_in_week_nights TYPE SMALLINT,
+    ALTER COLUMN total_of_special_requests TYPE SMALLINT;
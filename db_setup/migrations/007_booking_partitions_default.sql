@@ -0,0 +1,54 @@
+-- ensure_booking_partitions used to fail once the default partition held rows
+-- for the year being added (the new range would overlap them). The rows are
+-- now moved into the new partition before it is attached. They are moved as
+-- they are, so the rollup and data version don't see a change.
+CREATE OR REPLACE FUNCTION ensure_booking_partitions(first_day DATE, last_day DATE)
+RETURNS VOID AS $$
+DECLARE
+  year INT;
+  part_name TEXT;
+BEGIN
+  IF first_day IS NULL OR last_day IS NULL THEN
+    RETURN;
+  END IF;
+  FOR year IN EXTRACT(YEAR FROM first_day)::INT .. EXTRACT(YEAR FROM last_day)::INT LOOP
+    part_name := format('hotel_bookings_%s', year);
+    IF to_regclass(part_name) IS NULL THEN
+      EXECUTE format('CREATE TABLE %I (LIKE hotel_bookings INCLUDING DEFAULTS)', part_name);
+      EXECUTE format(
+        'WITH moved AS (
+           DELETE FROM hotel_bookings_default
+           WHERE arrival_date >= %L AND arrival_date < %L
+           RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        make_date(year, 1, 1), make_date(year + 1, 1, 1), part_name
+      );
+      EXECUTE format(
+        'ALTER TABLE hotel_bookings ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+      );
+    END IF;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Earlier versions pre-created partitions from the first booking up to a year
+-- ahead; drop the ones that are still empty. New years are added on load.
+DO $$
+DECLARE
+  part REGCLASS;
+  has_rows BOOLEAN;
+BEGIN
+  FOR part IN
+    SELECT inhrelid::REGCLASS FROM pg_inherits
+    WHERE inhparent = 'hotel_bookings'::REGCLASS
+      AND inhrelid <> 'hotel_bookings_default'::REGCLASS
+  LOOP
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s)', part) INTO has_rows;
+    IF NOT has_rows THEN
+      EXECUTE format('DROP TABLE %s', part);
+    END IF;
+  END LOOP;
+END;
+$$;
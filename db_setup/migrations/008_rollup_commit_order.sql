@@ -0,0 +1,54 @@
+-- The rollup and the NumPy engine used to pick up changes by last_updated,
+-- which is set when a row is written, not when its transaction commits: rows
+-- of a transaction that committed after a refresh, with an older timestamp
+-- than the refresh saw, were never folded in. Rows now carry the id of the
+-- transaction that last wrote them, and a refresh stores its snapshot; the
+-- next one folds exactly the rows whose transaction was not visible in it.
+ALTER TABLE hotel_bookings ADD COLUMN IF NOT EXISTS xact_id xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS hotel_bookings_xact_id_idx ON hotel_bookings (xact_id);
+
+CREATE OR REPLACE FUNCTION update_last_updated_column()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.last_updated = NOW();
+  NEW.xact_id = pg_current_xact_id();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retractions keep the writer of the old version, to tell whether it was folded in
+ALTER TABLE booking_rollup_retractions ADD COLUMN IF NOT EXISTS xact_id xid8;
+
+CREATE OR REPLACE FUNCTION capture_rollup_retractions()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO booking_rollup_retractions (
+      hotel, lead_time, stays_in_weekend_nights, stays_in_week_nights, country,
+      market_segment, reserved_room_type, deposit_type, adr,
+      total_of_special_requests, arrival_date, is_canceled, last_updated, xact_id
+  )
+  SELECT hotel, lead_time, stays_in_weekend_nights, stays_in_week_nights, country,
+         market_segment, reserved_room_type, deposit_type, adr,
+         total_of_special_requests, arrival_date, is_canceled, last_updated, xact_id
+  FROM old_rows;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Snapshot of the last refresh; NULL until the first one
+ALTER TABLE booking_rollup_state DROP COLUMN IF EXISTS watermark;
+ALTER TABLE booking_rollup_state ADD COLUMN IF NOT EXISTS snapshot pg_snapshot;
+
+CREATE OR REPLACE FUNCTION reset_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+  TRUNCATE booking_rollup, booking_rollup_daily, booking_rollup_retractions;
+  UPDATE booking_rollup_state SET snapshot = NULL;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Every row was just rewritten with this migration's transaction id, so the
+-- rollup is rebuilt on the next request
+TRUNCATE booking_rollup, booking_rollup_daily, booking_rollup_retractions;
+UPDATE booking_rollup_state SET snapshot = NULL;
@@ -0,0 +1,6 @@
+-- The data version starts over when the database is recreated, so cached
+-- analytics results are also keyed by the database they were computed from:
+-- the cluster's system identifier plus when this row was created
+-- (db_utils.read_db_identity).
+ALTER TABLE analytics_data_version
+    ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT clock_timestamp();
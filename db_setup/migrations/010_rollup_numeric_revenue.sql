@@ -0,0 +1,10 @@
+-- Rollup revenue was DOUBLE PRECISION, and every refresh adds new rows and
+-- subtracts retracted ones, so rounding errors piled up with each update and
+-- a cell could keep a few cents after all of its bookings were gone. Each
+-- row's revenue is now folded in as NUMERIC, which adds and subtracts exactly.
+ALTER TABLE booking_rollup ALTER COLUMN revenue TYPE NUMERIC;
+ALTER TABLE booking_rollup_daily ALTER COLUMN revenue TYPE NUMERIC;
+
+-- The stored sums may already have drifted, so the rollup is rebuilt on the next request
+TRUNCATE booking_rollup, booking_rollup_daily, booking_rollup_retractions;
+UPDATE booking_rollup_state SET snapshot = NULL;
@@ -1,4 +1,5 @@
--- 1. Create the table
+-- 1. Create the table (db_setup/migrate.py then adds the rollup, version and cache
+--    objects and partitions and retypes it, see migrations/)
 CREATE TABLE hotel_bookings (
     hotel TEXT,
     lead_time BIGINT,
@@ -30,9 +31,13 @@ CREATE TABLE hotel_bookings (
     arrival_date DATE,
     is_canceled BOOLEAN,
     is_repeated_guest BOOLEAN,
-    last_updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+    last_updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    booking_hash TEXT  -- md5 of the loaded columns, set by db_setup/inserter.py
 );
 
+-- Lets the loader skip rows that are already in the table
+CREATE UNIQUE INDEX hotel_bookings_booking_hash_idx ON hotel_bookings (booking_hash);
+
 -- 2. Create trigger function to auto-update last_updated
 CREATE OR REPLACE FUNCTION update_last_updated_column()
 RETURNS TRIGGER AS $$
@@ -42,9 +47,10 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- 3. Create trigger on the hotel_bookings table
+-- 3. Create trigger on the hotel_bookings table (inserts get the column default,
+--    so bulk loads don't pay for a trigger call per row)
 CREATE TRIGGER update_last_updated_trigger
-BEFORE INSERT OR UPDATE ON hotel_bookings
+BEFORE UPDATE ON hotel_bookings
 FOR EACH ROW
 EXECUTE FUNCTION update_last_updated_column();
 
@@ -56,4 +62,4 @@ CREATE TABLE query_history (
     generated_response TEXT NOT NULL,
     faithfulness_score FLOAT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
@@ -0,0 +1,151 @@
+import queue
+import re
+import threading
+from dataclasses import dataclass
+from time import time
+from typing import Callable, List, Optional, Tuple
+
+from instrumentation import ASK_STAGE_SECONDS, EVALUATIONS_PENDING
+
+
+@dataclass(frozen=True)
+class EvaluationItem:
+    query_id: int
+    question: str
+    answer: str
+    contexts: Tuple[str, ...]  # the chunks retrieved for this answer
+    ground_truth: str
+
+
+class RagasEvaluator:
+    """RAGAS faithfulness judged by GPT-4o; the LLM clients are built on first use."""
+
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self._llm = None
+        self._embeddings = None
+
+    def _clients(self):
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+            from ragas.embeddings import LangchainEmbeddingsWrapper
+            from ragas.llms import LangchainLLMWrapper
+
+            self._llm = LangchainLLMWrapper(ChatOpenAI(model=self.model))
+            self._embeddings = LangchainEmbeddingsWrapper(OpenAIEmbeddings())
+        return self._llm, self._embeddings
+
+    def evaluate(self, items: List[EvaluationItem]) -> List[Optional[float]]:
+        from datasets import Dataset
+        from ragas import evaluate
+        from ragas.metrics import faithfulness
+
+        llm, embeddings = self._clients()
+        dataset = Dataset.from_dict({
+            "question": [item.question for item in items],
+            "answer": [item.answer for item in items],
+            "contexts": [list(item.contexts) for item in items],
+            "ground_truth": [item.ground_truth for item in items],
+        })
+        results = evaluate(dataset, metrics=[faithfulness], llm=llm, embeddings=embeddings)
+        return [None if score != score else float(score) for score in results["faithfulness"]]  # NaN -> None
+
+
+class StubEvaluator:
+    """Offline stand-in: the share of answer words that also appear in the retrieved contexts."""
+
+    WORD = re.compile(r"\w+")
+
+    def evaluate(self, items: List[EvaluationItem]) -> List[Optional[float]]:
+        scores = []
+        for item in items:
+            answer_words = set(self.WORD.findall(item.answer.lower()))
+            context_words = set(self.WORD.findall(" ".join(item.contexts).lower()))
+            scores.append(len(answer_words & context_words) / len(answer_words) if answer_words else None)
+        return scores
+
+
+EVALUATORS = {"ragas": RagasEvaluator, "stub": StubEvaluator}
+
+
+class EvaluationQueue:
+    """Background faithfulness evaluation, batched.
+
+    Worker threads take up to ``batch_size`` pending items, waiting at most
+    ``max_wait`` seconds to fill a batch, evaluate them in one call and hand
+    (question, query_id, answer, score, status) tuples to ``write_back``.
+    """
+
+    def __init__(
+        self,
+        evaluator,
+        write_back: Callable[[List[Tuple[str, int, str, Optional[float], str]]], None],
+        batch_size: int = 8,
+        max_wait: float = 0.5,
+        workers: int = 1,
+    ):
+        self.evaluator = evaluator
+        self.write_back = write_back
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[EvaluationItem]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"faithfulness-eval-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item: EvaluationItem):
+        EVALUATIONS_PENDING.inc()
+        self._queue.put(item)
+
+    def stop(self, timeout: float = 30.0):
+        """Finish what is queued (up to ``timeout`` seconds), then stop the workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time()))
+        self._threads = []
+
+    def _next_batch(self) -> Tuple[List[EvaluationItem], bool]:
+        batch = []
+        item = self._queue.get()
+        if item is None:
+            return batch, True
+        EVALUATIONS_PENDING.dec()
+        batch.append(item)
+        deadline = time() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time()))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            EVALUATIONS_PENDING.dec()
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            start = time()
+            try:
+                with ASK_STAGE_SECONDS.labels("evaluation").time():
+                    scores = self.evaluator.evaluate(batch)
+                results = [(item.question, item.query_id, item.answer, score, "done") for item, score in zip(batch, scores)]
+                print(f"✅ Evaluated {len(batch)} answers in {time() - start:.1f}s")
+            except Exception as e:
+                print(f"❌ Faithfulness evaluation failed for {len(batch)} answers: {e}")
+                results = [(item.question, item.query_id, item.answer, None, "failed") for item in batch]
+            try:
+                self.write_back(results)
+            except Exception as e:
+                print(f"❌ Could not store faithfulness scores: {e}")
@@ -0,0 +1,104 @@
+"""Prometheus metrics for the analytics and /ask hot paths, served on /metrics.
+
+Each uvicorn worker keeps its own samples. Set PROMETHEUS_MULTIPROC_DIR to an
+empty directory shared by the workers to have /metrics report all of them.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from time import time
+from typing import Any, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import text
+
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ASK_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# === Analytics ===
+# A GROUPING SETS statement computes several metrics at once; its time is
+# recorded under each metric key it served (e.g. monthly_revenue)
+STATEMENT_SECONDS = Histogram(
+    "analytics_statement_seconds", "Time of the statement that computed an analytics metric",
+    ["statement", "engine"], buckets=QUERY_BUCKETS,
+)
+STALENESS_CHECK_SECONDS = Histogram(
+    "analytics_staleness_check_seconds", "Time to read the data version the analytics caches are checked against",
+    buckets=QUERY_BUCKETS,
+)
+ROLLUP_REFRESH_SECONDS = Histogram(
+    "analytics_rollup_refresh_seconds", "Time to fold changed bookings into the rollup", buckets=QUERY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "analytics_cache_requests_total", "AnalyticsCache lookups: hit (fresh), stale (served while refreshing) or miss",
+    ["cache", "result"],
+)
+SLOW_QUERIES = Counter("analytics_slow_queries_total", "Statements slower than SLOW_QUERY_THRESHOLD_MS", ["statement"])
+
+# === /ask ===
+ASK_STAGE_SECONDS = Histogram("ask_stage_seconds", "Time spent in each stage of answering a question", ["stage"], buckets=ASK_BUCKETS)
+ASK_ROUTES = Counter(
+    "ask_routes_total", "Questions by what answered them: analytics, answer_cache, semantic_cache or rag", ["route"]
+)
+EVALUATIONS_PENDING = Gauge(
+    "ask_evaluations_pending", "Answers queued for faithfulness evaluation", multiprocess_mode="livesum"
+)
+
+
+def metrics_body():
+    """(body, content type) of the Prometheus text exposition."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class SlowQueryLog:
+    """Appends statements slower than ``threshold`` seconds to ``path`` with their EXPLAIN (ANALYZE, BUFFERS) plan.
+
+    EXPLAIN ANALYZE runs the statement again, so plans are captured on a
+    background thread and at most once every ``interval`` seconds per
+    statement. Each entry is one JSON line.
+    """
+
+    def __init__(self, engine, path: str, threshold: float, interval: float = 300.0):
+        self.engine = engine
+        self.path = path
+        self.threshold = threshold
+        self.interval = interval
+        self._explained_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, sql: str, seconds: float, params: Optional[Dict[str, Any]] = None):
+        if seconds < self.threshold:
+            return
+        SLOW_QUERIES.labels(name).inc()
+        with self._lock:
+            if time() - self._explained_at.get(name, float("-inf")) < self.interval:
+                return
+            self._explained_at[name] = time()
+        threading.Thread(target=self._explain, args=(name, sql, seconds, params), name="slow-query-explain", daemon=True).start()
+
+    def _explain(self, name: str, sql: str, seconds: float, params: Optional[Dict[str, Any]]):
+        try:
+            with self.engine.connect() as connection:
+                plan = connection.execute(
+                    text(f"EXPLAIN (ANALYZE, BUFFERS) {sql.strip().rstrip(';')}"), params or {}
+                ).scalars().all()
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "statement": name,
+            "seconds": round(seconds, 4),
+            "sql": " ".join(sql.split()),
+            "params": params,
+            "plan": plan,
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        print(f"🐢 Slow query '{name}' took {seconds * 1000:.0f} ms, plan written to {self.path}")
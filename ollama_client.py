@@ -0,0 +1,54 @@
+import json
+import os
+from typing import AsyncIterator, List, Sequence
+
+from weaviate_store import GROUNDED_TASK
+
+# Reached from the API process, unlike OLLAMA_API_ENDPOINT which Weaviate's container uses
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+GENERATION_MODEL = os.getenv("OLLAMA_GENERATION_MODEL", "llama3.2")
+EMBEDDING_MODEL = "nomic-embed-text"  # the model the HotelAnalytics collection is vectorized with
+
+
+def grounded_prompt(question: str, contexts: Sequence[str]) -> str:
+    context = "\n".join(f"- {c}" for c in contexts)
+    return f"{GROUNDED_TASK}\n\nContext:\n{context}\n\nQuestion: {question}"
+
+
+def new_client(base_url: str = OLLAMA_URL):
+    import httpx
+
+    # Tokens may be seconds apart on a cold model, so reads never time out
+    return httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(10.0, read=None))
+
+
+async def embed(texts: Sequence[str], client, model: str = EMBEDDING_MODEL) -> List[List[float]]:
+    """Embed all ``texts`` with one Ollama call."""
+    response = await client.post("/api/embed", json={"model": model, "input": list(texts)})
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+
+async def generate(prompt: str, client, model: str = GENERATION_MODEL) -> str:
+    response = await client.post("/api/generate", json={"model": model, "prompt": prompt, "stream": False})
+    response.raise_for_status()
+    return response.json()["response"]
+
+
+async def stream_generate(prompt: str, model: str = GENERATION_MODEL, base_url: str = OLLAMA_URL) -> AsyncIterator[str]:
+    """Yield the tokens Ollama generates for ``prompt`` as they arrive."""
+    async with new_client(base_url) as client:
+        async with client.stream(
+            "POST", "/api/generate", json={"model": model, "prompt": prompt, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+CACHE_FORMAT = 1
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_answers(section: str, path: str) -> List[Dict[str, Any]]:
+    """Numbered answer lines of one report PDF."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    pages = (page.extract_text() for page in reader.pages)
+    text = "\n".join(page for page in pages if page)
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    answers = [line for line in lines if any(char.isdigit() for char in line[:3])]
+    return [{"section": section, "index": i, "text": answer} for i, answer in enumerate(answers, 1)]
+
+
+class PdfCorpusCache:
+    """The parsed answer corpus, reparsed only when a PDF changes.
+
+    Every file is fingerprinted by (size, mtime); when that changes its
+    content hash decides whether it really needs reparsing. Parsed answers
+    are kept in memory and persisted as JSON next to the PDFs, so a restart
+    reuses them without opening a single PDF.
+    """
+
+    def __init__(self, files: Dict[str, str], cache_path: str):
+        self.files = files
+        self.cache_path = cache_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._corpus: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if stored.get("format") == CACHE_FORMAT:
+            self._entries = stored["files"]
+
+    def _persist(self):
+        directory = os.path.dirname(self.cache_path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"format": CACHE_FORMAT, "files": self._entries}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            # Still cached in memory; the next restart just reparses
+            print(f"⚠️ Could not persist the PDF corpus cache: {e}")
+
+    def _refresh_entry(self, section: str, path: str) -> bool:
+        """Bring one file's entry up to date; True if the stored cache needs rewriting."""
+        st = os.stat(path)
+        entry = self._entries.get(section)
+        if entry and entry["path"] == path and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return False
+        sha256 = file_sha256(path)
+        if entry and entry["path"] == path and entry["sha256"] == sha256:
+            answers = entry["answers"]  # touched but unchanged
+        else:
+            print(f"📄 Parsing {path}")
+            answers = parse_answers(section, path)
+        self._entries[section] = {
+            "path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256, "answers": answers,
+        }
+        return True
+
+    def get(self) -> List[Dict[str, Any]]:
+        """The current corpus; costs one stat() per PDF when nothing changed."""
+        with self._lock:
+            changed = [self._refresh_entry(section, path) for section, path in self.files.items()]
+            stale_sections = set(self._entries) - set(self.files)
+            for section in stale_sections:
+                del self._entries[section]
+            if any(changed) or stale_sections or self._corpus is None:
+                self._corpus = [a for section in self.files for a in self._entries[section]["answers"]]
+                if any(changed) or stale_sections:
+                    self._persist()
+            return self._corpus
@@ -0,0 +1,417 @@
+"""Answers /ask questions that are lookups into the analytics results.
+
+Questions like "What was the revenue in July 2017?" are answered from the
+metric /analytics/revenue already computes (and caches) with a template,
+instead of retrieval and generation over the report PDFs. Routes are
+keyword rules and the first one that matches decides; open-ended questions
+("why", "recommend", ...), questions no route matches and questions the
+matched metric can't answer go to RAG: an all-time metric asked about one
+year, a rate asked as a count, a country or month with no row, several
+months at once, a negated filter ("non-Portugal", "except") or a qualifier
+the metric doesn't express (a quarter, week or day, "per booking",
+"average", "percentage of revenue").
+"""
+import calendar
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Rows = List[Dict[str, Any]]
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+MONTH_YEAR = re.compile(rf"\b({_MONTH_NAMES})\.?\s+(?:of\s+)?((?:19|20)\d\d)\b")
+YEAR = re.compile(r"\b((?:19|20)\d\d)\b")
+MONTH_NAME = re.compile(rf"\b({_MONTH_NAMES})\b")
+
+# Country names as asked, by the ISO 3166 code hotel_bookings stores
+COUNTRIES = {
+    "portugal": "PRT", "united kingdom": "GBR", "uk": "GBR", "britain": "GBR", "great britain": "GBR",
+    "england": "GBR", "france": "FRA", "spain": "ESP", "germany": "DEU", "italy": "ITA", "ireland": "IRL",
+    "belgium": "BEL", "brazil": "BRA", "netherlands": "NLD", "united states": "USA", "usa": "USA",
+    "switzerland": "CHE", "china": "CHN", "austria": "AUT", "sweden": "SWE", "russia": "RUS",
+    "poland": "POL", "norway": "NOR",
+}
+COUNTRY_NAMES = {
+    "PRT": "Portugal", "GBR": "the United Kingdom", "FRA": "France", "ESP": "Spain", "DEU": "Germany",
+    "ITA": "Italy", "IRL": "Ireland", "BEL": "Belgium", "BRA": "Brazil", "NLD": "the Netherlands",
+    "USA": "the United States", "CHE": "Switzerland", "CHN": "China", "AUT": "Austria", "SWE": "Sweden",
+    "RUS": "Russia", "POL": "Poland", "NOR": "Norway",
+}
+_COUNTRY_NAMES = "|".join(sorted(COUNTRIES, key=len, reverse=True))
+COUNTRY = re.compile(rf"\b({_COUNTRY_NAMES})\b")
+
+# Keyword patterns shared by the routes
+OPEN_ENDED = re.compile(r"\b(why|explain|recommend\w*|suggest\w*|should|strateg\w*|improve|predict\w*|forecast\w*|reasons?)\b")
+LOWEST = re.compile(r"\b(lowest|least|fewest|smallest|worst|minimum)\b")
+HIGHEST = re.compile(r"\b(highest|most|peak\w*|top|best|largest|maximum)\b")
+MONTH_WORDS = rf"\b(months?|monthly|{_MONTH_NAMES})\b"
+_COUNTRY_CODES = "|".join(code.lower() for code in COUNTRY_NAMES)
+COUNTRY_WORDS = rf"\bcountr(y|ies)\b|\b({_COUNTRY_NAMES}|{_COUNTRY_CODES})\b|\bnationalit"
+CANCEL = r"\bcancel"
+REVENUE = r"\b(revenue|income|earn\w*|sales)\b"
+BOOKINGS = r"\b(bookings?|reservations?|guests?)\b"
+LEAD_TIME = r"\blead[\s-]?times?\b"
+SHARE = r"\b(percent\w*|share|proportion|fraction)\b|%"
+# Filters the metrics can't express ("non-refundable" is a deposit type, not a negation)
+NEGATION = re.compile(r"\bnon[\s-](?!refund)|\bnot\b|n't\b|\bexcept\b|\bexclud\w*|\bother than\b")
+# Questions asking for a number of bookings, which a rate can't answer
+COUNTS = re.compile(r"\bhow many\b|\bnumber of\b|\b(most|fewest|least|more|fewer) cancell?ations\b")
+# Qualifiers a metric answers only if its route says so (Route.qualifiers);
+# periods shorter than a month are never in the results
+QUALIFIERS = {
+    "period": re.compile(
+        r"\bq[1-4]\b|\bquarter\w*|\b(first|second|1st|2nd) half\b|\bh[12]\b|\bhalf[\s-]year\w*"
+        r"|\bweeks? (\d|of\b|number)|\bweekly\b|\b(which|what|per|each|every) week\b|\bweek(day|end)s?\b"
+        r"|\b(on|which|what|per|each|every) day\b|\bday of\b|\bdaily\b|\bdates?\b"
+        rf"|\b\d{{1,2}}(st|nd|rd|th)?\s+(of\s+)?({_MONTH_NAMES})\b|\b({_MONTH_NAMES})\.?\s+\d{{1,2}}(st|nd|rd|th)?\b"
+        r"|\b\d{1,2}/(\d{1,2}/)?\d{2,4}\b|\b(19|20)\d\d-\d\d\b"
+    ),
+    "average": re.compile(r"\b(average|avg|mean|median|typical)\b|\bper (?!(years?|months?)\b)"),
+    "share": re.compile(SHARE),
+}
+
+
+@dataclass(frozen=True)
+class Question:
+    """A question lowercased and single-spaced, with the periods and country it names."""
+    text: str
+    years: Tuple[int, ...]
+    months: Tuple[Tuple[int, int], ...]  # (year, month) of e.g. "July 2017"
+    country: Optional[str]  # ISO 3166 alpha-3, as stored in hotel_bookings
+
+    @classmethod
+    def parse(cls, question: str) -> "Question":
+        text = " ".join(question.lower().split())
+        country = COUNTRY.search(text)
+        code = re.search(r"\b([A-Z]{3})\b", question)
+        return cls(
+            text=text,
+            years=tuple(int(year) for year in YEAR.findall(text)),
+            months=tuple((int(year), MONTHS[month]) for month, year in MONTH_YEAR.findall(text)),
+            country=COUNTRIES[country.group(1)] if country else (
+                code.group(1) if code and code.group(1) in COUNTRY_NAMES else None
+            ),
+        )
+
+    @property
+    def month(self) -> Optional[Tuple[int, int]]:
+        return self.months[0] if len(self.months) == 1 else None
+
+    @property
+    def several_months(self) -> bool:
+        """Whether it names more than one month, e.g. "July and August 2017"."""
+        return len(self.months) > 1 or len(set(MONTH_NAME.findall(self.text))) > 1
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    endpoint: str  # as in /analytics/{endpoint}
+    metric: str
+    keywords: Tuple[str, ...]  # regexes that must all occur in the question
+    answer: Callable[[Question, Rows], Optional[str]]  # None when the rows can't answer it
+    timeless: bool = True  # the metric covers all bookings, so it can't answer for a given year
+    rate: bool = False  # the metric is a rate, so it can't answer "how many" questions
+    qualifiers: Tuple[str, ...] = ()  # QUALIFIERS the metric expresses, e.g. "average" for a mean lead time
+
+    def matches(self, question: Question) -> bool:
+        return all(re.search(keyword, question.text) for keyword in self.keywords)
+
+    def can_answer(self, question: Question) -> bool:
+        """Whether the metric expresses everything the question qualifies it with."""
+        if self.timeless and question.years:
+            return False
+        if self.rate and COUNTS.search(question.text):
+            return False
+        allowed = self.qualifiers + (("share",) if self.rate else ())  # a rate is a percentage
+        return not any(pattern.search(question.text) for name, pattern in QUALIFIERS.items() if name not in allowed)
+
+
+@dataclass(frozen=True)
+class RoutedAnswer:
+    route: str
+    endpoint: str
+    metric: str
+    answer: str
+
+
+# === Formatting ===
+def money(value) -> str:
+    return f"${float(value):,.2f}"
+
+def percent(value) -> str:
+    return f"{float(value):.2f}%"
+
+def count(value) -> str:
+    return f"{int(value):,}"
+
+def days(value) -> str:
+    return f"{float(value):.1f} days"
+
+def month_key(value) -> Tuple[int, int]:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.year, value.month
+
+def month_label(key: Tuple[int, int]) -> str:
+    return f"{calendar.month_name[key[1]]} {key[0]}"
+
+def country_label(code) -> str:
+    return COUNTRY_NAMES.get(code, str(code))
+
+def listing(items: List[str]) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+def sentence(text: str) -> str:
+    return text[:1].upper() + text[1:]
+
+
+# === Templates ===
+# Returned by a ``find`` when the question names a value (e.g. a country) that has no row
+NO_ROW: Dict[str, Any] = {}
+
+def mentioned(question: Question, rows: Rows, key: str):
+    """The row whose label is named in the question (e.g. "City Hotel"), if any."""
+    for row in rows:
+        if row[key] is not None and re.search(rf"\b{re.escape(str(row[key]).lower())}\b", question.text):
+            return row
+    return None
+
+def ranking(key: str, value: str, fmt: Callable, noun: str, label: Callable = str, limit: Optional[int] = 3,
+            find: Callable[[Question, Rows, str], Any] = mentioned):
+    """The top (or bottom) rows by ``value``, or the one row the question names."""
+    def answer(question: Question, rows: Rows) -> Optional[str]:
+        rows = [row for row in rows if row[key] is not None and row[value] is not None]
+        row = find(question, rows, key)
+        if row is NO_ROW:
+            return None
+        if row is not None:
+            return f"The {noun} for {label(row[key])} is {fmt(row[value])}."
+        lowest = bool(LOWEST.search(question.text))
+        rows = sorted(rows, key=lambda row: row[value], reverse=not lowest)[:limit]
+        if not rows:
+            return None
+        extreme = "lowest" if lowest else "highest"
+        first, rest = rows[0], [f"{label(row[key])} ({fmt(row[value])})" for row in rows[1:]]
+        text = f"The {extreme} {noun} is for {label(first[key])} ({fmt(first[value])})"
+        return text + (f", followed by {listing(rest)}." if rest else ".")
+    return answer
+
+def monthly(value: str, fmt: Callable, noun: str):
+    """The value for the month named in the question, or the peak month (within its year, if given)."""
+    def answer(question: Question, rows: Rows) -> Optional[str]:
+        by_month = {month_key(row["month"]): row[value] for row in rows if row[value] is not None}
+        if question.month:
+            if question.month not in by_month:
+                return None
+            return f"The {noun} in {month_label(question.month)} was {fmt(by_month[question.month])}."
+        lowest = bool(LOWEST.search(question.text))
+        if not (lowest or HIGHEST.search(question.text)):
+            return None
+        months = [key for key in by_month if not question.years or key[0] in question.years]
+        if not months:
+            return None
+        month = (min if lowest else max)(months, key=by_month.get)
+        within = f" in {question.years[0]}" if len(question.years) == 1 else ""
+        extreme = "lowest" if lowest else "highest"
+        return f"{month_label(month)} had the {extreme} {noun}{within} ({fmt(by_month[month])})."
+    return answer
+
+def yearly_revenue(question: Question, rows: Rows) -> Optional[str]:
+    years = [(int(row["year"]), row["total_revenue"]) for row in rows]
+    if question.years:
+        first, last = min(question.years), max(question.years)
+        years = [(year, revenue) for year, revenue in years if first <= year <= last]
+    if not years:
+        return None
+    if len(years) == 1:
+        return f"The revenue in {years[0][0]} was {money(years[0][1])}."
+    return "Revenue was " + listing([f"{money(revenue)} in {year}" for year, revenue in years]) + "."
+
+def canceled_revenue_share(question: Question, rows: Rows) -> Optional[str]:
+    total = sum(float(row["total_revenue"]) for row in rows)
+    canceled = sum(float(row["total_revenue"]) for row in rows if row["is_canceled"])
+    if not total:
+        return None
+    return (f"Canceled bookings account for {percent(100 * canceled / total)} of total revenue "
+            f"({money(canceled)} of {money(total)}).")
+
+def overall_cancellation_rate(question: Question, rows: Rows) -> Optional[str]:
+    if not rows:
+        return None
+    row = rows[0]
+    return (f"The overall cancellation rate is {percent(row['cancellation_rate'])} "
+            f"({count(row['canceled_bookings'])} of {count(row['total_bookings'])} bookings were canceled).")
+
+def cancellation_by_country(question: Question, rows: Rows) -> Optional[str]:
+    if question.country is None and re.search(r"\b100\s?(%|percent)", question.text):
+        countries = [
+            country_label(row["country"]) for row in rows
+            if row["country"] and row["cancellation_rate"] is not None and row["cancellation_rate"] >= 100
+        ]
+        if not countries:
+            return "No country has a 100% cancellation rate."
+        return sentence(f"{listing(countries[:5])} {'has' if len(countries) == 1 else 'have'} a 100% cancellation rate.")
+    return ranking("country", "cancellation_rate", percent, "cancellation rate", country_label, find=country_row)(question, rows)
+
+def country_row(question: Question, rows: Rows, key: str):
+    if question.country is None:
+        return None
+    return next((row for row in rows if row[key] == question.country), NO_ROW)
+
+def deposit_row(question: Question, rows: Rows, key: str):
+    if re.search(r"\bnon[\s-]?refund", question.text):
+        label = "non refund"
+    elif re.search(r"\brefundable\b", question.text):
+        label = "refundable"
+    elif re.search(r"\bno deposit\b|\bwithout (a )?deposit\b", question.text):
+        label = "no deposit"
+    else:
+        return None
+    return next((row for row in rows if str(row[key]).lower() == label), NO_ROW)
+
+def special_requests_row(question: Question, rows: Rows, key: str):
+    requests = re.search(r"\b(no|zero|\d+) special requests?\b", question.text)
+    if requests is None:
+        return None
+    number = 0 if requests.group(1) in ("no", "zero") else int(requests.group(1))
+    return next((row for row in rows if row[key] == number), NO_ROW)
+
+def country_booking_months(question: Question, rows: Rows) -> Optional[str]:
+    if question.country is None:
+        return None
+    months = [
+        (month_key(row["month"]), row["total_bookings"]) for row in rows
+        if row["country"] == question.country and (not question.years or month_key(row["month"])[0] in question.years)
+    ]
+    if not months:
+        return None
+    months.sort(key=lambda month: month[1], reverse=True)
+    peaks = listing([f"{month_label(month)} ({count(bookings)} bookings)" for month, bookings in months[:3]])
+    return f"Bookings from {country_label(question.country)} peaked in {peaks}."
+
+def booking_share(question: Question, rows: Rows) -> Optional[str]:
+    row = country_row(question, rows, "country")
+    if not row:
+        return None
+    return sentence(f"{country_label(row['country'])} accounts for {percent(row['booking_percentage'])} "
+                    f"of all bookings ({count(row['total_bookings'])} bookings).")
+
+def last_minute_share(question: Question, rows: Rows) -> Optional[str]:
+    if not rows:
+        return None
+    return f"{percent(rows[0]['percentage_last_minute_bookings'])} of bookings are made less than a week before arrival."
+
+def average_lead_time(question: Question, rows: Rows) -> Optional[str]:
+    if not rows:
+        return None
+    return f"The average lead time is {days(rows[0]['average_lead_time'])}."
+
+def special_requests(number) -> str:
+    if number == 0:
+        return "bookings with no special requests"
+    return f"bookings with {number} special request{'' if number == 1 else 's'}"
+
+
+# Tried in order: cancellation routes come first because lead time and revenue
+# questions can mention cancellations, and routes by a dimension come before
+# the monthly and yearly ones, so "which hotel ... in 2016" isn't answered
+# with the 2016 total
+ROUTES = (
+    # 📌 Revenue lost to cancellations
+    Route("canceled_revenue_share", "revenue", "revenue_by_cancellation_status", (REVENUE, CANCEL), canceled_revenue_share,
+          qualifiers=("share",)),
+
+    # 📌 Cancellations
+    Route("cancellation_by_hotel_type", "cancellations", "cancellation_by_hotel_type", (CANCEL, r"\bhotels?\b"),
+          ranking("hotel", "cancellation_rate", percent, "cancellation rate"), rate=True),
+    Route("cancellation_by_market_segment", "cancellations", "cancellation_by_market_segment", (CANCEL, r"\bsegments?\b"),
+          ranking("market_segment", "cancellation_rate", percent, "cancellation rate"), rate=True),
+    Route("cancellation_by_country", "geo", "cancellation_by_country", (CANCEL, COUNTRY_WORDS), cancellation_by_country,
+          rate=True),
+    Route("cancellation_by_room_type", "cancellations", "cancellation_by_room_type", (CANCEL, r"\brooms?\b"),
+          ranking("reserved_room_type", "cancellation_rate", percent, "cancellation rate", lambda room: f"room type {room}"),
+          rate=True),
+    Route("cancellation_by_lead_time", "cancellations", "cancellation_by_lead_time",
+          (CANCEL, rf"{LEAD_TIME}|\bin advance\b|\blast[\s-]minute\b"),
+          ranking("booking_type", "cancellation_rate", percent, "cancellation rate", lambda kind: f"{kind} bookings", limit=None),
+          rate=True),
+    Route("cancellation_by_special_requests", "cancellations", "cancellation_by_special_requests",
+          (CANCEL, r"\bspecial requests?\b"),
+          ranking("total_of_special_requests", "cancellation_rate", percent, "cancellation rate", special_requests,
+                  limit=None, find=special_requests_row), rate=True),
+    Route("cancellation_by_deposit_type", "cancellations", "cancellation_by_deposit_type", (CANCEL, r"\bdeposit|\brefund"),
+          ranking("deposit_type", "cancellation_rate", percent, "cancellation rate", limit=None, find=deposit_row), rate=True),
+    Route("cancellation_rate_by_month", "cancellations", "cancellation_rate_by_month", (CANCEL, MONTH_WORDS),
+          monthly("cancellation_rate", percent, "cancellation rate"), timeless=False, rate=True),
+    Route("overall_cancellation_rate", "cancellations", "overall_cancellation_rate",
+          (CANCEL, r"\b(overall|total|dataset|all bookings|in general)\b|^what(?:'s| is) the cancel\w* rate\W*$"),
+          overall_cancellation_rate, qualifiers=("share",)),
+
+    # 📌 Revenue
+    Route("revenue_by_hotel_type", "revenue", "revenue_by_hotel_type", (REVENUE, r"\bhotels?\b"),
+          ranking("hotel", "total_revenue", money, "revenue")),
+    Route("revenue_by_market_segment", "revenue", "revenue_by_market_segment", (REVENUE, r"\bsegments?\b"),
+          ranking("market_segment", "total_revenue", money, "revenue")),
+    Route("revenue_by_country", "revenue", "revenue_by_country", (REVENUE, COUNTRY_WORDS),
+          ranking("country", "total_revenue", money, "revenue", country_label, find=country_row)),
+    Route("revenue_by_room_type", "revenue", "revenue_by_room_type", (REVENUE, r"\brooms?\b"),
+          ranking("reserved_room_type", "total_revenue", money, "revenue", lambda room: f"room type {room}")),
+    Route("revenue_by_month", "revenue", "monthly_revenue", (REVENUE, MONTH_WORDS),
+          monthly("total_revenue", money, "revenue"), timeless=False),
+    Route("yearly_revenue", "revenue", "yearly_revenue", (REVENUE, r"\b(years?|yearly|annual\w*|(19|20)\d\d)\b"),
+          yearly_revenue, timeless=False),
+
+    # 📌 Bookings by country
+    Route("booking_percentage_by_country", "geo", "booking_percentage_by_country", (SHARE, BOOKINGS, COUNTRY_WORDS),
+          booking_share, qualifiers=("share",)),
+    Route("country_booking_months", "geo", "geo_distribution_over_time", (BOOKINGS, MONTH_WORDS, COUNTRY_WORDS),
+          country_booking_months, timeless=False),
+    Route("bookings_by_country", "geo", "bookings_by_country", (BOOKINGS, COUNTRY_WORDS),
+          ranking("country", "total_bookings", count, "number of bookings", country_label, find=country_row)),
+
+    # 📌 Lead time
+    Route("percentage_last_minute_bookings", "lead_time", "percentage_last_minute_bookings",
+          (SHARE, r"\bless than a week\b|\bwithin a week\b|\bunder a week\b|\blast[\s-]minute\b"), last_minute_share,
+          qualifiers=("share",)),
+    Route("lead_time_by_hotel_type", "lead_time", "lead_time_by_hotel_type", (LEAD_TIME, r"\bhotels?\b"),
+          ranking("hotel", "average_lead_time", days, "average lead time"), qualifiers=("average",)),
+    Route("lead_time_by_market_segment", "lead_time", "lead_time_by_market_segment", (LEAD_TIME, r"\bsegments?\b"),
+          ranking("market_segment", "average_lead_time", days, "average lead time"), qualifiers=("average",)),
+    Route("lead_time_distribution", "lead_time", "lead_time_distribution",
+          (LEAD_TIME, r"\b(ranges?|categor\w*|buckets?|distribution|number of bookings|most bookings)\b"),
+          ranking("lead_time_category", "total_bookings", count, "number of bookings",
+                  lambda category: f"lead times of {category.lower()}", limit=None)),
+    Route("average_lead_time", "lead_time", "average_lead_time", (LEAD_TIME, r"\b(average|mean|typical|overall)\b"),
+          average_lead_time, qualifiers=("average",)),
+)
+
+
+class QuestionRouter:
+    """Picks the route for a question and answers it from ``results(endpoint)``.
+
+    ``results`` returns an endpoint's metrics as served by its AnalyticsCache;
+    a metric that failed to compute sends the question to RAG.
+    """
+
+    def __init__(self, results: Callable[[str], Dict[str, Any]], routes: Tuple[Route, ...] = ROUTES):
+        self.results = results
+        self.routes = routes
+
+    def route(self, question: str) -> Optional[RoutedAnswer]:
+        parsed = Question.parse(question)
+        if OPEN_ENDED.search(parsed.text) or NEGATION.search(parsed.text) or parsed.several_months:
+            return None
+        route = next((route for route in self.routes if route.matches(parsed)), None)
+        # A more general route would answer a different question, so these go to RAG
+        if route is None or not route.can_answer(parsed):
+            return None
+        rows = self.results(route.endpoint).get(route.metric)
+        if not isinstance(rows, list):
+            return None
+        answer = route.answer(parsed, rows)
+        return RoutedAnswer(route.name, route.endpoint, route.metric, answer) if answer else None
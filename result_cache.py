@@ -0,0 +1,58 @@
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+
+class ResultCache:
+    """LRU cache of statement results keyed by SQL fingerprint and data version.
+
+    Only the newest data version is kept per fingerprint, and the least
+    recently used entries are evicted once the pickled size of all entries
+    exceeds ``max_bytes``. ``scope`` names the database the versions count
+    in: when it changes (a recreated database starts its version over), every
+    entry is dropped.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, scope: Callable[[], str] = lambda: ""):
+        self.max_bytes = max_bytes
+        self.scope = scope
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[int, Any, int]]" = OrderedDict()
+        self._scope: Optional[str] = None  # scope of the current entries
+        self._lock = threading.Lock()
+
+    def _check_scope(self):
+        scope = self.scope()
+        if scope != self._scope:
+            self._entries.clear()
+            self.current_bytes = 0
+            self._scope = scope
+
+    def get(self, fingerprint: str, version: int) -> Optional[Any]:
+        with self._lock:
+            self._check_scope()
+            entry = self._entries.get(fingerprint)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(fingerprint)
+            return entry[1]
+
+    def put(self, fingerprint: str, version: int, value: Any):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_scope()
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                if previous[0] > version:
+                    # Never replace a newer result with an older one
+                    self._entries[fingerprint] = previous
+                    return
+                self.current_bytes -= previous[2]
+            self._entries[fingerprint] = (version, value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
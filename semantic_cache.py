@@ -0,0 +1,126 @@
+import calendar
+import re
+from dataclasses import dataclass
+from time import time
+from typing import FrozenSet, Optional
+
+from weaviate_store import OLLAMA_API_ENDPOINT, WeaviateStore
+
+CACHE_COLLECTION_NAME = "AnswerCache"
+
+# Numbers (years, counts, amounts) and month names, which embeddings barely
+# tell apart: "revenue in July 2017" and "revenue in August 2016" are ~0.97
+# similar but have different answers
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+SPECIFICS = re.compile(r"\d+(?:[.,]\d+)*|\b(?:" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b")
+
+
+def specifics(question: str) -> FrozenSet[str]:
+    """The numbers and months a question names, e.g. {"2017", "month:7"} for "July 2017"."""
+    tokens = SPECIFICS.findall(question.lower())
+    return frozenset(f"month:{_MONTHS[token]}" if token in _MONTHS else token.replace(",", "") for token in tokens)
+
+
+@dataclass(frozen=True)
+class SemanticMatch:
+    question: str
+    answer: str
+    similarity: float
+
+
+class SemanticAnswerCache:
+    """Answers to earlier questions, looked up by embedding similarity.
+
+    Questions are embedded with the same Ollama model as the corpus and kept
+    in their own Weaviate collection with the analytics data version they
+    were answered at. A lookup only matches entries of the current data
+    version that are younger than ``ttl`` seconds, at least ``threshold``
+    cosine-similar and name the same numbers and months (see ``specifics``);
+    older entries are deleted at most every ``purge_interval`` seconds.
+    """
+
+    def __init__(self, store: WeaviateStore, threshold: float = 0.95, ttl: float = 86400.0, purge_interval: float = 60.0,
+                 candidates: int = 5):
+        self.store = store
+        self.threshold = threshold
+        self.candidates = candidates
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._purged_version: Optional[int] = None
+
+    def bootstrap(self):
+        from weaviate.classes.config import Configure, DataType, Property
+
+        client = self.store.client()
+        if not client.collections.exists(CACHE_COLLECTION_NAME):
+            client.collections.create(
+                name=CACHE_COLLECTION_NAME,
+                vectorizer_config=Configure.Vectorizer.text2vec_ollama(
+                    model="nomic-embed-text",
+                    api_endpoint=OLLAMA_API_ENDPOINT,
+                    vectorize_collection_name=False
+                ),
+                properties=[
+                    Property(name="question", data_type=DataType.TEXT, vectorize_property_name=False),
+                    Property(name="answer", data_type=DataType.TEXT, skip_vectorization=True),
+                    Property(name="data_version", data_type=DataType.INT),
+                    Property(name="created_at", data_type=DataType.NUMBER),
+                ]
+            )
+
+    def _fresh(self, data_version: int):
+        from weaviate.classes.query import Filter
+
+        return (
+            Filter.by_property("data_version").equal(data_version)
+            & Filter.by_property("created_at").greater_than(time() - self.ttl)
+        )
+
+    def lookup(self, question: str, data_version: int) -> Optional[SemanticMatch]:
+        from weaviate.classes.query import MetadataQuery
+
+        response = self.store.run(lambda col: col.query.near_text(
+            query=question,
+            distance=1 - self.threshold,  # cosine distance
+            limit=self.candidates,
+            filters=self._fresh(data_version),
+            return_metadata=MetadataQuery(distance=True)
+        ), collection=CACHE_COLLECTION_NAME)
+        wanted = specifics(question)
+        for match in response.objects:  # closest first
+            if specifics(match.properties["question"]) == wanted:
+                return SemanticMatch(match.properties["question"], match.properties["answer"], 1 - match.metadata.distance)
+        return None
+
+    def add(self, question: str, answer: str, data_version: int):
+        self.store.run(lambda col: col.data.insert({
+            "question": question,
+            "answer": answer,
+            "data_version": data_version,
+            "created_at": time(),
+        }), collection=CACHE_COLLECTION_NAME)
+        self.purge(data_version)
+
+    def add_many(self, answers, data_version: int):
+        """Add (question, answer) pairs with one batched insert."""
+        now = time()
+        self.store.run(lambda col: col.data.insert_many([
+            {"question": question, "answer": answer, "data_version": data_version, "created_at": now}
+            for question, answer in answers
+        ]), collection=CACHE_COLLECTION_NAME)
+        self.purge(data_version)
+
+    def purge(self, data_version: int, force: bool = False):
+        """Delete entries from older data versions or past their TTL."""
+        if not force and data_version == self._purged_version and time() - self._purged_at < self.purge_interval:
+            return
+        from weaviate.classes.query import Filter
+
+        self.store.run(lambda col: col.data.delete_many(
+            where=Filter.by_property("data_version").less_than(data_version)
+            | Filter.by_property("created_at").less_than(time() - self.ttl)
+        ), collection=CACHE_COLLECTION_NAME)
+        self._purged_at, self._purged_version = time(), data_version
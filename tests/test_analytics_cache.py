@@ -0,0 +1,121 @@
+import os
+import threading
+from time import sleep
+
+import pytest
+
+from analytics_cache import AnalyticsCache, SharedFileBackend, serialize_results
+
+
+def counting(results):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return results
+
+    return compute, calls
+
+
+def test_refresh_runs_once_per_data_version():
+    lookups = []
+    cache = AnalyticsCache(on_lookup=lookups.append)
+    compute, calls = counting({"total": [1]})
+    assert cache.get_or_refresh(1, compute) == {"total": [1]}
+    assert cache.get_or_refresh(1, compute) == {"total": [1]}
+    assert len(calls) == 1
+    assert lookups == ["miss", "hit"]
+
+    assert cache.is_stale(2)
+    cache.get_or_refresh(2, compute)
+    assert len(calls) == 2
+    assert cache.version == 2
+
+
+def test_snapshot_of_another_scope_is_neither_fresh_nor_served_stale():
+    scope = ["hotel_data@1/abc"]
+    cache = AnalyticsCache(stale_while_revalidate=True, scope=lambda: scope[0])
+    cache.update_cache({"total": [1]}, 5)
+    assert not cache.is_stale(5)
+
+    scope[0] = "hotel_data@2/abc"
+    assert cache.is_stale(5)
+    compute, calls = counting({"total": [2]})
+    # Same version, other database: recomputed in the request, not served stale
+    assert cache.get_or_refresh(5, compute) == {"total": [2]}
+    assert len(calls) == 1
+
+
+def test_stale_snapshot_is_served_while_refreshing_in_the_background():
+    lookups = []
+    cache = AnalyticsCache(stale_while_revalidate=True, on_lookup=lookups.append)
+    cache.update_cache({"total": [1]}, 1)
+    release, refreshed = threading.Event(), threading.Event()
+
+    def compute():
+        release.wait(5)
+        refreshed.set()
+        return {"total": [2]}
+
+    assert cache.get_or_refresh(2, compute) == {"total": [1]}
+    assert cache.get_or_refresh(2, compute) == {"total": [1]}  # no second refresh starts
+    release.set()
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if not cache.is_stale(2):
+            break
+        sleep(0.01)  # the refresh thread stores the results after compute returns
+    assert cache.get_or_refresh(2, compute) == {"total": [2]}
+    assert lookups == ["stale", "stale", "hit"]
+
+
+def test_stale_snapshot_is_not_served_past_max_staleness():
+    cache = AnalyticsCache(stale_while_revalidate=True, max_staleness=0.0)
+    cache.update_cache({"total": [1]}, 1)
+    cache.stale_since = 0.0  # stale since long ago
+    compute, calls = counting({"total": [2]})
+    assert cache.get_or_refresh(2, compute) == {"total": [2]}
+    assert len(calls) == 1
+
+
+def test_serialized_body_comes_with_the_version_it_was_rendered_from():
+    renders = []
+
+    def serialize(data):
+        renders.append(data)
+        return serialize_results(data)
+
+    cache = AnalyticsCache()
+    cache.update_cache({"total": [1]}, 1)
+    assert cache.get_serialized("json", serialize) == (1, b'{"total":[1]}')
+    assert cache.get_serialized("json", serialize) == (1, b'{"total":[1]}')
+    assert len(renders) == 1
+
+    cache.update_cache({"total": [2]}, 2)
+    assert cache.get_serialized("json", serialize) == (2, b'{"total":[2]}')
+    assert len(renders) == 2
+
+
+def test_shared_backend_hands_snapshots_to_other_workers(tmp_path):
+    directory = str(tmp_path / "snapshots")
+    writer = AnalyticsCache(backend=SharedFileBackend("revenue", directory), scope=lambda: "db/abc")
+    reader = AnalyticsCache(backend=SharedFileBackend("revenue", directory), scope=lambda: "db/abc")
+    other_scope = AnalyticsCache(backend=SharedFileBackend("revenue", directory), scope=lambda: "db/def")
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    writer.update_cache({"total": [1]}, 3)
+    assert not reader.is_stale(3)
+    assert reader.cache == {"total": [1]}
+    assert other_scope.is_stale(3)
+
+    # An older snapshot never replaces a newer one
+    SharedFileBackend("revenue", directory).store(2, {"total": [0]}, "db/abc")
+    assert SharedFileBackend("revenue", directory).load("db/abc") == (3, {"total": [1]})
+
+
+def test_shared_backend_refuses_a_directory_others_can_write(tmp_path):
+    directory = tmp_path / "snapshots"
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    with pytest.raises(PermissionError):
+        SharedFileBackend("revenue", str(directory))
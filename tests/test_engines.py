@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db_utils import ASYNC_DATABASE_URL, DATABASE_URL, decode_timestamptz_in_session_zone
+
+# East of UTC, where a UTC month start falls on the previous month's last day
+TIME_ZONE = "Asia/Kolkata"
+
+
+@pytest.fixture(scope="module")
+def sync_engine():
+    engine = create_engine(DATABASE_URL, connect_args={"options": f"-c timezone={TIME_ZONE}"})
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1 FROM hotel_bookings LIMIT 1"))
+    except Exception as e:
+        pytest.skip(f"hotel_data is not reachable: {e}")
+    yield engine
+    engine.dispose()
+
+
+def endpoint_metrics():
+    from app import ENDPOINT_METRICS
+
+    return [pytest.param(metrics, id=endpoint) for endpoint, metrics in ENDPOINT_METRICS.items()]
+
+
+def assert_same_results(actual, expected):
+    # Metrics without an order come in scan order, and double precision sums
+    # depend on that order in their last bits. Aware datetimes compare equal
+    # across offsets, so the rest is compared by repr.
+    def by_group(rows):
+        split = [(repr({k: v for k, v in row.items() if not isinstance(v, float)}),
+                  {k: v for k, v in row.items() if isinstance(v, float)}) for row in rows]
+        return sorted(split, key=lambda pair: pair[0])
+
+    assert actual.keys() == expected.keys()
+    for key, rows in expected.items():
+        got, want = by_group(actual[key]), by_group(rows)
+        assert [exact for exact, _ in got] == [exact for exact, _ in want]
+        assert [floats for _, floats in got] == [pytest.approx(floats, rel=1e-12) for _, floats in want]
+
+
+@pytest.mark.parametrize("metrics", endpoint_metrics())
+def test_engines_return_identical_results(sync_engine, metrics):
+    from analytics_engine import BOOKINGS, plan_statements, run_statements, run_statements_async, shape_metric
+    from analytics_rollup import ROLLUP_SOURCES, refresh_rollup
+    from columnar_engine import ColumnarEngine
+
+    plan = plan_statements(metrics, (BOOKINGS,))
+    statements = list(plan.values())
+
+    def shaped(rows, plan=plan):
+        return {key: shape_metric(metric, rows[plan[key].fingerprint]) for key, metric in metrics.items()}
+
+    with sync_engine.connect() as connection:
+        expected = shaped(run_statements(connection, statements))
+
+    # The refresh is rolled back, so the database is left as it was
+    with sync_engine.connect() as connection:
+        refresh_rollup(connection)
+        rollup_plan = plan_statements(metrics, ROLLUP_SOURCES)
+        assert_same_results(shaped(run_statements(connection, list(rollup_plan.values())), rollup_plan), expected)
+        connection.rollback()
+
+    async def run_async():
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL, connect_args={"server_settings": {"timezone": TIME_ZONE}}
+        )
+        decode_timestamptz_in_session_zone(async_engine)
+        try:
+            return await run_statements_async(async_engine, statements)
+        finally:
+            await async_engine.dispose()
+
+    assert_same_results(shaped(asyncio.run(run_async())), expected)
+    assert_same_results(shaped(ColumnarEngine(sync_engine).run_statements(statements)), expected)
@@ -0,0 +1,110 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from question_router import QuestionRouter
+
+MONTHLY_REVENUE = [
+    {"month": datetime(2017, month, 1), "total_revenue": 1000.0 * month} for month in range(1, 13)
+] + [{"month": datetime(2016, month, 1), "total_revenue": 500.0 * month} for month in range(1, 13)]
+
+RESULTS = {
+    "revenue": {
+        "monthly_revenue": MONTHLY_REVENUE,
+        "yearly_revenue": [{"year": 2016, "total_revenue": 39000.0}, {"year": 2017, "total_revenue": 78000.0}],
+        "revenue_by_hotel_type": [
+            {"hotel": "City Hotel", "total_revenue": 60000.0}, {"hotel": "Resort Hotel", "total_revenue": 57000.0},
+        ],
+        "revenue_by_cancellation_status": [
+            {"is_canceled": False, "total_revenue": 90000.0}, {"is_canceled": True, "total_revenue": 27000.0},
+        ],
+    },
+    "cancellations": {
+        "cancellation_by_lead_time": [
+            {"booking_type": "Last-minute", "cancellation_rate": 10.0},
+            {"booking_type": "Long-term", "cancellation_rate": 45.0},
+        ],
+        "cancellation_by_hotel_type": [
+            {"hotel": "City Hotel", "cancellation_rate": 41.0}, {"hotel": "Resort Hotel", "cancellation_rate": 27.0},
+        ],
+        "overall_cancellation_rate": [{"cancellation_rate": 37.0, "canceled_bookings": 37, "total_bookings": 100}],
+    },
+    "lead_time": {
+        "average_lead_time": [{"average_lead_time": 104.0}],
+        "lead_time_by_hotel_type": [
+            {"hotel": "City Hotel", "average_lead_time": 110.0}, {"hotel": "Resort Hotel", "average_lead_time": 92.0},
+        ],
+        "percentage_last_minute_bookings": [{"percentage_last_minute_bookings": 18.5}],
+    },
+    "geo": {
+        "booking_percentage_by_country": [
+            {"country": "PRT", "booking_percentage": 40.0, "total_bookings": 40},
+        ],
+    },
+}
+
+
+@pytest.fixture
+def router():
+    return QuestionRouter(lambda endpoint: RESULTS.get(endpoint, {}))
+
+
+@pytest.mark.parametrize("question, route, expected", [
+    ("What was the revenue in July 2017?", "revenue_by_month", "$7,000.00"),
+    ("What was the revenue in Aug 2017?", "revenue_by_month", "$8,000.00"),
+    ("What was the revenue in Aug. 2017?", "revenue_by_month", "$8,000.00"),
+    ("What was the revenue in 2017?", "yearly_revenue", "$78,000.00"),
+    ("Which month in 2017 had the highest revenue?", "revenue_by_month", "December 2017"),
+    ("Which hotel type generated more revenue?", "revenue_by_hotel_type", "City Hotel"),
+    ("What percentage of revenue was lost to cancellations?", "canceled_revenue_share", "23.08%"),
+    ("What is the overall cancellation rate?", "overall_cancellation_rate", "37.00%"),
+    ("What percentage of City Hotel bookings are canceled?", "cancellation_by_hotel_type", "41.00%"),
+    ("What is the average lead time?", "average_lead_time", "104.0 days"),
+    ("Which hotel has the longest average lead time?", "lead_time_by_hotel_type", "City Hotel"),
+    ("What percentage of bookings are made less than a week in advance?", "percentage_last_minute_bookings", "18.50%"),
+    ("What percentage of bookings come from Portugal?", "booking_percentage_by_country", "40.00%"),
+])
+def test_routes_lookups(router, question, route, expected):
+    answer = router.route(question)
+    assert answer is not None and answer.route == route
+    assert expected in answer.answer
+
+
+@pytest.mark.parametrize("question", [
+    # Periods and days the monthly and yearly metrics don't have
+    "What was the revenue in Q3 2017?",
+    "What was the revenue in the first half of 2017?",
+    "What was the revenue in week 32 of 2017?",
+    "What was the revenue in 7/2017?",
+    "What was the revenue in 2017-07?",
+    "What was the revenue on 15 July 2017?",
+    "What was the revenue on July 15, 2017?",
+    "What was the daily revenue in 2017?",
+    # Averages, ratios and shares of a metric that is a total
+    "What was the revenue per booking in 2017?",
+    "What was the average revenue in 2017?",
+    "What percentage of revenue comes from City Hotel?",
+    "What share of revenue did the Resort Hotel earn?",
+    "What is the average lead time for canceled bookings?",
+    # Filters and periods the metrics can't express
+    "How many bookings were canceled at City Hotel?",
+    "What was the revenue in July and August 2017?",
+    "What was the revenue of non-Portugal bookings?",
+    "Why is the cancellation rate so high?",
+    "Which hotel type generated more revenue in 2016?",
+])
+def test_sends_unanswerable_questions_to_rag(router, question):
+    assert router.route(question) is None
+
+
+def test_sample_questions_are_routed_or_sent_to_rag():
+    # Every sample question either gets a routed answer or goes to RAG, never an error
+    path = os.path.join(os.path.dirname(__file__), "..", "samples", "samples_queries.json")
+    with open(path) as f:
+        samples = json.load(f)
+    router = QuestionRouter(lambda endpoint: RESULTS.get(endpoint, {}))
+    for sample in samples:
+        for item in sample.values():
+            router.route(item["question"])
@@ -0,0 +1,60 @@
+import pickle
+
+from result_cache import ResultCache
+
+
+def size_of(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test_entries_are_served_for_their_own_version_only():
+    cache = ResultCache()
+    cache.put("revenue", 3, [1])
+    assert cache.get("revenue", 3) == [1]
+    assert cache.get("revenue", 4) is None
+    assert cache.get("cancellations", 3) is None
+
+
+def test_newer_version_replaces_and_older_one_is_ignored():
+    cache = ResultCache()
+    cache.put("revenue", 3, [1])
+    cache.put("revenue", 4, [2])
+    assert cache.get("revenue", 3) is None
+    assert cache.get("revenue", 4) == [2]
+
+    # A computation that started before the data changed finishes late
+    cache.put("revenue", 3, [1])
+    assert cache.get("revenue", 4) == [2]
+    assert cache.current_bytes == size_of([2])
+
+
+def test_scope_change_drops_every_entry():
+    scope = ["hotel_data@1"]
+    cache = ResultCache(scope=lambda: scope[0])
+    cache.put("revenue", 3, [1])
+    scope[0] = "hotel_data@2"  # recreated database, versions start over
+    assert cache.get("revenue", 3) is None
+    assert cache.current_bytes == 0
+
+    cache.put("revenue", 3, [2])
+    assert cache.get("revenue", 3) == [2]
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes():
+    value = list(range(100))
+    cache = ResultCache(max_bytes=2 * size_of(value))
+    cache.put("a", 1, value)
+    cache.put("b", 1, value)
+    assert cache.get("a", 1) == value  # b is now the least recently used
+    cache.put("c", 1, value)
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == value
+    assert cache.get("c", 1) == value
+    assert cache.current_bytes == 2 * size_of(value)
+
+
+def test_values_larger_than_max_bytes_are_not_cached():
+    cache = ResultCache(max_bytes=10)
+    cache.put("revenue", 1, list(range(100)))
+    assert cache.get("revenue", 1) is None
+    assert cache.current_bytes == 0
@@ -0,0 +1,120 @@
+import os
+import threading
+from time import time
+from typing import Any, Callable
+
+from instrumentation import ASK_STAGE_SECONDS
+
+COLLECTION_NAME = "HotelAnalytics"
+OLLAMA_API_ENDPOINT = os.getenv("OLLAMA_API_ENDPOINT", "http://host.docker.internal:11434")
+GROUNDED_TASK = "Answer the question in a paragraph using the following context."
+
+
+def connect_local():
+    # weaviate (and its gRPC stack) is only imported once /ask needs it
+    import weaviate
+
+    return weaviate.connect_to_local()
+
+
+def connection_errors():
+    from weaviate.exceptions import WeaviateClosedClientError, WeaviateConnectionError, WeaviateGRPCUnavailableError
+
+    return (WeaviateClosedClientError, WeaviateConnectionError, WeaviateGRPCUnavailableError)
+
+
+class WeaviateStore:
+    """One Weaviate client for the lifetime of the app.
+
+    The client is health-checked at most every ``health_interval`` seconds and
+    reconnected when the check or a request fails on the connection. The
+    collection is created and filled once by ``bootstrap``; callers that
+    bootstrap and sync together hold ``bootstrap_lock`` around both.
+    """
+
+    def __init__(self, connect: Callable[[], Any] = connect_local, health_interval: float = 30.0):
+        self._connect = connect
+        self.health_interval = health_interval
+        self._client = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.bootstrap_lock = threading.RLock()
+        self.bootstrapped = False
+
+    def client(self):
+        with self._lock:
+            if self._client is not None and time() - self._checked_at > self.health_interval:
+                try:
+                    healthy = self._client.is_ready()
+                except Exception:
+                    healthy = False
+                if not healthy:
+                    print("⚠️ Weaviate health check failed, reconnecting")
+                    self._close()
+            if self._client is None:
+                with ASK_STAGE_SECONDS.labels("weaviate_connect").time():
+                    self._client = self._connect()
+            # A connection that is in use is as good as a health check
+            self._checked_at = time()
+            return self._client
+
+    def collection(self, name: str = COLLECTION_NAME):
+        return self.client().collections.get(name)
+
+    def run(self, operation: Callable[[Any], Any], collection: str = COLLECTION_NAME):
+        """Run ``operation(collection)``, reconnecting and retrying once if the connection dropped."""
+        try:
+            return operation(self.collection(collection))
+        except connection_errors() as e:
+            print(f"⚠️ Weaviate connection lost ({e}), reconnecting")
+            with self._lock:
+                self._close()
+            return operation(self.collection(collection))
+
+    def bootstrap(self):
+        """Create the collection if it does not exist yet; corpus_sync fills it."""
+        with self.bootstrap_lock:
+            self._bootstrap()
+
+    def _bootstrap(self):
+        from weaviate.classes.config import Configure, DataType, Property
+
+        client = self.client()
+        if not client.collections.exists(COLLECTION_NAME):
+            # Only the answer text is vectorized, the same input corpus_sync embeds
+            client.collections.create(
+                name=COLLECTION_NAME,
+                vectorizer_config=Configure.Vectorizer.text2vec_ollama(
+                    model="nomic-embed-text",
+                    api_endpoint=OLLAMA_API_ENDPOINT,
+                    vectorize_collection_name=False
+                ),
+                generative_config=Configure.Generative.ollama(
+                    model="llama3.2",
+                    api_endpoint=OLLAMA_API_ENDPOINT
+                ),
+                properties=[
+                    Property(name="section", data_type=DataType.TEXT, skip_vectorization=True),
+                    Property(name="index", data_type=DataType.INT),
+                    Property(name="text", data_type=DataType.TEXT, vectorize_property_name=False),
+                ]
+            )
+        self.bootstrapped = True
+
+    def warm_up(self):
+        # One grounded generation loads both the embedding and the generation model in Ollama
+        start = time()
+        self.run(lambda col: col.generate.near_text(query="total revenue", limit=1, grouped_task=GROUNDED_TASK))
+        print(f"✅ Weaviate and Ollama models warmed up in {time() - start:.1f}s")
+
+    def _close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def close(self):
+        with self._lock:
+            self._close()